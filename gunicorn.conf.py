@@ -4,4 +4,5 @@ port = int(os.getenv("PORT", 8080))
 bind = f"0.0.0.0:{port}"
 workers = 4
 worker_class = "uvicorn.workers.UvicornWorker"
+# No worker timeout: event loop stalls are reported by src/loop_monitor.py instead
 timeout = 0
\ No newline at end of file
@@ -0,0 +1,85 @@
+"""
+Compares the LLM engines turn by turn: wall-clock latency and number of
+OpenAI HTTP requests per turn (polling included).
+
+Usage (needs the same environment as the app, real OpenAI credentials):
+    python scripts/benchmark_llm_engines.py --engines assistants chat_completions --rounds 2
+"""
+import os
+import sys
+import time
+import uuid
+import asyncio
+import argparse
+import statistics
+
+import httpx
+from openai import AsyncOpenAI
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.assistant_logic import initialize_assistant  # noqa: E402
+
+CONVERSATION = [
+    "Hola, estoy organizando una boda para 120 invitados",
+    "¿Qué plan me recomiendas y qué incluye?",
+    "¿Y qué diferencia hay con el plan Profesional B2B?",
+    "¿Tenéis gamificación?",
+]
+
+
+class RequestCounter:
+    """httpx event hook that counts outgoing OpenAI requests."""
+    def __init__(self):
+        self.count = 0
+
+    async def __call__(self, request: httpx.Request):
+        self.count += 1
+
+
+def percentile(values, pct):
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+async def run_engine(assistant, engine_name: str, rounds: int):
+    counter = RequestCounter()
+    assistant.client = AsyncOpenAI(
+        api_key=assistant.settings.OPENAI_API_KEY,
+        http_client=httpx.AsyncClient(timeout=60.0, event_hooks={"request": [counter]}),
+    )
+    assistant.engine = assistant._build_engine(engine_name)
+
+    latencies, calls = [], []
+    for _ in range(rounds):
+        user_id = f"bench-{engine_name}-{uuid.uuid4().hex[:8]}"
+        for message in CONVERSATION:
+            before = counter.count
+            start = time.perf_counter()
+            await assistant.process_message(user_id, message)
+            latencies.append(time.perf_counter() - start)
+            calls.append(counter.count - before)
+    return latencies, calls
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--engines", nargs="+", default=["assistants", "chat_completions"])
+    parser.add_argument("--rounds", type=int, default=2, help="Conversations per engine")
+    args = parser.parse_args()
+
+    assistant = await initialize_assistant()
+
+    print(f"\n{'engine':<18}{'turns':>6}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'calls/turn':>12}")
+    for engine_name in args.engines:
+        latencies, calls = await run_engine(assistant, engine_name, args.rounds)
+        print(
+            f"{engine_name:<18}{len(latencies):>6}"
+            f"{statistics.mean(latencies):>9.2f}{percentile(latencies, 50):>9.2f}{percentile(latencies, 95):>9.2f}"
+            f"{statistics.mean(calls):>12.1f}"
+        )
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
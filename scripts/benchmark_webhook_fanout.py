@@ -0,0 +1,63 @@
+"""
+Benchmark of multi-message webhook payloads: wall time of handling the parsed
+messages one after another (previous behaviour of handle_webhook) against
+services/fanout.fan_out_by_sender. The assistant run and WhatsApp send are
+simulated with a fixed latency, so no credentials are needed.
+
+Usage:
+    python scripts/benchmark_webhook_fanout.py [--latency 2.0] [--concurrency 5]
+"""
+import os
+import sys
+import time
+import asyncio
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.fanout import fan_out_by_sender  # noqa: E402
+from src.services.webhook_parser import parse_webhook  # noqa: E402
+from benchmark_webhook_parsing import text_payload  # noqa: E402
+
+
+async def sequential(messages, handler, concurrency):
+    for message in messages:
+        await handler(message)
+
+
+def build_cases():
+    one_sender = parse_webhook(text_payload(1)).messages
+    five_senders = parse_webhook(text_payload(5)).messages
+    twenty_senders = parse_webhook(text_payload(20)).messages
+    return {
+        "1 message": one_sender,
+        "3 msgs, 1 sender": one_sender * 3,
+        "5 senders": five_senders,
+        "5 senders x 2 msgs": [m for m in five_senders for _ in range(2)],
+        "20 senders": twenty_senders,
+    }
+
+
+async def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--latency", type=float, default=2.0, help="Simulated seconds per message (run + send)")
+    parser.add_argument("--concurrency", type=int, default=5, help="Fan-out concurrency cap")
+    args = parser.parse_args()
+
+    async def handler(message):
+        await asyncio.sleep(args.latency)
+
+    strategies = {"sequential": sequential, "fan-out": fan_out_by_sender}
+    print(f"\nSimulated latency {args.latency}s per message, concurrency cap {args.concurrency}")
+    print(f"\n{'payload':<22}" + "".join(f"{name:>14}" for name in strategies) + f"{'speed-up':>10}")
+    for case_name, messages in build_cases().items():
+        timings = []
+        for strategy in strategies.values():
+            start = time.perf_counter()
+            await strategy(messages, handler, args.concurrency)
+            timings.append(time.perf_counter() - start)
+        print(f"{case_name:<22}" + "".join(f"{t:>13.2f}s" for t in timings) + f"{timings[0] / timings[1]:>9.1f}x")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
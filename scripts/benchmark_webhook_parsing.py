@@ -0,0 +1,97 @@
+"""
+Micro-benchmark of webhook body parsing: the previous path (decode to str,
+json.loads, walk nested dicts) against services/webhook_parser.parse_webhook,
+with and without status extraction. Install orjson or msgspec to benchmark
+the fast JSON backends.
+
+Usage:
+    python scripts/benchmark_webhook_parsing.py [--number 20000]
+"""
+import os
+import sys
+import json
+import timeit
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.services.webhook_parser import JSON_BACKEND, parse_webhook  # noqa: E402
+
+
+def text_payload(n_messages: int = 1) -> bytes:
+    messages = [{
+        "from": f"3460000{i:04d}", "id": f"wamid.HBgLMzQ2NDQ2OTE0NzgVAgASGBQzQUY{i:04d}",
+        "timestamp": "1712345678", "type": "text",
+        "text": {"body": "Hola, me interesa el Plan Profesional B2B para un festival de 2000 personas"},
+    } for i in range(n_messages)]
+    return json.dumps({"object": "whatsapp_business_account", "entry": [{"id": "1358661355330235", "changes": [{
+        "field": "messages",
+        "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": "34900123456", "phone_number_id": "630002156858819"},
+            "contacts": [{"profile": {"name": f"Usuario {i}"}, "wa_id": m["from"]} for i, m in enumerate(messages)],
+            "messages": messages,
+        },
+    }]}]}).encode()
+
+
+def status_payload() -> bytes:
+    return json.dumps({"object": "whatsapp_business_account", "entry": [{"id": "1358661355330235", "changes": [{
+        "field": "messages",
+        "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {"display_phone_number": "34900123456", "phone_number_id": "630002156858819"},
+            "statuses": [{
+                "id": "wamid.HBgLMzQ2NDQ2OTE0NzgVAgARGBI5QTNDQTVCM0Q0Q0Q2RTY3RTcA", "status": "delivered",
+                "timestamp": "1712345680", "recipient_id": "34644691478",
+                "conversation": {"id": "CONVERSATION_ID", "origin": {"type": "service"}},
+                "pricing": {"billable": True, "pricing_model": "CBP", "category": "service"},
+            }],
+        },
+    }]}]}).encode()
+
+
+def legacy_parse(payload_bytes: bytes):
+    """The parsing done by handle_webhook before the fast parser."""
+    data = json.loads(payload_bytes.decode("utf-8"))
+    found = []
+    if data.get("object") == "whatsapp_business_account":
+        for entry in data.get("entry", []):
+            for change in entry.get("changes", []):
+                value = change.get("value", {})
+                if "messages" in value:
+                    for message_data in value.get("messages", []):
+                        if message_data.get("type") == "text":
+                            found.append((message_data.get("from"), message_data.get("text", {}).get("body"),
+                                          message_data.get("timestamp"), message_data.get("id")))
+                elif "statuses" in value:
+                    for status_data in value.get("statuses", []):
+                        found.append(status_data)
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=20000, help="Iterations per case")
+    args = parser.parse_args()
+
+    cases = {
+        "1 text message": text_payload(1),
+        "5 text messages": text_payload(5),
+        "status only": status_payload(),
+    }
+    candidates = {
+        "legacy json walk": legacy_parse,
+        f"parse_webhook ({JSON_BACKEND})": lambda body: parse_webhook(body, include_statuses=True),
+        "parse_webhook, skip statuses": lambda body: parse_webhook(body, include_statuses=False),
+    }
+
+    print(f"\n{'case':<18}{'parser':<32}{'us/op':>10}")
+    for case_name, body in cases.items():
+        for parser_name, func in candidates.items():
+            seconds = timeit.timeit(lambda: func(body), number=args.number)
+            print(f"{case_name:<18}{parser_name:<32}{seconds / args.number * 1e6:>10.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Micro-benchmark of webhook signature verification (security.verify_webhook_signature):
+per-request cost of the X-Hub-Signature-256 check for typical body sizes, next to
+the cost of parsing the same body, and the cost of rejecting a forged call.
+
+Reads the regular settings (.env); WHATSAPP_APP_SECRET defaults to a dummy value.
+
+Usage:
+    python scripts/benchmark_webhook_signature.py [--number 50000]
+"""
+import os
+import sys
+import hmac
+import timeit
+import hashlib
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("WHATSAPP_APP_SECRET", "benchmark-app-secret")
+
+from src.security import verify_webhook_signature  # noqa: E402
+from src.services.webhook_parser import parse_webhook  # noqa: E402
+from benchmark_webhook_parsing import status_payload, text_payload  # noqa: E402
+
+
+def sign(body: bytes) -> str:
+    return "sha256=" + hmac.new(os.environ["WHATSAPP_APP_SECRET"].encode(), body, hashlib.sha256).hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--number", type=int, default=50000, help="Iterations per case")
+    args = parser.parse_args()
+
+    cases = {
+        "status only": status_payload(),
+        "1 text message": text_payload(1),
+        "20 text messages": text_payload(20),
+    }
+
+    print(f"\n{'case':<18}{'bytes':>8}{'verify us':>12}{'forged us':>12}{'parse us':>12}{'overhead':>10}")
+    for case_name, body in cases.items():
+        signature = sign(body)
+        forged = "sha256=" + "0" * 64
+        assert verify_webhook_signature(body, signature)
+        verify = timeit.timeit(lambda: verify_webhook_signature(body, signature), number=args.number)
+        reject = timeit.timeit(lambda: verify_webhook_signature(body, forged), number=args.number)
+        parse = timeit.timeit(lambda: parse_webhook(body), number=args.number)
+        print(f"{case_name:<18}{len(body):>8}{verify / args.number * 1e6:>12.2f}"
+              f"{reject / args.number * 1e6:>12.2f}{parse / args.number * 1e6:>12.2f}"
+              f"{verify / parse:>9.0%}")
+
+
+if __name__ == "__main__":
+    main()
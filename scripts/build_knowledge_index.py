@@ -0,0 +1,65 @@
+"""
+Builds the knowledge vector index offline: chunks the knowledge files, embeds the
+chunks and writes src/knowledge_index/knowledge.npy (+ knowledge.meta.json). The
+app memory-maps the matrix at startup as long as the knowledge files are unchanged.
+Prints the query latency of the vector index next to BM25.
+
+Usage:
+    python scripts/build_knowledge_index.py [--embedder hashing|openai:text-embedding-3-small]
+                                            [--files course_info.json,...] [--out src/knowledge_index]
+
+Without --files the default knowledge files of the app are indexed.
+"""
+import os
+import sys
+import time
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.knowledge import (  # noqa: E402
+    DEFAULT_INDEX_DIR, DEFAULT_KNOWLEDGE_FILES, HashingEmbedder, KnowledgeBase, VectorIndex, get_embedder,
+    knowledge_fingerprint, resolve_knowledge_files,
+)
+
+QUERIES = [
+    "¿Qué incluye el plan para bodas?",
+    "¿Tenéis CRM integrado?",
+    "Organizo un festival de 5000 personas",
+    "¿Cómo os puedo contactar?",
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--embedder", default="hashing", help="'hashing' (local) or 'openai:<model>'")
+    parser.add_argument("--dim", type=int, default=1024, help="Dimension of the hashing embedder")
+    parser.add_argument("--files", default="", help="Comma-separated knowledge files (relative to src/)")
+    parser.add_argument("--out", default=DEFAULT_INDEX_DIR, help="Output directory")
+    args = parser.parse_args()
+
+    file_paths = resolve_knowledge_files(args.files) or DEFAULT_KNOWLEDGE_FILES
+    embedder = HashingEmbedder(args.dim) if args.embedder == "hashing" else get_embedder(args.embedder)
+    kb = KnowledgeBase(file_paths=file_paths, vector_search=False)
+
+    start = time.perf_counter()
+    index = VectorIndex.build(kb.chunks, embedder)
+    index.save(args.out, knowledge_fingerprint(file_paths))
+    print(f"Indexed {len(kb.chunks)} chunks with {embedder.name} (dim {index.matrix.shape[1]}) "
+          f"in {time.perf_counter() - start:.2f}s -> {args.out}")
+
+    loaded = VectorIndex.load(args.out, knowledge_fingerprint(file_paths))
+    for query in QUERIES:
+        start = time.perf_counter()
+        hits = loaded.search(query, top_k=3)
+        vector_ms = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        kb.bm25_search(query, top_k=3)
+        bm25_ms = (time.perf_counter() - start) * 1000
+        print(f"\n{query}  (vector {vector_ms:.2f} ms, BM25 {bm25_ms:.2f} ms)")
+        for score, chunk in hits:
+            print(f"  {score:.3f}  {chunk.path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from .config import get_settings
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.admission")
+
+
+class AdmissionRejected(Exception):
+    """Raised by `AdmissionController.admit` when a request is shed."""
+
+    def __init__(self, reason: str):
+        super().__init__(reason)
+        self.reason = reason  # rate_limited / queue_full / queue_timeout
+
+
+class TokenBucket:
+    """Classic token bucket: `capacity` tokens, refilled at `rate` tokens per second."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def try_acquire(self, tokens: float = 1.0) -> bool:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return True
+        return False
+
+
+class AdmissionController:
+    """
+    Admission control in front of the assistant runs of this worker.
+
+    1. Per sender token bucket (`rate_per_minute`, `burst`): a looping or abusive
+       sender is rejected without touching OpenAI.
+    2. Global cap of `max_concurrent` runs in flight.
+    3. Bounded queue in front of the cap: at most `max_waiting` requests wait,
+       each for at most `max_queue_wait` seconds. A request that cannot start in
+       time is rejected instead of adding to everybody's latency.
+    """
+
+    def __init__(self, rate_per_minute: float = 6, burst: int = 3, max_concurrent: int = 20,
+                 max_queue_wait: float = 10.0, max_waiting: Optional[int] = None, max_senders: int = 10000,
+                 busy_notice_interval: float = 60.0):
+        self.rate_per_minute = rate_per_minute
+        self.burst = burst
+        self.max_concurrent = max_concurrent
+        self.max_queue_wait = max_queue_wait
+        self.max_waiting = max_waiting if max_waiting is not None else max_concurrent * 2
+        self.max_senders = max_senders
+        self.busy_notice_interval = busy_notice_interval
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()  # LRU, bounded
+        self._busy_notices: "OrderedDict[str, float]" = OrderedDict()  # sender -> last notice, bounded
+        self._in_flight = 0
+        self._waiting = 0
+
+    def _bucket(self, sender_id: str) -> TokenBucket:
+        bucket = self._buckets.get(sender_id)
+        if bucket is None:
+            bucket = self._buckets[sender_id] = TokenBucket(self.rate_per_minute / 60, self.burst)
+            if len(self._buckets) > self.max_senders:
+                self._buckets.popitem(last=False)
+        else:
+            self._buckets.move_to_end(sender_id)
+        return bucket
+
+    def _reject(self, sender_id: str, reason: str):
+        metrics.inc("admission_rejected", reason=reason)
+        logger.warning("Shedding request from %s: %s (in flight: %d, waiting: %d)",
+                       sender_id, reason, self._in_flight, self._waiting)
+        raise AdmissionRejected(reason)
+
+    @asynccontextmanager
+    async def admit(self, sender_id: str) -> AsyncIterator[None]:
+        """
+        Holds one run slot for the duration of the `async with` block.
+
+        Raises:
+            AdmissionRejected: when the sender is over its rate or no slot frees up in time.
+        """
+        if not self._bucket(sender_id).try_acquire():
+            self._reject(sender_id, "rate_limited")
+        if self._in_flight + self._waiting >= self.max_concurrent + self.max_waiting:
+            self._reject(sender_id, "queue_full")
+
+        queued_at = time.perf_counter()
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.max_queue_wait)
+        except asyncio.TimeoutError:
+            self._reject(sender_id, "queue_timeout")
+        finally:
+            self._waiting -= 1
+        metrics.observe("admission_queue_wait_ms", (time.perf_counter() - queued_at) * 1000)
+        metrics.inc("admission_admitted")
+
+        self._in_flight += 1
+        try:
+            yield
+        finally:
+            self._in_flight -= 1
+            self._semaphore.release()
+
+    def should_send_busy_notice(self, sender_id: str) -> bool:
+        """True at most once per `busy_notice_interval` per sender, so shed senders are not spammed."""
+        now = time.monotonic()
+        last = self._busy_notices.get(sender_id)
+        if last is not None and now - last < self.busy_notice_interval:
+            return False
+        self._busy_notices[sender_id] = now
+        self._busy_notices.move_to_end(sender_id)
+        if len(self._busy_notices) > self.max_senders:
+            self._busy_notices.popitem(last=False)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self._in_flight,
+            "waiting": self._waiting,
+            "max_concurrent": self.max_concurrent,
+            "max_waiting": self.max_waiting,
+            "tracked_senders": len(self._buckets),
+        }
+
+
+settings = get_settings()
+admission = AdmissionController(
+    rate_per_minute=settings.ADMISSION_USER_RATE_PER_MINUTE,
+    burst=settings.ADMISSION_USER_BURST,
+    max_concurrent=settings.ADMISSION_MAX_CONCURRENT_RUNS,
+    max_queue_wait=settings.ADMISSION_MAX_QUEUE_WAIT,
+)
+metrics.register_collector("admission", admission.stats)
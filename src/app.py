@@ -7,17 +7,37 @@ import os
 
 # Import settings, db functions, assistant logic
 from .config import settings
+from .logging_setup import configure_logging, shutdown_logging
+from .loop_monitor import LoopLagMonitor
+from .services.status_tracker import status_pipeline
+from .services.usage_ledger import usage_ledger
+from .run_reaper import RunReaper
+from .snapshot import snapshots
+from .crm.contacts import ensure_contact_indexes
+from .crm.live import contact_broker
+from .services.campaigns import campaign_engine
+from .hot_reload import hot_reloader
+from .intents import intent_router
+from .interactive import answer_table
+from .lead_extraction import lead_extractor
+from .services.whatsapp_service import WhatsAppService
 from .db import get_db, close_db
-from .assistant_logic import CourseAssistant, initialize_assistant
+from .assistant_logic import CourseAssistant, FestivalConfig, initialize_assistant
 
 # Import the routers
-from .routers import crm, whatsapp
+from .routers import crm, whatsapp, ops, campaigns
 
 # --- Setup logging ---
 # Get the root log level from settings (e.g., DEBUG, INFO, WARNING)
 log_level = getattr(logging, settings.LOG_LEVEL.upper(), logging.INFO)
-# Configure the root logger
-logging.basicConfig(level=log_level, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Configure the root logger: records go through a queue to a background thread that
+# formats (JSON by default), redacts and writes them, so log I/O never blocks the event loop
+configure_logging(
+    level=log_level,
+    log_format=settings.LOG_FORMAT,
+    sample_every=settings.LOG_SAMPLE_EVERY,
+    queue_size=settings.LOG_QUEUE_SIZE,
+)
 
 # --- Set higher levels for noisy libraries ---
 # Keep httpx, httpcore, openai at WARNING unless you need their detailed logs
@@ -38,6 +58,11 @@ logger = logging.getLogger("whatsapp_bot") # Or "eventek_assistant" or your main
 # --- Global Variables ---
 # Store assistant instance globally or manage via dependency injection
 assistant_instance: CourseAssistant | None = None
+run_reaper: RunReaper | None = None
+loop_monitor = LoopLagMonitor(
+    interval=settings.LOOP_MONITOR_INTERVAL,
+    slow_threshold=settings.LOOP_SLOW_THRESHOLD_MS / 1000,
+)
 
 # --- FastAPI App Setup ---
 app = FastAPI(
@@ -71,13 +96,23 @@ async def get_assistant() -> CourseAssistant:
 # --- Event Handlers (Startup/Shutdown) ---
 @app.on_event("startup")
 async def startup_event():
-    global assistant_instance
+    global assistant_instance, run_reaper
+    if settings.LOOP_MONITOR_ENABLED:
+        loop_monitor.start()
+
     logger.info("Application startup: Initializing database connection...")
     try:
-        await get_db() # Initialize DB connection pool
+        db = await get_db() # Initialize DB connection pool
         logger.info("Database connection established.")
     except Exception as e:
-        logger.critical(f"CRITICAL: Failed to connect to database during startup: {e}", exc_info=True)
+        logger.critical("CRITICAL: Failed to connect to database during startup: %s", e, exc_info=True)
+    else:
+        try:
+            await ensure_contact_indexes(db)
+        except Exception as e:
+            logger.error("Failed to create the contacts indexes: %s", e)
+    await status_pipeline.start()
+    usage_ledger.start()
 
     logger.info("Initializing OpenAI Assistant...")
     try:
@@ -89,17 +124,55 @@ async def startup_event():
         # Provide the instance to the dependency system
         app.dependency_overrides[CourseAssistant] = lambda: assistant_instance
         logger.info("Assistant initialized successfully")
+        if settings.SNAPSHOT_ENABLED:
+            manager = assistant_instance.conversation_manager
+            snapshots.register("conversations", manager.export_state, manager.import_state)
+            snapshots.register("recent_run_threads", assistant_instance.export_recent_run_threads,
+                               assistant_instance.import_recent_run_threads)
+        knowledge_files = assistant_instance.knowledge_base.file_paths
+        hot_reloader.register("knowledge_base", knowledge_files, assistant_instance.reload_knowledge_base)
+        hot_reloader.register("instructions", [FestivalConfig.instructions_file()], assistant_instance.reload_instructions)
+        if assistant_instance.engine is None:
+            hot_reloader.register("assistant_files", knowledge_files, assistant_instance.push_knowledge_files)
     except Exception as e:
-        logger.critical(f"CRITICAL: Failed to initialize OpenAI assistant during startup: {e}", exc_info=True)
+        logger.critical("CRITICAL: Failed to initialize OpenAI assistant during startup: %s", e, exc_info=True)
+    if settings.SNAPSHOT_ENABLED:
+        await snapshots.load() # Warm start from the snapshots of previous workers
+
+    # After the warm start, so the first sweep covers the restored threads
+    if assistant_instance is not None and assistant_instance.engine is None and settings.RUN_REAPER_INTERVAL > 0:
+        run_reaper = RunReaper(assistant_instance, interval=settings.RUN_REAPER_INTERVAL,
+                               max_run_age=settings.RUN_TIMEOUT_SECONDS)
+        run_reaper.start()
+    campaign_engine.start_background() # Resumes campaigns interrupted on other workers
+    hot_reloader.register("intents", intent_router.knowledge_files, intent_router.load)
+    hot_reloader.register("answer_table", [answer_table.file_path], answer_table.load)
+    hot_reloader.register("lead_extractor", [lead_extractor.knowledge_file], lead_extractor.load)
+    hot_reloader.start() # Picks up edited knowledge/instruction files without a restart
 
 @app.on_event("shutdown")
 async def shutdown_event():
+    if settings.LOOP_MONITOR_ENABLED:
+        await loop_monitor.stop()
+    if run_reaper is not None:
+        await run_reaper.stop()
+    await hot_reloader.stop()
+    await contact_broker.stop()
+    await campaign_engine.stop() # Checkpoint and release running campaigns
+    if settings.SNAPSHOT_ENABLED:
+        await snapshots.save() # Warm start for the next worker
+    await status_pipeline.stop() # Flush buffered status events before the connection closes
+    await usage_ledger.stop() # Flush pending token/cost counters
+    await WhatsAppService.close_http_client()
     logger.info("Application shutdown: Closing database connection...")
     await close_db()
     logger.info("Database connection closed.")
+    shutdown_logging()
 
 # --- Include Routers ---
 app.include_router(crm.router)
 app.include_router(whatsapp.router)
+app.include_router(ops.router)
+app.include_router(campaigns.router)
 
 logger.info("FastAPI application configured.")
@@ -1,22 +1,38 @@
 # -*- coding: utf-8 -*-
 
 import os
+import re
 import json
+import hashlib
 import asyncio
 import logging
 import traceback
 import time
-from datetime import datetime, date
+import weakref
+from collections import OrderedDict
+from datetime import datetime
 from threading import Lock
-from typing import Dict, Any, Optional, List, Tuple
+from typing import AsyncIterator, Dict, Any, Optional, List, Tuple
 
-from openai import AsyncOpenAI, NotFoundError
+from openai import AsyncOpenAI, BadRequestError, NotFoundError
 import pytz
 from dotenv import load_dotenv
 
+from .config import get_settings
+from .context_budget import ContextPolicy, context_budget
 from .conversation_manager import ConversationManager
-from .db import get_db
+from .crm.contacts import phone_key, upsert_contact_by_phone
+from .engines.base import LLMEngine
+from .engines.chat_completions import LOCAL_KNOWLEDGE_NOTE, ChatCompletionsEngine, current_date_note
+from .hot_reload import assistant_sync
+from .knowledge import DEFAULT_KNOWLEDGE_FILES, KnowledgeBase, knowledge_fingerprint, resolve_knowledge_files
+from .lead_extraction import lead_instructions, to_contact_fields
+from .metrics import metrics
+from .model_router import ModelChoice, conversation_stage, model_router
+from .tools import ToolRegistry
+from .profiling import profiled
 from .routers.crm import ContactSchema
+from .services.usage_ledger import NORMAL, usage_ledger
 from pydantic import ValidationError
 
 # Basic configuration
@@ -49,6 +65,11 @@ add_contact_tool = {
 }
 # --- End Tool Definition ---
 
+# Run states in which a run keeps its thread locked (no new messages or runs allowed)
+ACTIVE_RUN_STATUSES = ("queued", "in_progress", "requires_action", "cancelling")
+# 400 errors of messages.create / runs.create on a thread that has an active run
+THREAD_LOCKED_RE = re.compile(r"Can't add messages to \S+ while a run \S+ is active|already has an active run")
+
 
 class FestivalConfig:
     """Configuration for Eventek Assistant"""
@@ -57,13 +78,106 @@ class FestivalConfig:
     OPENAI_API_KEY = os.getenv("OPENAI_API_KEY")
     ASSISTANT_ID_ENV_VAR = "EVENTEK_ASSISTANT_ID"
     ASSISTANT_ID = os.getenv(ASSISTANT_ID_ENV_VAR)
+    # Part of the instructions digest: bump when build_instructions renders the template differently
+    INSTRUCTIONS_FORMAT = 2
     logger = logging.getLogger('eventek_assistant.config')
 
+    @classmethod
+    def instructions_file(cls) -> str:
+        """Path of the instructions template (ASSISTANT_INSTRUCTIONS_FILE, relative to src/ unless absolute)."""
+        return os.path.join(os.path.dirname(os.path.abspath(__file__)), get_settings().ASSISTANT_INSTRUCTIONS_FILE)
+
+    @classmethod
+    def build_instructions(cls) -> str:
+        """
+        Returns the system instructions shared by every LLM engine. Lines with `{today}`
+        are left out: the current date is added to each run/turn (`current_date_note`),
+        so instructions pushed once to the assistant never carry a stale date.
+        """
+        with open(cls.instructions_file(), "r", encoding="utf-8") as f:
+            template = f.read()
+        return "".join(line for line in template.splitlines(keepends=True) if "{today}" not in line)
+
+    @classmethod
+    def assistant_tools(cls) -> List[Dict[str, Any]]:
+        return [{"type": "file_search"}, add_contact_tool]
+
+    @classmethod
+    def instructions_digest(cls) -> str:
+        """Hash of the instructions template and tool definitions."""
+        digest = hashlib.sha256(f"format {cls.INSTRUCTIONS_FORMAT}\n".encode("utf-8"))
+        with open(cls.instructions_file(), "rb") as f:
+            digest.update(f.read())
+        digest.update(json.dumps(cls.assistant_tools(), sort_keys=True).encode("utf-8"))
+        return digest.hexdigest()
+
+    @classmethod
+    async def push_instructions(cls, client: AsyncOpenAI, assistant_id: str) -> bool:
+        """
+        Updates the assistant's instructions and tools, unless this version was already
+        pushed (by this or another worker). Returns True when the assistant was updated.
+        """
+        digest = cls.instructions_digest()
+        claimed, previous = await assistant_sync.claim(assistant_id, "instructions", digest)
+        if not claimed:
+            cls.logger.info("Assistant %s already has instructions %s; not updating.", assistant_id, digest[:12])
+            return False
+        try:
+            await client.beta.assistants.update(
+                assistant_id=assistant_id,
+                instructions=cls.build_instructions(),
+                tools=cls.assistant_tools(),
+            )
+        except Exception:
+            await assistant_sync.release(assistant_id, "instructions", digest, previous)
+            raise
+        cls.logger.info("Assistant %s updated with instructions %s.", assistant_id, digest[:12])
+        return True
+
+    @classmethod
+    async def push_knowledge_files(cls, client: AsyncOpenAI, assistant_id: str, file_paths: List[str]) -> bool:
+        """
+        Uploads the knowledge files to a new vector store used by the assistant's `file_search`,
+        unless these contents were already pushed. Returns True when the assistant was updated.
+        """
+        file_paths = [p for p in file_paths if os.path.exists(p)]
+        if not file_paths:
+            cls.logger.error("No knowledge file found; the assistant's file_search keeps its current files.")
+            return False
+        digest = knowledge_fingerprint(file_paths)
+        claimed, previous = await assistant_sync.claim(assistant_id, "files", digest)
+        if not claimed:
+            cls.logger.info("Assistant %s already has knowledge files %s; not uploading.", assistant_id, digest[:12])
+            return False
+        try:
+            file_ids = []
+            for file_path in file_paths:
+                cls.logger.info("Uploading knowledge file: %s", file_path)
+                with open(file_path, "rb") as f:
+                    uploaded_file = await client.files.create(file=f, purpose='assistants')
+                file_ids.append(uploaded_file.id)
+
+            vector_store_name = f"Eventek Knowledge Base - {datetime.now(cls.SPAIN_TZ).strftime('%Y%m%d%H%M%S')}"
+            vector_store = await client.vector_stores.create(name=vector_store_name, file_ids=file_ids)
+            cls.logger.info("Vector store created with ID: %s and files %s.", vector_store.id, file_ids)
+
+            await client.beta.assistants.update(
+                assistant_id=assistant_id,
+                tool_resources={"file_search": {"vector_store_ids": [vector_store.id]}}
+            )
+        except Exception:
+            await assistant_sync.release(assistant_id, "files", digest, previous)
+            raise
+        cls.logger.info("Assistant %s updated with vector store %s.", assistant_id, vector_store.id)
+        return True
+
     @classmethod
     async def get_or_create_assistant(cls, client: AsyncOpenAI) -> str:
         """
         Gets the assistant ID from environment variable or creates/updates the assistant.
-        Includes file/vector store setup and tool configuration.
+        Includes file/vector store setup and tool configuration. An existing assistant is
+        only updated when its instructions, tools or knowledge files changed since the
+        last push (recorded in Mongo), so restarting workers make no update calls.
         All OpenAI client calls are asynchronous.
         """
         assistant_id_to_use = None
@@ -73,17 +187,17 @@ class FestivalConfig:
         env_assistant_id = os.getenv(cls.ASSISTANT_ID_ENV_VAR)
 
         if env_assistant_id and env_assistant_id.lower() != "force_new":
-            cls.logger.info(f"Attempting to retrieve assistant using ID from env: {env_assistant_id}")
+            cls.logger.info("Attempting to retrieve assistant using ID from env: %s", env_assistant_id)
             try:
                 assistant = await client.beta.assistants.retrieve(env_assistant_id)
                 assistant_id_to_use = assistant.id
-                cls.logger.info(f"Successfully retrieved existing assistant with ID: {assistant_id_to_use}")
+                cls.logger.info("Successfully retrieved existing assistant with ID: %s", assistant_id_to_use)
                 update_existing = True
             except NotFoundError:
-                cls.logger.warning(f"Assistant ID {env_assistant_id} from env not found. Will create a new one.")
+                cls.logger.warning("Assistant ID %s from env not found. Will create a new one.", env_assistant_id)
                 create_new = True
             except Exception as e:
-                cls.logger.error(f"Error retrieving assistant {env_assistant_id}: {e}. Will create a new one.", exc_info=True)
+                cls.logger.error("Error retrieving assistant %s: %s. Will create a new one.", env_assistant_id, e, exc_info=True)
                 create_new = True
         else:
             if env_assistant_id and env_assistant_id.lower() == "force_new":
@@ -92,95 +206,35 @@ class FestivalConfig:
                 cls.logger.info("No valid Assistant ID in env. Creating a new assistant.")
             create_new = True
 
-        instructions_content = f"""Eres el asistente virtual de Eventek, experto en nuestros servicios para eventos. Tu DOBLE OBJETIVO es:
-        1.  **INFORMAR:** Proporcionar información precisa y útil sobre Eventek, nuestros planes (Básico B2C, Profesional B2B, Expert), servicios y beneficios, utilizando SIEMPRE la herramienta `file_search` para consultar los archivos adjuntos.
-        2.  **CAPTURAR LEADS:** Identificar a usuarios interesados y recopilar proactivamente su información de contacto (nombre, email, teléfono) y detalles del evento (tipo, fecha estimada, asistentes, plan de interés) para guardarlos en nuestro CRM usando la herramienta `add_crm_contact`.
-
-        La fecha actual es {cls.TODAY.strftime('%Y-%m-%d')}.
-
-        ### CÓMO INTERACTUAR:
-        1.  **SALUDO Y DESCUBRIMIENTO:** Saluda amablemente. Pregunta si el usuario está organizando un evento y qué tipo de evento es. Muestra interés genuino.
-        2.  **INFORMACIÓN (Usando `file_search`):** A medida que el usuario pregunte o muestres los planes, usa `file_search` para obtener y presentar la información relevante de los archivos. Sé claro sobre qué plan podría ajustarse mejor según las necesidades que descubras.
-        3.  **RECOPILACIÓN DE DATOS (¡IMPORTANTE!):**
-            *   Mientras conversas sobre los planes y servicios, busca oportunidades para preguntar por los detalles del lead. Hazlo de forma natural.
-            *   Ejemplos: "Para poder darte detalles más ajustados, ¿podrías decirme tu nombre y quizás un email o teléfono donde podamos enviarte una propuesta?"
-            *   Intenta obtener al menos el **nombre** y preferiblemente **email o teléfono**.
-        4.  **GUARDAR EN CRM (Usando `add_crm_contact`):**
-            *   **UNA VEZ** que tengas al menos el **nombre**, utiliza la herramienta `add_crm_contact`.
-            *   Confirma con el usuario antes si no estás seguro.
-            *   **NO uses `add_crm_contact` si no tienes al menos el nombre.**
-        5.  **CIERRE:** Resume lo discutido. Si guardaste el contacto, informa al usuario.
-
-        ### HERRAMIENTAS DISPONIBLES:
-        - **`file_search`**: OBLIGATORIO para buscar información sobre Eventek. NO inventes información.
-        - **`add_crm_contact`**: Úsala SÓLO DESPUÉS de haber recopilado información del lead (mínimo el nombre).
-
-        ### RESTRICCIONES Y ESTILO:
-        - Profesional pero cercano. Responde en el idioma del usuario.
-        - NO inventes información. Si no encuentras algo, dilo.
-        - NO almacenes información personal fuera del uso de `add_crm_contact`.
-        ¡Tu objetivo es ser útil y ayudar a Eventek a conseguir nuevos clientes potenciales!
-        """
-
-        tools_list = [
-            {"type": "file_search"},
-            add_contact_tool
-        ]
+        knowledge_files = resolve_knowledge_files(get_settings().KNOWLEDGE_FILES) or DEFAULT_KNOWLEDGE_FILES
 
         if create_new:
             cls.logger.info("Creating new assistant 'Asistente Eventek'...")
             assistant = await client.beta.assistants.create(
                 name="Asistente Eventek",
-                instructions=instructions_content,
+                instructions=cls.build_instructions(),
                 model="gpt-4-turbo",
-                tools=tools_list
+                tools=cls.assistant_tools()
             )
             assistant_id_to_use = assistant.id
-            cls.logger.info(f"Created new assistant with ID: {assistant_id_to_use}")
+            cls.logger.info("Created new assistant with ID: %s", assistant_id_to_use)
+            await assistant_sync.claim(assistant_id_to_use, "instructions", cls.instructions_digest())
 
             try:
-                base_dir = os.path.dirname(os.path.abspath(__file__))
-                file_path = os.path.join(base_dir, "course_info.json")
-
-                if not os.path.exists(file_path):
-                    cls.logger.error(f"Knowledge file 'course_info.json' not found at: {file_path}")
-                else:
-                    cls.logger.info(f"Uploading knowledge file: {file_path}")
-                    with open(file_path, "rb") as f:
-                        uploaded_file = await client.files.create(file=f, purpose='assistants')
-                    cls.logger.info(f"File uploaded with ID: {uploaded_file.id}")
-
-                    vector_store_name = f"Eventek Knowledge Base - {cls.TODAY.strftime('%Y%m%d%H%M%S')}"
-                    cls.logger.info(f"Creating vector store: {vector_store_name}")
-                    vector_store = await client.vector_stores.create(name=vector_store_name, file_ids=[uploaded_file.id])
-                    cls.logger.info(f"Vector store created with ID: {vector_store.id} and file {uploaded_file.id} added.")
-
-                    cls.logger.info(f"Associating vector store {vector_store.id} with assistant {assistant_id_to_use}")
-                    await client.beta.assistants.update(
-                        assistant_id=assistant_id_to_use,
-                        tool_resources={"file_search": {"vector_store_ids": [vector_store.id]}}
-                    )
-                    cls.logger.info(f"Assistant {assistant_id_to_use} updated with vector store.")
-            except FileNotFoundError as fnf_error:
-                cls.logger.error(f"Knowledge file error: {fnf_error}. Assistant may lack some file search capabilities.")
+                await cls.push_knowledge_files(client, assistant_id_to_use, knowledge_files)
             except Exception as file_error:
-                cls.logger.error(f"Error during file/vector store setup for new assistant {assistant_id_to_use}: {file_error}", exc_info=True)
+                cls.logger.error("Error during file/vector store setup for new assistant %s: %s", assistant_id_to_use, file_error, exc_info=True)
 
-            cls.logger.warning(f"IMPORTANT: A new assistant was created (ID: {assistant_id_to_use}). "
-                               f"Update '{cls.ASSISTANT_ID_ENV_VAR}' to this ID to reuse it.")
+            cls.logger.warning("IMPORTANT: A new assistant was created (ID: %s). Update '%s' to this ID to reuse it.",
+                               assistant_id_to_use, cls.ASSISTANT_ID_ENV_VAR)
 
         elif update_existing and assistant_id_to_use:
-            cls.logger.info(f"Ensuring existing assistant {assistant_id_to_use} has latest instructions and tools...")
-            current_assistant = await client.beta.assistants.retrieve(assistant_id_to_use)
-            current_tool_resources = current_assistant.tool_resources or {}
-
-            await client.beta.assistants.update(
-                assistant_id=assistant_id_to_use,
-                instructions=instructions_content,
-                tools=tools_list,
-                tool_resources=current_tool_resources
-            )
-            cls.logger.info(f"Assistant {assistant_id_to_use} updated with latest settings.")
+            cls.logger.info("Ensuring existing assistant %s has latest instructions and tools...", assistant_id_to_use)
+            await cls.push_instructions(client, assistant_id_to_use)
+            try:
+                await cls.push_knowledge_files(client, assistant_id_to_use, knowledge_files)
+            except Exception as file_error:
+                cls.logger.error("Could not update the knowledge files of assistant %s: %s", assistant_id_to_use, file_error, exc_info=True)
 
         if not assistant_id_to_use:
             cls.logger.critical("Failed to obtain or create an assistant ID.")
@@ -215,36 +269,115 @@ class CourseAssistant:
                 self.client = AsyncOpenAI(api_key=self.settings.OPENAI_API_KEY)
                 self.logger.info("AsyncOpenAI client initialized.")
             except Exception as e:
-                self.logger.error(f"Failed to initialize AsyncOpenAI client: {e}", exc_info=True)
+                self.logger.error("Failed to initialize AsyncOpenAI client: %s", e, exc_info=True)
                 raise
 
+            self.engine_name = get_settings().LLM_ENGINE
             self.assistant_id = self.settings.ASSISTANT_ID
-            if not self.assistant_id:
-                self.logger.critical("EVENTEK_ASSISTANT_ID is missing after setup!")
-                raise ValueError("EVENTEK_ASSISTANT_ID must be set by setup process.")
-            self.logger.info(f"Using Assistant ID: {self.assistant_id}")
+            if self.engine_name == "assistants":
+                if not self.assistant_id:
+                    self.logger.critical("EVENTEK_ASSISTANT_ID is missing after setup!")
+                    raise ValueError("EVENTEK_ASSISTANT_ID must be set by setup process.")
+                self.logger.info("Using Assistant ID: %s", self.assistant_id)
 
             self.conversation_manager = ConversationManager()
             self.logger.info("ConversationManager initialized.")
-            self.initialized = True
-            self.logger.info(f"CourseAssistant __init__ completed for ID: {self.assistant_id}")
 
+            self.run_timeout = get_settings().RUN_TIMEOUT_SECONDS
+            # One turn at a time per user: a thread accepts a single active run
+            self._user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+            # run_id -> thread_id of the runs this worker is driving right now
+            self.active_runs: Dict[str, str] = {}
+            # thread_id -> time.time() of the last run started here, checked later by the run reaper
+            self._recent_run_threads: "OrderedDict[str, float]" = OrderedDict()
+            self._cleanup_tasks: set = set()
+
+            app_settings = get_settings()
+            self.knowledge_base = KnowledgeBase(
+                file_paths=resolve_knowledge_files(app_settings.KNOWLEDGE_FILES),
+                index_dir=app_settings.KNOWLEDGE_INDEX_DIR or None,
+            )
+            # Assistants API runs get the retrieved passages in their instructions instead of running file_search
+            self.local_retrieval = app_settings.KNOWLEDGE_LOCAL_RETRIEVAL
+
+            # Picks the model of each turn (MODEL_CASCADE_*) and tracks latency and cost per model
+            self.model_router = model_router
+            # History window and token limits of each run, by conversation stage (CONTEXT_*)
+            self.context_budget = context_budget
+
+            self.tools = ToolRegistry(default_timeout=get_settings().TOOL_TIMEOUT_SECONDS)
+            self.tools.register("add_crm_contact", self._execute_add_crm_contact, definition=add_contact_tool)
 
-    async def _execute_add_crm_contact(self, arguments: Dict[str, Any]) -> str:
-        """Executes the add_crm_contact function and returns the result as a JSON string."""
-        self.logger.info(f"Executing tool 'add_crm_contact' with arguments: {arguments}")
-        db = None
+            # None means the built-in Assistants API flow below handles the turn
+            self.engine: Optional[LLMEngine] = self._build_engine(self.engine_name)
+            self.initialized = True
+            self.logger.info("CourseAssistant __init__ completed with engine '%s'.", self.engine_name)
+
+    def _build_engine(self, engine_name: str) -> Optional[LLMEngine]:
+        """Creates the LLM engine selected for this deployment (LLM_ENGINE)."""
+        if engine_name == "assistants":
+            return None
+        if engine_name == ChatCompletionsEngine.name:
+            app_settings = get_settings()
+            return ChatCompletionsEngine(
+                client=self.client,
+                conversation_manager=self.conversation_manager,
+                tools=self.tools,
+                instructions=FestivalConfig.build_instructions(),
+                knowledge_base=self.knowledge_base,
+                model=app_settings.CHAT_MODEL,
+                top_k=app_settings.KNOWLEDGE_TOP_K,
+                model_router=self.model_router,
+                context_budget=self.context_budget,
+            )
+        raise ValueError(f"Unknown LLM_ENGINE '{engine_name}'. Use 'assistants' or '{ChatCompletionsEngine.name}'.")
+
+    # --- Hot reload (see hot_reload.py) ---
+
+    def reload_knowledge_base(self):
+        """Builds a new knowledge base from the same files and swaps it in (runs in a worker thread)."""
+        knowledge_base = KnowledgeBase(
+            file_paths=self.knowledge_base.file_paths,
+            index_dir=self.knowledge_base.index_dir,
+            vector_search=self.knowledge_base.vector_search,
+            min_score=self.knowledge_base.min_score,
+        )
+        self.knowledge_base = knowledge_base
+        if isinstance(self.engine, ChatCompletionsEngine):
+            self.engine.knowledge_base = knowledge_base
+
+    async def reload_instructions(self):
+        """Applies a changed instructions file: to the local engine, or pushed once to the OpenAI assistant."""
+        if isinstance(self.engine, ChatCompletionsEngine):
+            self.engine.set_instructions(FestivalConfig.build_instructions())
+        elif self.engine is None:
+            await FestivalConfig.push_instructions(self.client, self.assistant_id)
+
+    async def push_knowledge_files(self):
+        """Uploads changed knowledge files for the assistant's `file_search` (once across workers)."""
+        await FestivalConfig.push_knowledge_files(self.client, self.assistant_id, self.knowledge_base.file_paths)
+
+
+    async def _execute_add_crm_contact(self, arguments: Dict[str, Any], user_id: Optional[str] = None) -> str:
+        """
+        Executes the add_crm_contact function and returns the result as a JSON string. The
+        contact is keyed by the sender's WhatsApp ID, so it updates the contact that lead
+        extraction fills for the same number instead of adding a second one.
+        """
+        self.logger.info("Executing tool 'add_crm_contact' (fields: %s)", sorted(k for k, v in arguments.items() if v))
+        if not user_id:
+            self.logger.error("add_crm_contact called without the sender's WhatsApp ID.")
+            return json.dumps({"status": "error", "message": "Unknown sender; contact not saved."})
         try:
-            db = await get_db()
             contact_data = {
                 "name": arguments.get("name"),
-                "phone": arguments.get("phone"),
+                "phone": user_id,
                 "email": arguments.get("email"),
                 "company": arguments.get("company"),
                 "event_type": arguments.get("event_type"),
                 "plan_interest": arguments.get("plan_interest"),
                 "notes": arguments.get("notes"),
-                "added_on": datetime.now(FestivalConfig.SPAIN_TZ)
+                "source": "whatsapp",
             }
             attendees_str = arguments.get("attendees")
             contact_data["attendees"] = int(attendees_str) if attendees_str is not None and str(attendees_str).isdigit() else None
@@ -253,144 +386,421 @@ class CourseAssistant:
             contact_data["event_date"] = None
             if event_date_str:
                 try:
-                    parsed_date = date.fromisoformat(event_date_str)
-                    contact_data["event_date"] = datetime.combine(parsed_date, datetime.min.time()).replace(tzinfo=FestivalConfig.SPAIN_TZ)
+                    # Same form as the dates stored by lead extraction on this contact
+                    contact_data["event_date"] = to_contact_fields({"event_date": event_date_str})["event_date"]
                 except (ValueError, TypeError):
-                    self.logger.warning(f"Invalid date format '{event_date_str}' for event_date. Setting to None.")
+                    self.logger.warning("Invalid date format '%s' for event_date. Setting to None.", event_date_str)
             
             validated_contact = ContactSchema(**contact_data)
-            insert_data = validated_contact.model_dump(by_alias=True, exclude={'id'})
-            insert_result = await db.contacts.insert_one(insert_data)
-
-            if insert_result.inserted_id:
-                self.logger.info(f"Contact '{validated_contact.name}' inserted with ID: {insert_result.inserted_id}")
+            fields = validated_contact.model_dump(exclude={"id", "name", "phone", "source", "added_on"})
+            given_phone = phone_key(arguments.get("phone"))
+            if given_phone and not phone_key(user_id).endswith(given_phone):
+                fields["contact_phone"] = given_phone  # Another number than the WhatsApp one, as lead extraction stores it
+            contact = await upsert_contact_by_phone(user_id, fields, name=validated_contact.name)
+
+            if contact is not None:
+                self.logger.info("Contact saved with ID: %s", contact["_id"])
                 return json.dumps({
                     "status": "success",
-                    "message": f"Contact '{validated_contact.name}' added successfully.",
-                    "contact_id": str(insert_result.inserted_id)
+                    "message": f"Contact '{contact.get('name')}' saved successfully.",
+                    "contact_id": str(contact["_id"])
                 })
             else:
-                self.logger.error("Contact insertion failed (no inserted_id).")
-                return json.dumps({"status": "error", "message": "Failed to insert contact."})
+                self.logger.error("Contact save failed (no contact stored).")
+                return json.dumps({"status": "error", "message": "Failed to save contact."})
         except ValidationError as e:
             error_details = e.errors()[0]
             msg = f"Validation failed: {error_details['msg']} for field '{error_details['loc'][0]}'."
-            self.logger.error(f"Contact validation failed for tool: {msg} - Data: {arguments}")
+            self.logger.error("Contact validation failed for tool: %s", msg)
+            self.logger.debug("Rejected contact data: %s", arguments)
             return json.dumps({"status": "error", "message": msg})
         except Exception as e:
-            self.logger.error(f"Error executing add_crm_contact tool: {e}", exc_info=True)
+            self.logger.error("Error executing add_crm_contact tool: %s", e, exc_info=True)
             return json.dumps({"status": "error", "message": f"Internal error: {str(e)}"})
 
 
-    async def _wait_for_run_completion_and_handle_actions(self, thread_id: str, run_id: str, timeout_seconds: int = 180) -> str:
-        """Polls run status, handles required actions (tool calls), and returns final status."""
+    def _user_lock(self, user_id: str) -> asyncio.Lock:
+        lock = self._user_locks.get(user_id)
+        if lock is None:
+            lock = asyncio.Lock()
+            self._user_locks[user_id] = lock
+        return lock
+
+    def _track_run(self, thread_id: str, run_id: str):
+        self.active_runs[run_id] = thread_id
+        self._recent_run_threads[thread_id] = time.time()
+        self._recent_run_threads.move_to_end(thread_id)
+        if len(self._recent_run_threads) > 10000:
+            self._recent_run_threads.popitem(last=False)
+
+    def pop_threads_to_check(self, min_age_seconds: float) -> List[str]:
+        """Threads whose last run here started more than `min_age_seconds` ago (removed from the watch list)."""
+        cutoff = time.time() - min_age_seconds
+        due = [thread_id for thread_id, started in self._recent_run_threads.items() if started <= cutoff]
+        for thread_id in due:
+            del self._recent_run_threads[thread_id]
+        return due
+
+    def export_recent_run_threads(self) -> Dict[str, float]:
+        return dict(self._recent_run_threads)
+
+    def import_recent_run_threads(self, threads: Dict[str, float]):
+        """Restores the run reaper's watch list, so runs orphaned by the previous worker get checked."""
+        for thread_id, started in sorted(threads.items(), key=lambda item: item[1]):
+            self._recent_run_threads.setdefault(thread_id, started)
+
+    async def cancel_run(self, thread_id: str, run_id: str, reason: str, wait_seconds: float = 10) -> Optional[str]:
+        """
+        Cancels a run that was left active, so its thread accepts new messages again, and
+        waits (briefly) until the cancellation is complete. Returns the final run status,
+        or None when the run could not be cancelled (usually: it already finished).
+        """
+        try:
+            run = await self.client.beta.threads.runs.cancel(run_id, thread_id=thread_id)
+        except Exception as e:
+            self.logger.warning("Could not cancel run %s on thread %s (%s): %s", run_id, thread_id, reason, e)
+            return None
+        metrics.inc("assistant_runs_cancelled", reason=reason)
+        self.logger.warning("Cancelled run %s on thread %s (reason: %s)", run_id, thread_id, reason)
+        deadline = time.monotonic() + wait_seconds
+        try:
+            while run.status == "cancelling" and time.monotonic() < deadline:
+                await asyncio.sleep(0.5)
+                run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            self.logger.warning("Could not confirm cancellation of run %s: %s", run_id, e)
+        return run.status
+
+    async def _cancel_blocking_runs(self, thread_id: str) -> int:
+        """Cancels the active runs of a thread that are not driven by this worker."""
+        cancelled = 0
+        page = await self.client.beta.threads.runs.list(thread_id=thread_id, limit=5)
+        for run in page.data:
+            if run.status in ACTIVE_RUN_STATUSES and run.status != "cancelling" and run.id not in self.active_runs:
+                if await self.cancel_run(thread_id, run.id, reason="blocking"):
+                    cancelled += 1
+        return cancelled
+
+    async def _call_unblocking_thread(self, thread_id: str, call):
+        """
+        Runs `call()` (a message or run creation on `thread_id`). If the API refuses it because
+        an earlier run is still active, that orphaned run is cancelled and the call retried once.
+        """
+        try:
+            return await call()
+        except BadRequestError as e:
+            body = e.body if isinstance(e.body, dict) else {}
+            if not THREAD_LOCKED_RE.search(body.get("message") or str(e)):
+                raise
+            self.logger.warning("Thread %s is locked by an active run; cancelling it and retrying.", thread_id)
+            if not await self._cancel_blocking_runs(thread_id):
+                raise  # No run of another worker holds the thread: retrying would fail the same way
+            return await call()
+
+    @profiled("CourseAssistant._run_tool_calls")
+    async def _run_tool_calls(self, user_id: str, tool_calls) -> List[Dict[str, str]]:
+        """Executes the tool calls of a `requires_action` run concurrently and returns the tool outputs."""
+        for tool_call in tool_calls:
+            self.logger.info("Tool call requested: %s ID: %s", tool_call.function.name, tool_call.id)
+        return await self.tools.dispatch_many(
+            [(tc.id, tc.function.name, tc.function.arguments) for tc in tool_calls], user_id=user_id
+        )
+
+    async def _wait_for_run_completion_and_handle_actions(self, user_id: str, thread_id: str, run_id: str, timeout_seconds: Optional[float] = None) -> Tuple[str, Any]:
+        """Polls run status, handles required actions (tool calls), and returns the final status and the last run seen."""
+        timeout_seconds = timeout_seconds or self.run_timeout
         start_time = time.time()
+        run = None
         while time.time() - start_time < timeout_seconds:
             try:
                 run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
-                self.logger.debug(f"Polling run {run_id} status: {run.status}")
+                self.logger.debug("Polling run %s status: %s", run_id, run.status, extra={"high_volume": True})
 
                 if run.status == "completed":
-                    return "completed"
+                    return "completed", run
+                elif run.status == "incomplete":
+                    # Stopped at a token limit of the context budget; the text generated so far is on the thread
+                    return "incomplete", run
                 elif run.status in ["failed", "cancelled", "expired"]:
-                    self.logger.error(f"Run {run_id} ended with terminal status {run.status}. Last error: {run.last_error}")
-                    return run.status
+                    self.logger.error("Run %s ended with terminal status %s. Last error: %s", run_id, run.status, run.last_error)
+                    return run.status, run
                 elif run.status == "requires_action":
-                    self.logger.info(f"Run {run.id} requires action: {run.required_action.type}")
+                    self.logger.info("Run %s requires action: %s", run.id, run.required_action.type)
                     if run.required_action.type == "submit_tool_outputs":
-                        tool_outputs = []
-                        for tool_call in run.required_action.submit_tool_outputs.tool_calls:
-                            function_name = tool_call.function.name
-                            arguments_str = tool_call.function.arguments
-                            self.logger.info(f"Tool call requested: {function_name}({arguments_str}) ID: {tool_call.id}")
-                            try:
-                                arguments = json.loads(arguments_str)
-                            except json.JSONDecodeError:
-                                self.logger.error(f"Failed to parse JSON args for tool {tool_call.id}: {arguments_str}")
-                                output = json.dumps({"status": "error", "message": "Invalid JSON arguments."})
-                                tool_outputs.append({"tool_call_id": tool_call.id, "output": output})
-                                continue
-                            
-                            if function_name == "add_crm_contact":
-                                output = await self._execute_add_crm_contact(arguments)
-                            else:
-                                self.logger.warning(f"Unknown tool function requested: {function_name}")
-                                output = json.dumps({"status": "error", "message": f"Unknown function '{function_name}'."})
-                            tool_outputs.append({"tool_call_id": tool_call.id, "output": output})
+                        tool_outputs = await self._run_tool_calls(user_id, run.required_action.submit_tool_outputs.tool_calls)
                         
                         if tool_outputs:
-                            self.logger.info(f"Submitting tool outputs for run {run.id}: {tool_outputs}")
+                            self.logger.info("Submitting %d tool output(s) for run %s", len(tool_outputs), run.id)
+                            self.logger.debug("Tool outputs for run %s: %s", run.id, tool_outputs)
                             try:
                                 await self.client.beta.threads.runs.submit_tool_outputs(
                                     thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs
                                 )
                             except Exception as submit_err:
-                                self.logger.error(f"Error submitting tool outputs for run {run.id}: {submit_err}", exc_info=True)
-                                return "error_submitting_tools"
+                                self.logger.error("Error submitting tool outputs for run %s: %s", run.id, submit_err, exc_info=True)
+                                return "error_submitting_tools", run
                         else:
-                            self.logger.warning(f"Run {run.id} required tool outputs, but no tools were processed.")
-                            return "error_no_tools_processed"
+                            self.logger.warning("Run %s required tool outputs, but no tools were processed.", run.id)
+                            return "error_no_tools_processed", run
                     else:
-                        self.logger.error(f"Run {run.id} requires unhandled action: {run.required_action.type}")
-                        return "error_unhandled_action"
+                        self.logger.error("Run %s requires unhandled action: %s", run.id, run.required_action.type)
+                        return "error_unhandled_action", run
                 await asyncio.sleep(1)
             except Exception as e:
-                self.logger.error(f"Error during run polling/action handling for {run_id}: {e}", exc_info=True)
-                return "error_polling"
-        self.logger.error(f"Run {run_id} timed out after {timeout_seconds} seconds.")
-        return "timeout"
+                self.logger.error("Error during run polling/action handling for %s: %s", run_id, e, exc_info=True)
+                return "error_polling", run
+        self.logger.error("Run %s timed out after %s seconds.", run_id, timeout_seconds)
+        return "timeout", run
+
+    async def _add_user_message(self, user_id: str, message: str) -> str:
+        """Gets (or creates) the user's thread, appends the message and returns the thread ID."""
+        thread_id = self.conversation_manager.get_thread_id(user_id)
+        if not thread_id:
+            thread = await self.client.beta.threads.create()
+            thread_id = thread.id
+            self.conversation_manager.add_thread(user_id, thread_id)
+            self.logger.info("Created new thread %s for user %s", thread_id, user_id)
+
+        await self._call_unblocking_thread(thread_id, lambda: self.client.beta.threads.messages.create(
+            thread_id=thread_id, role="user", content=message
+        ))
+        self.logger.info("User message added to thread %s", thread_id, extra={"high_volume": True})
+        return thread_id
+
+    def _plan_turn(self, user_id: str, message: str) -> Tuple[ModelChoice, ContextPolicy]:
+        """
+        Model and context policy of this turn, by conversation stage and the user's budget.
+        Call before the message is added, so a first message counts as stage 'new'.
+        """
+        stage = conversation_stage(
+            self.conversation_manager.get_lead_draft(user_id),
+            is_new=self.conversation_manager.get_thread_id(user_id) is None,
+        )
+        economy = usage_ledger.mode(user_id) != NORMAL
+        return self.model_router.choose(message, stage, economy=economy), self.context_budget.select(stage, economy)
+
+    async def _run_options(self, user_id: str, message: str, choice: Optional[ModelChoice] = None,
+                           policy: Optional[ContextPolicy] = None) -> Dict[str, Any]:
+        """
+        Per-turn `runs.create` arguments: the model picked by the cascade, the truncation
+        strategy and token limits of the context policy, the current date, passages retrieved
+        locally for the message (the run then skips `file_search`) and the captured/missing
+        lead fields.
+        """
+        options: Dict[str, Any] = {}
+        if choice is not None and choice.model:
+            options["model"] = choice.model  # Overrides the assistant's model for this run only
+        if policy is not None:
+            options.update(policy.run_options())
+        notes: List[str] = [current_date_note()]
+        if self.local_retrieval:
+            context = await self.knowledge_base.abuild_context(message, top_k=get_settings().KNOWLEDGE_TOP_K)
+            if context:
+                notes.append(f"{LOCAL_KNOWLEDGE_NOTE}\n### CONTEXTO\n{context}\n")
+                options["tools"] = [add_contact_tool]  # Overrides the assistant's tools for this run only
+        lead_note = lead_instructions(self.conversation_manager.get_lead_draft(user_id))
+        if lead_note:
+            notes.append(lead_note)
+        options["additional_instructions"] = "\n".join(notes)
+        return options
+
+    async def _stream_run(self, user_id: str, thread_id: str, run_options: Optional[Dict[str, Any]] = None,
+                          policy: Optional[ContextPolicy] = None) -> AsyncIterator[str]:
+        """
+        Creates a streaming run and yields the assistant's text deltas as they arrive.
+        Tool calls are answered with a streaming submit, so the reply keeps flowing
+        after `requires_action` without any polling. A run that does not finish
+        (error, timeout, consumer gone) is cancelled so it does not lock the thread.
+        """
+        start = time.perf_counter()
+        stream = await self._call_unblocking_thread(thread_id, lambda: self.client.beta.threads.runs.create(
+            thread_id=thread_id, assistant_id=self.assistant_id, stream=True, **(run_options or {}),
+        ))
+        run_id: Optional[str] = None
+        finished = False
+        deadline = time.monotonic() + self.run_timeout
+        try:
+            while stream is not None:
+                next_stream = None
+                async for event in stream:
+                    if time.monotonic() > deadline:
+                        raise TimeoutError(f"Streaming run {run_id} timed out after {self.run_timeout} seconds")
+                    if event.event == "thread.run.created":
+                        run_id = event.data.id
+                        self._track_run(thread_id, run_id)
+                    elif event.event == "thread.message.delta":
+                        for block in event.data.delta.content or []:
+                            if block.type == "text" and block.text and block.text.value:
+                                yield block.text.value
+                    elif event.event == "thread.run.requires_action":
+                        run = event.data
+                        tool_outputs = await self._run_tool_calls(user_id, run.required_action.submit_tool_outputs.tool_calls)
+                        next_stream = await self.client.beta.threads.runs.submit_tool_outputs(
+                            thread_id=thread_id, run_id=run.id, tool_outputs=tool_outputs, stream=True,
+                        )
+                    elif event.event in ("thread.run.failed", "thread.run.cancelled", "thread.run.expired"):
+                        finished = True
+                        run = event.data
+                        self._record_unfinished_run(user_id, run)
+                        raise RuntimeError(f"Run {run.id} ended with status {run.status}. Last error: {run.last_error}")
+                    elif event.event == "thread.run.completed":
+                        finished = True
+                        self.logger.info("Streaming run %s completed for thread %s", event.data.id, thread_id)
+                        self._record_run(user_id, event.data, start, policy)
+                    elif event.event == "thread.run.incomplete":
+                        finished = True
+                        self._log_incomplete(event.data)
+                        self._record_run(user_id, event.data, start, policy)
+                stream = next_stream
+        finally:
+            if run_id is not None:
+                self.active_runs.pop(run_id, None)
+                if not finished:
+                    # Also reached when the consumer stops iterating: don't await inside a closing generator
+                    task = asyncio.create_task(self._cancel_and_record(user_id, thread_id, run_id, "stream_aborted"))
+                    self._cleanup_tasks.add(task)
+                    task.add_done_callback(self._cleanup_tasks.discard)
+
+    async def stream_message(self, user_id: str, message: str) -> AsyncIterator[str]:
+        """
+        Like `process_message`, but yields the reply as text deltas while the run is
+        still generating, so callers can deliver the first part early.
+        """
+        yielded = False
+        try:
+            if self.engine is not None:
+                async with self._user_lock(user_id):
+                    async for delta in self.engine.stream_message(user_id, message):
+                        yielded = True
+                        yield delta
+            else:
+                self.logger.info("Streaming message from %s (%d chars)", user_id, len(message))
+                async with self._user_lock(user_id):
+                    choice, policy = self._plan_turn(user_id, message)
+                    thread_id = await self._add_user_message(user_id, message)
+                    run_options = await self._run_options(user_id, message, choice, policy)
+                    async for delta in self._stream_run(user_id, thread_id, run_options, policy):
+                        yielded = True
+                        yield delta
+        except Exception as e:
+            self.logger.error("Error in stream_message: %s", e, exc_info=True)
+            if yielded:
+                yield "\n\nLo siento, la respuesta se ha interrumpido. ¿Podrías repetir tu pregunta?"
+            else:
+                yield "Lo siento, ha ocurrido un error general. ¿Podrías reformular tu pregunta?"
 
+    @profiled("CourseAssistant.process_message")
     async def process_message(self, user_id: str, message: str) -> Optional[str]:
+        if self.engine is not None:
+            # Turns of a user are serialized: each reads and appends the same local history
+            async with self._user_lock(user_id):
+                return await self.engine.process_message(user_id, message)
         try:
-            self.logger.info(f"Processing message from {user_id}: '{message[:100]}...'")
-            thread_id = self.conversation_manager.get_thread_id(user_id)
-            if not thread_id:
-                thread = await self.client.beta.threads.create()
-                thread_id = thread.id
-                self.conversation_manager.add_thread(user_id, thread_id)
-                self.logger.info(f"Created new thread {thread_id} for user {user_id}")
-
-            await self.client.beta.threads.messages.create(
-                thread_id=thread_id, role="user", content=message
-            )
-            self.logger.info(f"User message added to thread {thread_id}")
-
-            run = await self.client.beta.threads.runs.create(
-                thread_id=thread_id, assistant_id=self.assistant_id,
-            )
-            self.logger.info(f"Run {run.id} created for thread {thread_id}")
-
-            run_status = await self._wait_for_run_completion_and_handle_actions(thread_id, run.id)
-            self.logger.info(f"Run {run.id} finished with status: {run_status}")
+            self.logger.info("Processing message from %s (%d chars)", user_id, len(message))
+            async with self._user_lock(user_id):
+                return await self._process_assistants_turn(user_id, message)
+        except Exception as e:
+            self.logger.error("Error in process_message: %s", e, exc_info=True)
+            return "Lo siento, ha ocurrido un error general. ¿Podrías reformular tu pregunta?"
 
-            if run_status == 'completed':
-                messages_page = await self.client.beta.threads.messages.list(
-                    thread_id=thread_id, order="desc", limit=5
-                )
-                assistant_response_text = ""
-                for msg in messages_page.data:
-                    if msg.role == "assistant":
-                        for content_block in msg.content:
-                            if content_block.type == "text":
-                                assistant_response_text += content_block.text.value + "\n"
-                        if assistant_response_text:
-                            break 
-                
-                if not assistant_response_text:
-                    self.logger.warning(f"Run {run.id} completed but no final assistant text response found.")
-                    return "Procesamiento completado, pero no encontré una respuesta final."
-                return assistant_response_text.strip()
+    def _record_run(self, user_id: str, run, start: float, policy: Optional[ContextPolicy] = None):
+        """Feeds a finished run's latency and token usage to the per-model stats, the context budget and the user's usage ledger."""
+        usage = getattr(run, "usage", None)
+        model = getattr(run, "model", None)
+        prompt_tokens = usage.prompt_tokens if usage else 0
+        completion_tokens = usage.completion_tokens if usage else 0
+        self.model_router.record(model, (time.perf_counter() - start) * 1000,
+                                 prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        self.context_budget.observe(policy, prompt_tokens, completion_tokens)
+        usage_ledger.record(user_id, model, prompt_tokens, completion_tokens)
+
+    def _record_unfinished_run(self, user_id: str, run):
+        """Bills the tokens of a failed, expired or cancelled run to the user's usage ledger."""
+        usage = getattr(run, "usage", None)
+        if usage is not None:
+            usage_ledger.record(user_id, getattr(run, "model", None), usage.prompt_tokens, usage.completion_tokens)
+
+    async def _cancel_and_record(self, user_id: str, thread_id: str, run_id: str, reason: str):
+        """Cancels a run left active and bills the tokens it used until then."""
+        await self.cancel_run(thread_id, run_id, reason=reason)
+        try:
+            run = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run_id)
+        except Exception as e:
+            self.logger.warning("Could not read the usage of run %s: %s", run_id, e)
+            return
+        self._record_unfinished_run(user_id, run)
+
+    def _log_incomplete(self, run):
+        details = getattr(run, "incomplete_details", None)
+        reason = getattr(details, "reason", None) or "unknown"
+        metrics.inc("runs_incomplete", reason=reason)
+        self.logger.warning("Run %s stopped early (%s); replying with the text generated so far", run.id, reason)
+
+    async def _run_to_completion(self, user_id: str, thread_id: str, run_options: Dict[str, Any],
+                                 policy: Optional[ContextPolicy] = None) -> Tuple[Any, str]:
+        """Creates a run, drives it to a final status (cancelling it if it is left active) and returns (run, status)."""
+        start = time.perf_counter()
+        run = await self._call_unblocking_thread(thread_id, lambda: self.client.beta.threads.runs.create(
+            thread_id=thread_id, assistant_id=self.assistant_id, **run_options,
+        ))
+        self.logger.info("Run %s created for thread %s", run.id, thread_id, extra={"high_volume": True})
+
+        self._track_run(thread_id, run.id)
+        try:
+            run_status, final_run = await self._wait_for_run_completion_and_handle_actions(user_id, thread_id, run.id)
+            self.logger.info("Run %s finished with status: %s", run.id, run_status)
+            if run_status in ("completed", "incomplete"):
+                if run_status == "incomplete":
+                    self._log_incomplete(final_run)
+                self._record_run(user_id, final_run, start, policy)
+            elif run_status in ("failed", "cancelled", "expired"):
+                self._record_unfinished_run(user_id, final_run)  # Billed even though it is retried or fails
             else:
-                final_run_state = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
-                error_info = f"Status: {final_run_state.status}."
-                if final_run_state.last_error:
-                    error_info += f" Error: {final_run_state.last_error.code} - {final_run_state.last_error.message}"
-                self.logger.error(f"Run {run.id} did not complete successfully. {error_info}")
-                return f"Lo siento, ha ocurrido un problema ({error_info}). Por favor, inténtalo de nuevo."
+                # Timeout or local error: the run is still active on OpenAI and would lock the thread
+                await self._cancel_and_record(user_id, thread_id, run.id, run_status)
+        finally:
+            self.active_runs.pop(run.id, None)
+        return run, run_status
+
+    async def _process_assistants_turn(self, user_id: str, message: str) -> str:
+        choice, policy = self._plan_turn(user_id, message)
+        thread_id = await self._add_user_message(user_id, message)
+
+        run_options = await self._run_options(user_id, message, choice, policy)
+        run, run_status = await self._run_to_completion(user_id, thread_id, run_options, policy)
+        if run_status in ("failed", "expired"):
+            # A failed run leaves no reply on the thread: retry once on the large model
+            escalated = self.model_router.escalate(choice, run_status)
+            if escalated is not None:
+                self.logger.warning("Run %s on %s ended %s; retrying on %s", run.id, choice.model, run_status, escalated.model)
+                run, run_status = await self._run_to_completion(
+                    user_id, thread_id, {**run_options, "model": escalated.model}, policy
+                )
 
-        except Exception as e:
-            self.logger.error(f"Error in process_message: {str(e)}", exc_info=True)
-            return "Lo siento, ha ocurrido un error general. ¿Podrías reformular tu pregunta?"
+        if run_status in ('completed', 'incomplete'):
+            messages_page = await self.client.beta.threads.messages.list(
+                thread_id=thread_id, order="desc", limit=5
+            )
+            assistant_response_text = ""
+            for msg in messages_page.data:
+                if msg.role == "assistant" and msg.run_id == run.id:
+                    for content_block in msg.content:
+                        if content_block.type == "text":
+                            assistant_response_text += content_block.text.value + "\n"
+                    if assistant_response_text:
+                        break 
+            
+            if not assistant_response_text:
+                self.logger.warning("Run %s completed but no final assistant text response found.", run.id)
+                return "Procesamiento completado, pero no encontré una respuesta final."
+            return assistant_response_text.strip()
+        else:
+            final_run_state = await self.client.beta.threads.runs.retrieve(thread_id=thread_id, run_id=run.id)
+            error_info = f"Status: {final_run_state.status}."
+            if final_run_state.last_error:
+                error_info += f" Error: {final_run_state.last_error.code} - {final_run_state.last_error.message}"
+            self.logger.error("Run %s did not complete successfully. %s", run.id, error_info)
+            return f"Lo siento, ha ocurrido un problema ({error_info}). Por favor, inténtalo de nuevo."
 
 
 async def initialize_assistant() -> CourseAssistant:
@@ -401,17 +811,20 @@ async def initialize_assistant() -> CourseAssistant:
         if not api_key:
              raise ValueError("OPENAI_API_KEY is required for initialize_assistant.")
         
-        async_client_for_setup = AsyncOpenAI(api_key=api_key)
-        logger.info("AsyncOpenAI client for setup initialized.")
+        if get_settings().LLM_ENGINE == "assistants":
+            async_client_for_setup = AsyncOpenAI(api_key=api_key)
+            logger.info("AsyncOpenAI client for setup initialized.")
 
-        await FestivalConfig.get_or_create_assistant(async_client_for_setup)
-        logger.info(f"Assistant setup completed. Using Assistant ID: {FestivalConfig.ASSISTANT_ID}")
+            await FestivalConfig.get_or_create_assistant(async_client_for_setup)
+            logger.info("Assistant setup completed. Using Assistant ID: %s", FestivalConfig.ASSISTANT_ID)
+        else:
+            logger.info("LLM_ENGINE is '%s'; skipping Assistants API setup.", get_settings().LLM_ENGINE)
 
         instance = CourseAssistant()
         logger.info("CourseAssistant instance created and initialized.")
         return instance
     except Exception as e:
-        logger.error(f"Error during initialize_assistant: {e}", exc_info=True)
+        logger.error("Error during initialize_assistant: %s", e, exc_info=True)
         raise
 
 
@@ -435,8 +848,8 @@ if __name__ == "__main__":
                 response = await course_assistant_instance.process_message(test_user_id, user_input)
                 print(f"\nAsistente: {response}")
         except ValueError as ve:
-            logger.critical(f"Configuration error: {ve}")
+            logger.critical("Configuration error: %s", ve)
         except Exception as e:
-            logger.error(f"Error en la prueba principal: {str(e)}", exc_info=True)
+            logger.error("Error en la prueba principal: %s", e, exc_info=True)
 
     asyncio.run(main_test())
\ No newline at end of file
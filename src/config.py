@@ -28,6 +28,94 @@ class Settings(BaseSettings):
 
     # Logging settings
     LOG_LEVEL: str = os.getenv("LOG_LEVEL", "INFO")
+    LOG_FORMAT: str = os.getenv("LOG_FORMAT", "json")  # "json" or "text"
+    LOG_SAMPLE_EVERY: int = int(os.getenv("LOG_SAMPLE_EVERY", "20"))  # Keep 1 in N high-volume lines
+    LOG_QUEUE_SIZE: int = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+
+    # Event loop lag monitor (gunicorn runs with timeout = 0, so a blocked loop would otherwise go unnoticed)
+    LOOP_MONITOR_ENABLED: bool = os.getenv("LOOP_MONITOR_ENABLED", "True").lower() in ('true', '1', 't')
+    LOOP_MONITOR_INTERVAL: float = float(os.getenv("LOOP_MONITOR_INTERVAL", "0.5"))
+    LOOP_SLOW_THRESHOLD_MS: int = int(os.getenv("LOOP_SLOW_THRESHOLD_MS", "200"))
+
+    # LLM engine settings
+    # "assistants" (OpenAI Assistants API, server-side threads) or
+    # "chat_completions" (local history + one streamed Chat Completions call per turn)
+    LLM_ENGINE: str = os.getenv("LLM_ENGINE", "assistants")
+    CHAT_MODEL: str = os.getenv("CHAT_MODEL", "gpt-4-turbo")
+    # Model cascade: turns scored below MODEL_CASCADE_THRESHOLD run on MODEL_SMALL, the rest on MODEL_LARGE
+    MODEL_CASCADE_ENABLED: bool = os.getenv("MODEL_CASCADE_ENABLED", "True").lower() in ('true', '1', 't')
+    MODEL_SMALL: str = os.getenv("MODEL_SMALL", "gpt-4o-mini")
+    MODEL_LARGE: str = os.getenv("MODEL_LARGE", os.getenv("CHAT_MODEL", "gpt-4-turbo"))
+    MODEL_CASCADE_THRESHOLD: float = float(os.getenv("MODEL_CASCADE_THRESHOLD", "0.5"))
+    # Context budget per run: history window and token limits chosen by conversation stage (src/context_budget.py).
+    # CONTEXT_POLICIES overrides them as JSON, e.g. '{"closing": {"last_messages": 30, "max_prompt_tokens": 16000}}'
+    CONTEXT_BUDGET_ENABLED: bool = os.getenv("CONTEXT_BUDGET_ENABLED", "True").lower() in ('true', '1', 't')
+    CONTEXT_POLICIES: str = os.getenv("CONTEXT_POLICIES", "")
+    KNOWLEDGE_TOP_K: int = int(os.getenv("KNOWLEDGE_TOP_K", "3"))
+    # Local retrieval: comma-separated knowledge files (relative to src/), the precomputed vector index
+    # (scripts/build_knowledge_index.py) and whether Assistants runs use it instead of file_search
+    KNOWLEDGE_FILES: str = os.getenv("KNOWLEDGE_FILES", "")  # Empty: knowledge.DEFAULT_KNOWLEDGE_FILES
+    KNOWLEDGE_INDEX_DIR: str = os.getenv("KNOWLEDGE_INDEX_DIR", "")
+    KNOWLEDGE_LOCAL_RETRIEVAL: bool = os.getenv("KNOWLEDGE_LOCAL_RETRIEVAL", "True").lower() in ('true', '1', 't')
+    # Instructions template of the assistant, relative to src/ (lines with {today} are replaced by a per-turn date note)
+    ASSISTANT_INSTRUCTIONS_FILE: str = os.getenv("ASSISTANT_INSTRUCTIONS_FILE", "assistant_instructions.md")
+    # Knowledge and instruction files are checked for changes every HOT_RELOAD_INTERVAL seconds (0: only POST /ops/reload)
+    HOT_RELOAD_INTERVAL: float = float(os.getenv("HOT_RELOAD_INTERVAL", "30"))
+    TOOL_TIMEOUT_SECONDS: float = float(os.getenv("TOOL_TIMEOUT_SECONDS", "20"))
+
+    # Assistants API runs: a run not finished after RUN_TIMEOUT_SECONDS is cancelled; the reaper
+    # cancels runs left active on known threads every RUN_REAPER_INTERVAL seconds (0 disables it)
+    RUN_TIMEOUT_SECONDS: float = float(os.getenv("RUN_TIMEOUT_SECONDS", "180"))
+    RUN_REAPER_INTERVAL: float = float(os.getenv("RUN_REAPER_INTERVAL", "300"))
+
+    # Reply streaming: send long answers as several WhatsApp messages while the model is still writing
+    STREAM_REPLIES: bool = os.getenv("STREAM_REPLIES", "True").lower() in ('true', '1', 't')
+    STREAM_FIRST_SEGMENT_MIN_CHARS: int = int(os.getenv("STREAM_FIRST_SEGMENT_MIN_CHARS", "80"))
+    STREAM_SEGMENT_MIN_CHARS: int = int(os.getenv("STREAM_SEGMENT_MIN_CHARS", "400"))
+
+    # Messages of different senders in one webhook payload are handled concurrently, up to this many at a time
+    WEBHOOK_FANOUT_CONCURRENCY: int = int(os.getenv("WEBHOOK_FANOUT_CONCURRENCY", "5"))
+
+    # Admission control: per sender rate limit and a cap on concurrent assistant runs per worker
+    ADMISSION_USER_RATE_PER_MINUTE: float = float(os.getenv("ADMISSION_USER_RATE_PER_MINUTE", "6"))
+    ADMISSION_USER_BURST: int = int(os.getenv("ADMISSION_USER_BURST", "3"))
+    ADMISSION_MAX_CONCURRENT_RUNS: int = int(os.getenv("ADMISSION_MAX_CONCURRENT_RUNS", "20"))
+    ADMISSION_MAX_QUEUE_WAIT: float = float(os.getenv("ADMISSION_MAX_QUEUE_WAIT", "10"))
+
+    # App secret of the Meta app; webhook calls must carry a matching X-Hub-Signature-256 header
+    WHATSAPP_APP_SECRET: str | None = os.getenv("WHATSAPP_APP_SECRET")
+
+    # Warm-start snapshots of in-memory state, written on graceful shutdown and loaded at startup.
+    # SNAPSHOT_BACKEND: "file" (SNAPSHOT_DIR) or "mongo" (needed where the local disk is ephemeral, e.g. Cloud Run)
+    SNAPSHOT_ENABLED: bool = os.getenv("SNAPSHOT_ENABLED", "True").lower() in ('true', '1', 't')
+    SNAPSHOT_BACKEND: str = os.getenv("SNAPSHOT_BACKEND", "file")
+    SNAPSHOT_DIR: str = os.getenv("SNAPSHOT_DIR", ".snapshots")
+    SNAPSHOT_MAX_AGE_SECONDS: float = float(os.getenv("SNAPSHOT_MAX_AGE_SECONDS", "86400"))
+
+    # Local intent router: greetings, thanks and menu requests get canned replies without an assistant run
+    INTENT_ROUTER_ENABLED: bool = os.getenv("INTENT_ROUTER_ENABLED", "True").lower() in ('true', '1', 't')
+    INTENT_CONFIDENCE_THRESHOLD: float = float(os.getenv("INTENT_CONFIDENCE_THRESHOLD", "0.75"))
+
+    # Lead fields (email, dates, attendees, plan...) are extracted locally from every text and saved to the CRM
+    LEAD_EXTRACTION_ENABLED: bool = os.getenv("LEAD_EXTRACTION_ENABLED", "True").lower() in ('true', '1', 't')
+
+    # Broadcast campaigns: default send rate and concurrent sends per campaign (overridable per campaign)
+    CAMPAIGN_RATE_PER_SECOND: float = float(os.getenv("CAMPAIGN_RATE_PER_SECOND", "20"))
+    CAMPAIGN_CONCURRENCY: int = int(os.getenv("CAMPAIGN_CONCURRENCY", "8"))
+
+    # Delivery status pipeline: status callbacks are buffered and bulk-written to `message_statuses`
+    STATUS_BATCH_SIZE: int = int(os.getenv("STATUS_BATCH_SIZE", "500"))
+    STATUS_FLUSH_INTERVAL: float = float(os.getenv("STATUS_FLUSH_INTERVAL", "5"))
+
+    # Token/cost ledger (`usage_daily`, flushed every USAGE_FLUSH_INTERVAL seconds) and daily budgets in USD (0: off).
+    # Over a budget turns run on MODEL_SMALL; over USAGE_USER_DAILY_LIMIT_USD a user gets no assistant runs that day
+    USAGE_FLUSH_INTERVAL: float = float(os.getenv("USAGE_FLUSH_INTERVAL", "30"))
+    USAGE_USER_DAILY_BUDGET_USD: float = float(os.getenv("USAGE_USER_DAILY_BUDGET_USD", "0.5"))
+    USAGE_USER_DAILY_LIMIT_USD: float = float(os.getenv("USAGE_USER_DAILY_LIMIT_USD", "2"))
+    USAGE_DAILY_BUDGET_USD: float = float(os.getenv("USAGE_DAILY_BUDGET_USD", "0"))
+
+    # Operational endpoints (/ops/*): clients must send this value in the X-Admin-Token header
+    ADMIN_TOKEN: str | None = os.getenv("ADMIN_TOKEN")
 
     # App settings
     APP_NAME: str = "WhatsApp Medicina Pleural Bot"
@@ -60,9 +148,9 @@ def get_settings():
         logger.error("PHONE_NUMBER_ID is not set!")
     
     # Log masked versions of sensitive settings
-    logger.info(f"OPENAI_API_KEY: {settings.OPENAI_API_KEY[:5]}...{settings.OPENAI_API_KEY[-5:] if settings.OPENAI_API_KEY else ''}")
-    logger.info(f"WHATSAPP_TOKEN: {settings.WHATSAPP_TOKEN[:5]}...{settings.WHATSAPP_TOKEN[-5:] if settings.WHATSAPP_TOKEN else ''}")
-    logger.info(f"PHONE_NUMBER_ID: {settings.PHONE_NUMBER_ID}")
+    logger.info("OPENAI_API_KEY: %s...%s", settings.OPENAI_API_KEY[:5], settings.OPENAI_API_KEY[-5:] if settings.OPENAI_API_KEY else '')
+    logger.info("WHATSAPP_TOKEN: %s...%s", settings.WHATSAPP_TOKEN[:5], settings.WHATSAPP_TOKEN[-5:] if settings.WHATSAPP_TOKEN else '')
+    logger.info("PHONE_NUMBER_ID: %s", settings.PHONE_NUMBER_ID)
     
     return settings
 
@@ -0,0 +1,113 @@
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional
+
+from .config import get_settings
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.context_budget")
+
+# The Assistants API rejects token limits below this
+MIN_RUN_TOKENS = 256
+
+
+class ContextPolicy(NamedTuple):
+    name: str
+    last_messages: Optional[int]          # Thread messages the run sees; None: the whole thread
+    max_prompt_tokens: Optional[int]      # Over all the steps of a run (tool rounds included)
+    max_completion_tokens: Optional[int]
+
+    def run_options(self) -> Dict[str, Any]:
+        """`runs.create` arguments of the policy (none for the unbounded policy)."""
+        options: Dict[str, Any] = {}
+        if self.last_messages:
+            options["truncation_strategy"] = {"type": "last_messages", "last_messages": self.last_messages}
+        if self.max_prompt_tokens:
+            options["max_prompt_tokens"] = max(self.max_prompt_tokens, MIN_RUN_TOKENS)
+        if self.max_completion_tokens:
+            options["max_completion_tokens"] = max(self.max_completion_tokens, MIN_RUN_TOKENS)
+        return options
+
+    def trim(self, history: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        The last `last_messages` messages of a local (Chat Completions) history. Like
+        `ConversationManager.append_history`, the kept part starts at a user message,
+        so no tool result is sent without the assistant tool call it answers.
+        """
+        if not self.last_messages or len(history) <= self.last_messages:
+            return history
+        kept = history[-self.last_messages:]
+        while kept and kept[0].get("role") != "user":
+            kept.pop(0)
+        return kept
+
+
+UNBOUNDED = ContextPolicy("unbounded", None, None, None)
+
+# Per conversation stage (see `model_router.conversation_stage`); "economy" applies to users over their budget
+DEFAULT_POLICIES: Dict[str, ContextPolicy] = {
+    "new": ContextPolicy("new", 4, 6000, 600),
+    "discovery": ContextPolicy("discovery", 10, 8000, 600),
+    "qualifying": ContextPolicy("qualifying", 16, 10000, 800),
+    "closing": ContextPolicy("closing", 24, 12000, 800),
+    "economy": ContextPolicy("economy", 8, 5000, 400),
+}
+
+
+def parse_policies(overrides: str) -> Dict[str, ContextPolicy]:
+    """
+    DEFAULT_POLICIES updated from a JSON object such as
+    '{"closing": {"last_messages": 30}, "economy": {"max_completion_tokens": 300}}'.
+    A malformed value is logged and ignored.
+    """
+    policies = dict(DEFAULT_POLICIES)
+    if not overrides:
+        return policies
+    try:
+        for name, fields in json.loads(overrides).items():
+            base = policies.get(name, ContextPolicy(name, None, None, None))
+            policies[name] = base._replace(**{k: (int(v) if v else None) for k, v in fields.items()})
+    except (ValueError, TypeError, AttributeError) as e:
+        logger.error("Invalid CONTEXT_POLICIES, using the defaults: %s", e)
+        return dict(DEFAULT_POLICIES)
+    return policies
+
+
+class ContextBudget:
+    """
+    Bounds what each assistant turn sends to the model. The policy of a turn is
+    picked by conversation stage: a first message needs little history, while a
+    turn closing a lead needs the details given along the conversation. Users over
+    their daily budget get the "economy" policy.
+
+    `observe` keeps the prompt and completion token distributions per policy
+    (`run_prompt_tokens` / `run_completion_tokens`); with the budget disabled turns
+    are recorded under "unbounded", so both settings can be compared.
+    """
+
+    def __init__(self, policies: Dict[str, ContextPolicy], enabled: bool = True):
+        self.policies = policies
+        self.enabled = enabled
+
+    def select(self, stage: str, economy: bool = False) -> ContextPolicy:
+        if not self.enabled:
+            return UNBOUNDED
+        if economy and "economy" in self.policies:
+            return self.policies["economy"]
+        return self.policies.get(stage, UNBOUNDED)
+
+    def observe(self, policy: Optional[ContextPolicy], prompt_tokens: int, completion_tokens: int):
+        name = policy.name if policy is not None else UNBOUNDED.name
+        metrics.observe("run_prompt_tokens", prompt_tokens, policy=name)
+        metrics.observe("run_completion_tokens", completion_tokens, policy=name)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "policies": {name: policy._asdict() for name, policy in self.policies.items()},
+        }
+
+
+settings = get_settings()
+context_budget = ContextBudget(parse_policies(settings.CONTEXT_POLICIES), enabled=settings.CONTEXT_BUDGET_ENABLED)
+metrics.register_collector("context_budget", context_budget.stats)
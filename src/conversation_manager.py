@@ -1,5 +1,5 @@
 import logging
-from typing import Dict, Optional
+from typing import Any, Dict, List, Optional
 
 logger = logging.getLogger(__name__)
 
@@ -12,9 +12,16 @@ class ConversationManager:
     consider using a database (like MongoDB) to persist these mappings,
     especially if your App Engine instances might scale or restart.
     """
+    # Upper bound of locally stored chat messages per user (engines without server-side threads)
+    MAX_HISTORY_MESSAGES = 40
+
     def __init__(self):
         # Simple in-memory dictionary to store user_id -> thread_id mappings
         self._thread_map: Dict[str, str] = {}
+        # user_id -> list of Chat Completions messages, used by the local-history engine
+        self._history_map: Dict[str, List[Dict[str, Any]]] = {}
+        # user_id -> lead fields extracted locally from the user's messages (see lead_extraction.py)
+        self._lead_drafts: Dict[str, Dict[str, Any]] = {}
         logger.info("ConversationManager initialized (in-memory storage).")
 
     def get_thread_id(self, user_id: str) -> Optional[str]:
@@ -29,9 +36,9 @@ class ConversationManager:
         """
         thread_id = self._thread_map.get(user_id)
         if thread_id:
-            logger.debug(f"Found existing thread_id {thread_id} for user_id {user_id}")
+            logger.debug("Found existing thread_id %s for user_id %s", thread_id, user_id)
         else:
-            logger.debug(f"No thread_id found for user_id {user_id}")
+            logger.debug("No thread_id found for user_id %s", user_id)
         return thread_id
 
     def add_thread(self, user_id: str, thread_id: str):
@@ -43,9 +50,10 @@ class ConversationManager:
             thread_id: The OpenAI Thread ID to associate with the user.
         """
         if user_id in self._thread_map:
-             logger.warning(f"Overwriting existing thread_id {self._thread_map[user_id]} for user_id {user_id} with new thread_id {thread_id}")
+             logger.warning("Overwriting existing thread_id %s for user_id %s with new thread_id %s",
+                            self._thread_map[user_id], user_id, thread_id)
         self._thread_map[user_id] = thread_id
-        logger.info(f"Associated thread_id {thread_id} with user_id {user_id}")
+        logger.info("Associated thread_id %s with user_id %s", thread_id, user_id)
 
     def remove_thread(self, user_id: str):
         """
@@ -56,9 +64,101 @@ class ConversationManager:
         """
         if user_id in self._thread_map:
             removed_thread_id = self._thread_map.pop(user_id)
-            logger.info(f"Removed thread mapping for user_id {user_id} (was thread_id {removed_thread_id})")
+            logger.info("Removed thread mapping for user_id %s (was thread_id %s)", user_id, removed_thread_id)
         else:
-            logger.debug(f"Attempted to remove thread mapping for user_id {user_id}, but none existed.")
+            logger.debug("Attempted to remove thread mapping for user_id %s, but none existed.", user_id)
+
+    def thread_ids(self) -> List[str]:
+        """
+        Returns all Thread IDs currently mapped to a user.
+        """
+        return list(self._thread_map.values())
+
+    def get_history(self, user_id: str) -> List[Dict[str, Any]]:
+        """
+        Returns a copy of the locally stored chat history for a user.
+
+        Args:
+            user_id: The unique identifier for the user.
+
+        Returns:
+            A list of Chat Completions style messages (oldest first).
+        """
+        return list(self._history_map.get(user_id, []))
+
+    def append_history(self, user_id: str, messages: List[Dict[str, Any]]):
+        """
+        Appends messages to a user's local chat history, keeping at most
+        MAX_HISTORY_MESSAGES. Trimming never starts the history with a tool
+        result, whose matching assistant tool call would be gone.
+
+        Args:
+            user_id: The unique identifier for the user.
+            messages: Chat Completions style messages to append.
+        """
+        history = self._history_map.setdefault(user_id, [])
+        history.extend(messages)
+        overflow = len(history) - self.MAX_HISTORY_MESSAGES
+        if overflow > 0:
+            del history[:overflow]
+            while history and history[0].get("role") != "user":
+                history.pop(0)
+
+    def clear_history(self, user_id: str):
+        """
+        Forgets the local chat history of a user.
+
+        Args:
+            user_id: The unique identifier for the user.
+        """
+        self._history_map.pop(user_id, None)
+
+    def get_lead_draft(self, user_id: str) -> Dict[str, Any]:
+        """
+        Returns a copy of the lead fields gathered so far for a user.
+
+        Args:
+            user_id: The unique identifier for the user.
+        """
+        return dict(self._lead_drafts.get(user_id, {}))
+
+    def merge_lead_draft(self, user_id: str, fields: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Merges newly extracted lead fields into the user's draft (newer values win).
+
+        Args:
+            user_id: The unique identifier for the user.
+            fields: JSON-serializable field values.
+
+        Returns:
+            The fields whose value changed.
+        """
+        draft = self._lead_drafts.setdefault(user_id, {})
+        changed = {k: v for k, v in fields.items() if draft.get(k) != v}
+        draft.update(changed)
+        return changed
+
+    def export_state(self) -> Dict[str, Any]:
+        """
+        Returns the thread map, local histories and lead drafts as JSON-serializable data (warm-start snapshot).
+        """
+        return {"threads": self._thread_map, "histories": self._history_map, "lead_drafts": self._lead_drafts}
+
+    def import_state(self, state: Dict[str, Any]):
+        """
+        Merges a snapshot produced by `export_state`. Mappings created since startup win.
+
+        Args:
+            state: The data returned by `export_state`.
+        """
+        for user_id, thread_id in (state.get("threads") or {}).items():
+            self._thread_map.setdefault(user_id, thread_id)
+        for user_id, history in (state.get("histories") or {}).items():
+            self._history_map.setdefault(user_id, history[-self.MAX_HISTORY_MESSAGES:])
+        for user_id, draft in (state.get("lead_drafts") or {}).items():
+            for field, value in draft.items():
+                self._lead_drafts.setdefault(user_id, {}).setdefault(field, value)
+        logger.info("Restored conversation state: %d threads, %d histories", len(self._thread_map), len(self._history_map))
 
     # You might add methods to load/save from DB later if needed
     # async def load_from_db(self, db_client): ...
@@ -0,0 +1,87 @@
+import re
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from ..db import get_db
+from .hooks import contact_written
+
+logger = logging.getLogger(__name__)
+
+
+async def ensure_contact_indexes(db):
+    """Indexes of the contacts collection, created once at startup."""
+    await db.contacts.create_index("added_on")    # Dashboard and API listings
+    await db.contacts.create_index("updated_at")  # Change token of the dashboard cache (render_cache.py)
+    # One contact per WhatsApp number, also when two messages of a new sender are saved at once
+    await db.contacts.create_index("phone_key", unique=True, sparse=True)
+
+
+def phone_key(phone: str) -> str:
+    """Normalized phone number (digits only), the unique key of contacts saved by `upsert_contact_by_phone`."""
+    return re.sub(r"\D", "", phone or "")
+
+
+def phone_variants(wa_id: str) -> list:
+    """Stored forms of a WhatsApp ID: '34600112233' and '+34600112233'."""
+    digits = wa_id.lstrip("+")
+    return [digits, f"+{digits}"]
+
+
+async def upsert_contact_by_phone(wa_id: str, fields: Dict[str, Any], name: Optional[str] = None,
+                                  source: str = "whatsapp") -> Optional[Dict[str, Any]]:
+    """
+    Sets `fields` on the contact with this WhatsApp phone number, creating the contact
+    (named after the WhatsApp profile) when there is none yet. Notifies the contact
+    listeners (with the document as it was before the update) and returns the stored document.
+
+    A `name` (given or in `fields`) names a new contact; an existing contact only gets
+    it while it still has the "WhatsApp <id>" placeholder, so names entered in the CRM
+    are kept.
+    """
+    fields = {k: v for k, v in fields.items() if v not in (None, "")}
+    name = fields.pop("name", None) or name
+    if not fields and not name:
+        return None
+    db = await get_db()
+    now = datetime.now(timezone.utc)
+    key = phone_key(wa_id)
+    placeholder = f"WhatsApp {wa_id}"
+    update = {
+        "$set": {**fields, "phone_key": key, "updated_at": now},
+        "$setOnInsert": {
+            k: v for k, v in {
+                "name": name or placeholder,
+                "phone": wa_id,
+                "source": source,
+                "added_on": now,
+            }.items() if k not in fields  # A path may not be in both $set and $setOnInsert
+        },
+    }
+    query = {"$or": [{"phone_key": key}, {"phone": {"$in": phone_variants(wa_id)}}]}
+    try:
+        previous = await _find_and_upsert(db, query, update)
+    except DuplicateKeyError:
+        # A concurrent call inserted the contact first (unique `phone_key`): update that one
+        previous = await _find_and_upsert(db, query, update)
+    created = previous is None
+    if not created and name and previous.get("name") in (None, "", placeholder):
+        await db.contacts.update_one(
+            {"_id": previous["_id"], "name": previous.get("name")}, {"$set": {"name": name, "updated_at": now}}
+        )
+    contact = await db.contacts.find_one({"phone_key": key} if created else {"_id": previous["_id"]})
+    if contact is not None:
+        logger.info("%s contact %s (%s)", "Created" if created else "Updated", contact["_id"], ", ".join(sorted(fields)))
+        await contact_written(contact, created=created, previous=previous)
+    return contact
+
+
+async def _find_and_upsert(db, query: Dict[str, Any], update: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Applies `update` to the matching contact (or inserts one) and returns the document before the write."""
+    return await db.contacts.find_one_and_update(
+        query, update, upsert=True, return_document=ReturnDocument.BEFORE,
+        sort=[("phone_key", -1)],  # Prefer the keyed contact over older duplicates without `phone_key`
+    )
@@ -25,7 +25,7 @@ else:
         # Example: Get a reference to a collection named 'contacts'
         contact_collection = db.get_collection("contacts")
     except Exception as e:
-        logger.error(f"Failed to connect to MongoDB: {e}")
+        logger.error("Failed to connect to MongoDB: %s", e)
         client = None
         db = None
         contact_collection = None # Ensure it's None if connection fails
@@ -0,0 +1,36 @@
+import logging
+import inspect
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+ContactListener = Callable[[Dict[str, Any], bool, Optional[Dict[str, Any]]], Union[None, Awaitable[None]]]
+
+_listeners: List[ContactListener] = []
+
+
+def on_contact_written(listener: ContactListener) -> ContactListener:
+    """
+    Registers `listener(contact, created, previous)` to be called after every contact
+    write made by this process (dashboard form, assistant tool, lead capture). Usable
+    as a decorator.
+    """
+    _listeners.append(listener)
+    return listener
+
+
+async def contact_written(contact: Dict[str, Any], created: bool = True,
+                          previous: Optional[Dict[str, Any]] = None):
+    """
+    Notifies the registered listeners of a contact insert (`created=True`) or update.
+    `contact` is the document as stored, including `_id`; for updates `previous` is the
+    document before the write, when the writer has it. Listener errors are logged and
+    never propagate to the write path.
+    """
+    for listener in _listeners:
+        try:
+            result = listener(contact, created, previous)
+            if inspect.isawaitable(result):
+                await result
+        except Exception as e:
+            logger.error("Contact listener %s failed: %s", getattr(listener, "__name__", listener), e, exc_info=True)
@@ -0,0 +1,122 @@
+import json
+import asyncio
+import logging
+from typing import Any, Dict, Optional, Set
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from ..db import get_db
+from ..metrics import metrics
+from .hooks import on_contact_written
+
+logger = logging.getLogger(__name__)
+
+
+def _contact_event(contact: Dict[str, Any], created: bool) -> str:
+    """Formats a contact as one Server-Sent Event (`id:` is the contact ID)."""
+    data = json.dumps({"created": created, "contact": contact}, default=str, separators=(",", ":"))
+    return f"id: {contact.get('_id', '')}\nevent: contact\ndata: {data}\n\n"
+
+
+class ContactBroker:
+    """
+    Fans out contact inserts/updates to the connected dashboards (Server-Sent Events).
+
+    The source is a MongoDB change stream on `contacts`, which also sees the writes
+    of other workers and instances. Where change streams are unavailable (standalone
+    servers) or while the stream is down, the broker falls back to the in-process
+    `contact_written` hook, which only sees the writes made by this same worker; the
+    stream is reopened with exponential backoff (up to RETRY_MAX_SECONDS) as long as
+    there are subscribers. Each subscriber has a bounded queue; a client that does
+    not keep up is disconnected instead of buffering without limit.
+    """
+    QUEUE_SIZE = 100
+    RETRY_MIN_SECONDS = 1
+    RETRY_MAX_SECONDS = 300
+
+    def __init__(self):
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._watch_task: Optional[asyncio.Task] = None
+        self.change_stream_active = False
+        self._stream_opens = 0
+
+    def subscribe(self) -> asyncio.Queue:
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.QUEUE_SIZE)
+        self._subscribers.add(queue)
+        metrics.set_gauge("crm_live_subscribers", len(self._subscribers))
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue):
+        self._subscribers.discard(queue)
+        metrics.set_gauge("crm_live_subscribers", len(self._subscribers))
+
+    def publish(self, contact: Dict[str, Any], created: bool):
+        if not self._subscribers:
+            return
+        event = _contact_event(contact, created)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(event)
+            except asyncio.QueueFull:
+                logger.warning("Dropping a slow CRM live subscriber")
+                self.unsubscribe(queue)  # Its stream ends at the next keep-alive check
+
+    def is_subscribed(self, queue: asyncio.Queue) -> bool:
+        return queue in self._subscribers
+
+    async def on_local_write(self, contact: Dict[str, Any], created: bool, previous: Optional[Dict[str, Any]] = None):
+        # Writes are delivered by the change stream when it runs; this is the fallback
+        if not self.change_stream_active:
+            self.publish(contact, created)
+
+    async def _watch(self):
+        delay = self.RETRY_MIN_SECONDS
+        while self._subscribers:
+            opened = self._stream_opens
+            try:
+                await self._watch_once()
+                logger.warning("CRM live updates: change stream closed; using in-process events until it reopens.")
+            except asyncio.CancelledError:
+                raise
+            except OperationFailure as e:
+                # E.g. code 40573: change streams need a replica set
+                logger.info("CRM live updates: change streams unavailable (%s); using in-process events.", e)
+            except (PyMongoError, ValueError, RuntimeError) as e:
+                logger.error("CRM live updates: change stream stopped: %s; using in-process events.", e)
+            if self._stream_opens != opened:
+                delay = self.RETRY_MIN_SECONDS  # The stream was up: start the backoff over
+            metrics.inc("crm_live_stream_retries")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, self.RETRY_MAX_SECONDS)
+
+    async def _watch_once(self):
+        try:
+            db = await get_db()
+            async with db.contacts.watch(
+                [{"$match": {"operationType": {"$in": ["insert", "update", "replace"]}}}],
+                full_document="updateLookup",
+            ) as stream:
+                self.change_stream_active = True
+                self._stream_opens += 1
+                logger.info("CRM live updates: using MongoDB change stream.")
+                async for change in stream:
+                    document = change.get("fullDocument")
+                    if document is not None:
+                        self.publish(document, change["operationType"] == "insert")
+        finally:
+            self.change_stream_active = False
+
+    async def stop(self):
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            try:
+                await self._watch_task
+            except asyncio.CancelledError:
+                pass
+            self._watch_task = None
+
+
+contact_broker = ContactBroker()
+on_contact_written(contact_broker.on_local_write)
@@ -0,0 +1,81 @@
+import hashlib
+import logging
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ChangeToken(NamedTuple):
+    etag: str                          # Quoted strong ETag
+    last_modified: Optional[datetime]  # Newest `updated_at`, UTC
+
+
+class CachedPage(NamedTuple):
+    etag: str
+    body: bytes
+
+
+class DashboardRenderCache:
+    """
+    Keeps the last rendered CRM dashboard per base URL, keyed on a change token of
+    the contacts collection: the (metadata based) document count and the newest
+    `updated_at`, which every contact write sets. Both are shared by all workers, so
+    an update made anywhere changes the token. Computing it costs two cheap queries
+    (the second uses the `updated_at` index), instead of loading, validating and
+    rendering up to 100 contacts.
+    """
+
+    def __init__(self):
+        self._pages: Dict[str, CachedPage] = {}
+
+    async def change_token(self, database) -> ChangeToken:
+        count = await database.contacts.estimated_document_count()
+        newest = await database.contacts.find_one({}, {"updated_at": 1}, sort=[("updated_at", -1)])
+        last_modified = newest.get("updated_at") if newest else None
+        if isinstance(last_modified, datetime):
+            last_modified = _as_utc(last_modified)
+        else:
+            last_modified = None
+        raw = f"{count}|{last_modified.isoformat() if last_modified else ''}"
+        return ChangeToken('"' + hashlib.sha1(raw.encode()).hexdigest()[:20] + '"', last_modified)
+
+    def get(self, base_url: str, token: ChangeToken) -> Optional[bytes]:
+        page = self._pages.get(base_url)
+        return page.body if page is not None and page.etag == token.etag else None
+
+    def put(self, base_url: str, token: ChangeToken, body: bytes):
+        self._pages[base_url] = CachedPage(token.etag, body)
+
+
+def _as_utc(value: datetime) -> datetime:
+    # Mongo returns naive UTC datetimes unless the client is tz_aware
+    return value.replace(tzinfo=timezone.utc) if value.tzinfo is None else value.astimezone(timezone.utc)
+
+
+def is_not_modified(headers, token: ChangeToken) -> bool:
+    """Evaluates If-None-Match (preferred) or If-Modified-Since against the current token."""
+    if_none_match = headers.get("if-none-match")
+    if if_none_match is not None:
+        candidates = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return token.etag in candidates or "*" in candidates
+    if_modified_since = headers.get("if-modified-since")
+    if if_modified_since and token.last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return token.last_modified.replace(microsecond=0) <= _as_utc(since)
+    return False
+
+
+def cache_headers(token: ChangeToken) -> Dict[str, str]:
+    # no-cache: browsers keep the page but revalidate it on every load (answered with 304)
+    headers = {"ETag": token.etag, "Cache-Control": "no-cache"}
+    if token.last_modified is not None:
+        headers["Last-Modified"] = format_datetime(token.last_modified, usegmt=True)
+    return headers
+
+
+dashboard_cache = DashboardRenderCache()
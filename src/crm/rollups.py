@@ -0,0 +1,114 @@
+import logging
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+import pytz
+
+from ..db import get_db
+from .hooks import on_contact_written
+
+logger = logging.getLogger(__name__)
+
+ROLLUP_COLLECTION = "crm_rollups"
+ROLLUP_ID = "contacts"
+REPORT_TZ = pytz.timezone("Europe/Madrid")
+
+# Rollup field -> contact field
+DIMENSIONS = {
+    "by_plan": "plan_interest",
+    "by_event_type": "event_type",
+    "by_source": "source",
+}
+
+
+def _bucket_key(value: Any) -> str:
+    """Map key for a dimension value ('.' and a leading '$' are not allowed in Mongo field names)."""
+    text = str(value).strip() if value is not None else ""
+    if not text:
+        return "unknown"
+    return text.replace(".", "_").lstrip("$") or "unknown"
+
+
+def _day_key(added_on: Optional[datetime]) -> str:
+    if not isinstance(added_on, datetime):
+        added_on = datetime.now(timezone.utc)
+    elif added_on.tzinfo is None:
+        added_on = added_on.replace(tzinfo=timezone.utc)  # Stored naive datetimes are UTC
+    return added_on.astimezone(REPORT_TZ).date().isoformat()
+
+
+@on_contact_written
+async def count_contact(contact: Dict[str, Any], created: bool, previous: Optional[Dict[str, Any]] = None):
+    """
+    Updates the rollup counters with one upsert of $inc, no reads. A new contact is
+    counted once; an update moves the contact from its previous bucket to its new one
+    in every dimension that changed. Updates without the `previous` document cannot
+    be placed and are left to `rebuild_rollups`.
+    """
+    if created:
+        increments = {"total": 1, f"by_day.{_day_key(contact.get('added_on'))}": 1}
+        for rollup_field, contact_field in DIMENSIONS.items():
+            increments[f"{rollup_field}.{_bucket_key(contact.get(contact_field))}"] = 1
+    elif previous is not None:
+        increments = {}
+        for rollup_field, contact_field in DIMENSIONS.items():
+            old_key = _bucket_key(previous.get(contact_field))
+            new_key = _bucket_key(contact.get(contact_field))
+            if old_key != new_key:
+                increments[f"{rollup_field}.{old_key}"] = -1
+                increments[f"{rollup_field}.{new_key}"] = 1
+        if not increments:
+            return
+    else:
+        return
+    db = await get_db()
+    await db[ROLLUP_COLLECTION].update_one(
+        {"_id": ROLLUP_ID},
+        {"$inc": increments, "$set": {"updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def read_rollups(database) -> Dict[str, Any]:
+    """Returns the lead counters (a single document read)."""
+    doc = await database[ROLLUP_COLLECTION].find_one({"_id": ROLLUP_ID}) or {}
+    return {
+        "total": doc.get("total", 0),
+        "by_day": dict(sorted((doc.get("by_day") or {}).items())),
+        **{field: doc.get(field) or {} for field in DIMENSIONS},
+        "updated_at": doc.get("updated_at"),
+        "rebuilt_at": doc.get("rebuilt_at"),
+    }
+
+
+async def rebuild_rollups(database) -> Dict[str, Any]:
+    """
+    Recomputes all counters from the contacts collection with one aggregation (backfills,
+    or after bulk imports and edits) and replaces the rollup document.
+    """
+    def group_by(expression) -> list:
+        return [{"$group": {"_id": expression, "count": {"$sum": 1}}}]
+
+    facets = {
+        "total": [{"$count": "count"}],
+        "by_day": group_by({"$dateToString": {
+            "format": "%Y-%m-%d", "date": {"$ifNull": ["$added_on", "$$NOW"]}, "timezone": REPORT_TZ.zone,
+        }}),
+        **{rollup_field: group_by(f"${contact_field}") for rollup_field, contact_field in DIMENSIONS.items()},
+    }
+    result = await database.contacts.aggregate([{"$facet": facets}]).to_list(length=1)
+    result = result[0] if result else {}
+
+    doc: Dict[str, Any] = {"_id": ROLLUP_ID, "total": (result.get("total") or [{"count": 0}])[0]["count"]}
+    doc["by_day"] = {row["_id"]: row["count"] for row in result.get("by_day", [])}
+    for rollup_field in DIMENSIONS:
+        counts: Dict[str, int] = {}
+        for row in result.get(rollup_field, []):
+            key = _bucket_key(row["_id"])
+            counts[key] = counts.get(key, 0) + row["count"]
+        doc[rollup_field] = counts
+    now = datetime.now(timezone.utc)
+    doc["updated_at"] = doc["rebuilt_at"] = now
+    await database[ROLLUP_COLLECTION].replace_one({"_id": ROLLUP_ID}, doc, upsert=True)
+    logger.info("Rebuilt CRM rollups from %d contacts", doc["total"])
+    return doc
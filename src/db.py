@@ -27,14 +27,14 @@ async def get_db() -> motor.motor_asyncio.AsyncIOMotorDatabase:
             db_name = settings.MONGODB_CONNECTION_STRING.split('/')[-1].split('?')[0]
             if not db_name: # Default if parsing fails or not specified
                 db_name = "eventek"
-                logger.warning(f"Database name not found in connection string, defaulting to '{db_name}'.")
+                logger.warning("Database name not found in connection string, defaulting to '%s'.", db_name)
 
             db = client[db_name] # Get the database object
             # You can optionally add a check here to ensure connection works, e.g., client.admin.command('ping')
             await client.admin.command('ping') # Verify connection
-            logger.info(f"Successfully connected to MongoDB database: '{db_name}'")
+            logger.info("Successfully connected to MongoDB database: '%s'", db_name)
         except Exception as e:
-            logger.exception(f"Failed to connect to MongoDB: {e}")
+            logger.exception("Failed to connect to MongoDB: %s", e)
             # Reset globals on failure
             client = None
             db = None
@@ -0,0 +1,26 @@
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, Optional
+
+
+class LLMEngine(ABC):
+    """
+    Backend that turns a user message into an assistant reply.
+
+    `CourseAssistant` owns the conversation store, the OpenAI client and the
+    tool implementations; an engine only decides how a turn is executed against
+    the model (server-side threads, local history, ...).
+    """
+    name = "base"
+
+    @abstractmethod
+    async def process_message(self, user_id: str, message: str) -> Optional[str]:
+        """Runs one conversation turn and returns the full reply text."""
+
+    async def stream_message(self, user_id: str, message: str) -> AsyncIterator[str]:
+        """
+        Runs one conversation turn yielding the reply as text deltas.
+        Engines without native streaming yield the whole reply at once.
+        """
+        reply = await self.process_message(user_id, message)
+        if reply:
+            yield reply
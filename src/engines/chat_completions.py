@@ -0,0 +1,219 @@
+import time
+import logging
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from openai import AsyncOpenAI
+import pytz
+
+from ..context_budget import UNBOUNDED, ContextBudget, ContextPolicy
+from ..conversation_manager import ConversationManager
+from ..knowledge import KnowledgeBase
+from ..lead_extraction import lead_instructions
+from ..metrics import metrics
+from ..model_router import ModelRouter, conversation_stage
+from ..services.usage_ledger import NORMAL, usage_ledger
+from ..tools import ToolRegistry
+from .base import LLMEngine
+
+logger = logging.getLogger("eventek_assistant.engines.chat")
+
+LOCAL_KNOWLEDGE_NOTE = """
+### CONOCIMIENTO DISPONIBLE
+En esta conversación la herramienta `file_search` NO está disponible. La información relevante de Eventek
+se incluye a continuación en la sección CONTEXTO; úsala como si fuera el resultado de `file_search`.
+Si la respuesta no está en el CONTEXTO, dilo en lugar de inventarla.
+"""
+SPAIN_TZ = pytz.timezone("Europe/Madrid")
+
+
+def current_date_note() -> str:
+    """Date line added to every turn (kept out of the instructions so a long-lived prompt never goes stale)."""
+    return f"La fecha actual es {datetime.now(SPAIN_TZ).strftime('%Y-%m-%d')}."
+
+
+class ChatCompletionsEngine(LLMEngine):
+    """
+    Engine that keeps the conversation history locally (in the ConversationManager)
+    and runs each turn as a single streamed Chat Completions call.
+
+    Knowledge is injected by local retrieval instead of `file_search`, so a plain
+    turn costs exactly one API call. When the model requests a tool, the tool is
+    executed locally and one more streamed call produces the final answer; after
+    MAX_TOOL_ROUNDS the last call may not request tools, so every turn ends with
+    an answer.
+    """
+    name = "chat_completions"
+    MAX_TOOL_ROUNDS = 3
+
+    def __init__(
+        self,
+        client: AsyncOpenAI,
+        conversation_manager: ConversationManager,
+        tools: ToolRegistry,
+        instructions: str,
+        knowledge_base: KnowledgeBase,
+        model: str = "gpt-4-turbo",
+        top_k: int = 3,
+        model_router: Optional[ModelRouter] = None,
+        context_budget: Optional[ContextBudget] = None,
+    ):
+        self.client = client
+        self.conversation_manager = conversation_manager
+        self.tools = tools
+        self.instructions = instructions + LOCAL_KNOWLEDGE_NOTE
+        self.knowledge_base = knowledge_base
+        self.model = model
+        self.top_k = top_k
+        self.model_router = model_router
+        self.context_budget = context_budget
+
+    def set_instructions(self, instructions: str):
+        """Replaces the system instructions; turns already running keep the previous ones."""
+        self.instructions = instructions + LOCAL_KNOWLEDGE_NOTE
+
+    async def _system_message(self, user_id: str, message: str) -> Dict[str, Any]:
+        context = await self.knowledge_base.abuild_context(message, top_k=self.top_k)
+        content = f"{self.instructions}\n{current_date_note()}\n"
+        if context:
+            content += f"\n### CONTEXTO\n{context}\n"
+        lead_note = lead_instructions(self.conversation_manager.get_lead_draft(user_id))
+        if lead_note:
+            content += f"\n{lead_note}\n"
+        return {"role": "system", "content": content}
+
+    async def _stream_completion(
+        self, model: str, messages: List[Dict[str, Any]], text_parts: List[str],
+        tool_calls_out: List[Dict[str, Any]], usage_out: List[Any], max_completion_tokens: Optional[int] = None,
+        allow_tools: bool = True,
+    ) -> AsyncIterator[str]:
+        """
+        Streams one Chat Completions call, yielding text deltas. Text is also
+        collected into `text_parts`; tool call fragments are assembled and
+        appended to `tool_calls_out` once the stream ends, and the token usage
+        to `usage_out`. A reply cut at `max_completion_tokens` is counted in
+        `runs_incomplete`, like an incomplete Assistants run.
+        """
+        tool_calls: Dict[int, Dict[str, Any]] = {}
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            tools=self.tools.definitions(),
+            stream=True,
+            stream_options={"include_usage": True},
+            **({"max_completion_tokens": max_completion_tokens} if max_completion_tokens else {}),
+            **({} if allow_tools else {"tool_choice": "none"}),
+        )
+        async for chunk in stream:
+            if chunk.usage:
+                usage_out.append(chunk.usage)
+            if not chunk.choices:
+                continue
+            if chunk.choices[0].finish_reason == "length":
+                reason = "max_completion_tokens" if max_completion_tokens else "length"
+                metrics.inc("runs_incomplete", reason=reason)
+                logger.warning("Chat Completions reply stopped early (%s); keeping the text generated so far", reason)
+            delta = chunk.choices[0].delta
+            if delta.content:
+                text_parts.append(delta.content)
+                yield delta.content
+            for tc_delta in delta.tool_calls or []:
+                call = tool_calls.setdefault(tc_delta.index, {"id": None, "name": "", "arguments": ""})
+                if tc_delta.id:
+                    call["id"] = tc_delta.id
+                if tc_delta.function:
+                    if tc_delta.function.name:
+                        call["name"] += tc_delta.function.name
+                    if tc_delta.function.arguments:
+                        call["arguments"] += tc_delta.function.arguments
+        tool_calls_out.extend(tool_calls[i] for i in sorted(tool_calls))
+
+    async def _run_tool_calls(self, user_id: str, tool_calls: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        for call in tool_calls:
+            logger.info("Tool call requested: %s ID: %s", call["name"], call["id"])
+        outputs = await self.tools.dispatch_many(
+            [(c["id"], c["name"], c["arguments"]) for c in tool_calls], user_id=user_id
+        )
+        return [{"role": "tool", "tool_call_id": o["tool_call_id"], "content": o["output"]} for o in outputs]
+
+    def _plan_turn(self, user_id: str, message: str, history: List[Dict[str, Any]]) -> Tuple[str, ContextPolicy]:
+        """Model and context policy of this turn, by conversation stage and the user's budget."""
+        stage = conversation_stage(self.conversation_manager.get_lead_draft(user_id), is_new=not history)
+        economy = usage_ledger.mode(user_id) != NORMAL
+        model = self.model
+        if self.model_router is not None:
+            model = self.model_router.choose(message, stage, economy=economy).model or self.model
+        policy = self.context_budget.select(stage, economy) if self.context_budget is not None else UNBOUNDED
+        return model, policy
+
+    async def stream_message(self, user_id: str, message: str) -> AsyncIterator[str]:
+        history = self.conversation_manager.get_history(user_id)
+        system_message = await self._system_message(user_id, message)
+        new_messages: List[Dict[str, Any]] = [{"role": "user", "content": message}]
+        model, policy = self._plan_turn(user_id, message, history)
+        # Only the policy's window of the history is sent; the full history is still stored
+        context = policy.trim(history)
+        usage: List[Any] = []
+        start = time.perf_counter()
+
+        try:
+            for round_number in range(self.MAX_TOOL_ROUNDS + 1):
+                allow_tools = round_number < self.MAX_TOOL_ROUNDS
+                if not allow_tools:
+                    logger.warning("Tool call limit (%d) reached for user %s; answering without tools.",
+                                   self.MAX_TOOL_ROUNDS, user_id)
+                text_parts: List[str] = []
+                tool_calls: List[Dict[str, Any]] = []
+                async for delta in self._stream_completion(
+                    model, [system_message] + context + new_messages, text_parts, tool_calls, usage,
+                    max_completion_tokens=policy.max_completion_tokens, allow_tools=allow_tools,
+                ):
+                    yield delta
+                text = "".join(text_parts)
+
+                if not tool_calls:
+                    new_messages.append({"role": "assistant", "content": text})
+                    return
+
+                new_messages.append({
+                    "role": "assistant",
+                    "content": text or None,
+                    "tool_calls": [
+                        {"id": c["id"], "type": "function", "function": {"name": c["name"], "arguments": c["arguments"]}}
+                        for c in tool_calls
+                    ],
+                })
+                new_messages.extend(await self._run_tool_calls(user_id, tool_calls))
+        finally:
+            # Also on errors and when the consumer stops early: the tokens were spent either way
+            self._finish_turn(user_id, model, policy, new_messages, usage, start)
+
+    def _finish_turn(self, user_id: str, model: str, policy: ContextPolicy, new_messages: List[Dict[str, Any]],
+                     usage: List[Any], start: float):
+        """Stores the turn in the local history and records its token usage."""
+        if new_messages[-1].get("tool_calls"):
+            new_messages.pop()  # Its tool results are missing; the API rejects such a history
+        self.conversation_manager.append_history(user_id, new_messages)
+        if not usage:
+            return
+        prompt_tokens = sum(u.prompt_tokens for u in usage)
+        completion_tokens = sum(u.completion_tokens for u in usage)
+        if self.model_router is not None:
+            self.model_router.record(model, (time.perf_counter() - start) * 1000,
+                                     prompt_tokens=prompt_tokens, completion_tokens=completion_tokens)
+        if self.context_budget is not None:
+            self.context_budget.observe(policy, prompt_tokens, completion_tokens)
+        usage_ledger.record(user_id, model, prompt_tokens, completion_tokens)
+
+    async def process_message(self, user_id: str, message: str) -> Optional[str]:
+        try:
+            logger.info("Processing message from %s with Chat Completions engine (%d chars)", user_id, len(message))
+            parts = [delta async for delta in self.stream_message(user_id, message)]
+            reply = "".join(parts).strip()
+            if not reply:
+                logger.warning("Chat Completions turn for %s produced no text.", user_id)
+                return "Procesamiento completado, pero no encontré una respuesta final."
+            return reply
+        except Exception as e:
+            logger.error("Error in ChatCompletionsEngine.process_message: %s", e, exc_info=True)
+            return "Lo siento, ha ocurrido un error general. ¿Podrías reformular tu pregunta?"
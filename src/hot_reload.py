@@ -0,0 +1,169 @@
+import os
+import socket
+import asyncio
+import logging
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from pymongo.errors import DuplicateKeyError
+
+from .config import get_settings
+from .db import get_db
+from .knowledge import knowledge_fingerprint
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.hot_reload")
+
+
+class AssistantSync:
+    """
+    Makes an update of the OpenAI assistant happen once across all workers.
+
+    The `assistant_sync` collection keeps, per assistant, the digest of what was last
+    pushed for each key ("instructions", "files"). A worker pushes only after it moved
+    the stored digest to the new value; the other workers find it already there and
+    skip the API calls.
+    """
+    COLLECTION = "assistant_sync"
+
+    async def claim(self, assistant_id: str, key: str, digest: str) -> Tuple[bool, Optional[str]]:
+        """
+        Returns (True, previous digest) when this worker must push `digest`, (False, digest)
+        when it is already pushed or being pushed. Without a database every worker pushes.
+        """
+        try:
+            db = await get_db()
+            previous = await db[self.COLLECTION].find_one_and_update(
+                {"_id": assistant_id, key: {"$ne": digest}},
+                {"$set": {key: digest, f"{key}_updated_at": datetime.now(timezone.utc),
+                          f"{key}_updated_by": f"{socket.gethostname()}-{os.getpid()}"}},
+                upsert=True,
+            )
+        except DuplicateKeyError:
+            return False, digest  # The document exists with this digest already
+        except Exception as e:
+            logger.warning("Assistant sync unavailable, pushing without coordination: %s", e)
+            return True, None
+        return True, (previous or {}).get(key)
+
+    async def release(self, assistant_id: str, key: str, digest: str, previous: Optional[str]):
+        """Reverts a claim whose push failed, so the next check retries it."""
+        try:
+            db = await get_db()
+            await db[self.COLLECTION].update_one({"_id": assistant_id, key: digest}, {"$set": {key: previous}})
+        except Exception as e:
+            logger.warning("Could not release assistant sync claim '%s': %s", key, e)
+
+
+class ReloadTarget:
+    """A piece of in-memory state rebuilt from `paths` when their contents change."""
+
+    def __init__(self, name: str, paths: List[str], reload: Callable[[], Any]):
+        self.name = name
+        self.paths = list(paths)
+        self.reload = reload
+        self.digest = knowledge_fingerprint(self.paths)
+        self.signature = self.stat()
+
+    def stat(self) -> Tuple:
+        signature = []
+        for path in self.paths:
+            try:
+                st = os.stat(path)
+                signature.append((st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append(None)
+        return tuple(signature)
+
+
+class HotReloader:
+    """
+    Reloads knowledge files and assistant instructions without a restart.
+
+    Components register the files they are built from and a reload callable. Every
+    `interval` seconds (or on POST /ops/reload) the files are stat'ed; only when the
+    modification time or size moved are they hashed, and only targets whose content
+    hash changed are reloaded. Plain callables run in a thread and must build the new
+    state aside and swap it in with a single assignment, so requests in flight keep
+    using the old state until the new one is complete. Coroutine functions (pushes
+    to the OpenAI assistant) are awaited. A failed reload keeps the old state.
+    """
+
+    def __init__(self, interval: float = 30):
+        self.interval = interval
+        self._targets: Dict[str, ReloadTarget] = {}
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def register(self, name: str, paths: List[str], reload: Callable[[], Any]):
+        """Registers `reload` for `paths`; their current contents count as already loaded."""
+        self._targets[name] = ReloadTarget(name, paths, reload)
+
+    def start(self):
+        if self._task is None and self.interval > 0 and self._targets:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Hot reload watching %d target(s) every %ss", len(self._targets), self.interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.check()
+            except Exception as e:
+                logger.error("Hot reload check failed: %s", e, exc_info=True)
+
+    async def check(self, force: bool = False) -> Dict[str, str]:
+        """
+        Reloads the targets whose files changed (all of them with `force`).
+        Returns {target: "unchanged" | "reloaded" | "failed"}.
+        """
+        async with self._lock:
+            results: Dict[str, str] = {}
+            for target in self._targets.values():
+                results[target.name] = await self._check_target(target, force)
+            return results
+
+    async def _check_target(self, target: ReloadTarget, force: bool) -> str:
+        signature = target.stat()
+        if signature == target.signature and not force:
+            return "unchanged"
+        target.signature = signature
+        digest = await asyncio.to_thread(knowledge_fingerprint, target.paths)
+        if digest == target.digest and not force:
+            return "unchanged"
+        # The digest is kept even if the reload fails: a broken file is retried once it changes again
+        target.digest = digest
+        try:
+            if asyncio.iscoroutinefunction(target.reload):
+                await target.reload()
+            else:
+                await asyncio.to_thread(target.reload)
+        except Exception as e:
+            metrics.inc("hot_reloads", target=target.name, result="failed")
+            logger.error("Hot reload of '%s' failed, keeping the previous version: %s", target.name, e)
+            return "failed"
+        metrics.inc("hot_reloads", target=target.name, result="reloaded")
+        logger.info("Hot reloaded '%s' (%s)", target.name, ", ".join(os.path.basename(p) for p in target.paths))
+        return "reloaded"
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "interval": self.interval,
+            "watching": self._task is not None,
+            "targets": {
+                name: {"files": target.paths, "digest": target.digest[:12]} for name, target in self._targets.items()
+            },
+        }
+
+
+assistant_sync = AssistantSync()
+hot_reloader = HotReloader(interval=get_settings().HOT_RELOAD_INTERVAL)
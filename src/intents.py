@@ -0,0 +1,194 @@
+import os
+import re
+import json
+import math
+import logging
+from collections import Counter
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from .config import get_settings
+from .knowledge import DEFAULT_KNOWLEDGE_FILES, chunk_json_document, normalize_text, tokenize
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.intents")
+
+OTHER = "other"  # Anything that needs the assistant
+
+# Whole-message rules over normalized text (lowercase, no accents, no punctuation or emoji)
+RULES: List[Tuple[str, "re.Pattern[str]"]] = [
+    ("greeting", re.compile(
+        r"(hola+|buenas+|buenos dias|buenas (tardes|noches)|hey+|hello|hi|saludos|que tal)"
+        r"( (hola+|buenas+|que tal|buenos dias|buenas (tardes|noches)))*"
+    )),
+    ("thanks", re.compile(
+        r"((ok|vale|perfecto|genial|estupendo|muy bien) )?"
+        r"((muchas|mil|muchisimas) )?(gracias|thanks|thank you|thx|te lo agradezco)( (a ti|por todo|de nuevo))?"
+    )),
+    ("menu", re.compile(
+        r"(menu|info|informacion|mas info|mas informacion|opciones|ayuda|help|start|empezar|inicio"
+        r"|quiero (mas )?informacion|que ofreceis|que ofreces)"
+    )),
+]
+
+# Seed examples of the model; the "other" class is completed with the knowledge file contents
+TRAINING_EXAMPLES: Dict[str, List[str]] = {
+    "greeting": [
+        "hola", "buenas", "buenos dias", "buenas tardes", "buenas noches", "hey", "hello", "hi",
+        "que tal", "hola que tal", "hola buenas", "saludos", "holi", "ey hola", "buen dia",
+    ],
+    "thanks": [
+        "gracias", "muchas gracias", "mil gracias", "thanks", "thank you", "perfecto gracias",
+        "genial gracias", "ok gracias", "vale gracias", "te lo agradezco", "gracias por la info",
+        "gracias por todo", "muy amable",
+    ],
+    "menu": [
+        "menu", "info", "informacion", "opciones", "ayuda", "que ofreceis", "que servicios teneis",
+        "mas informacion", "quiero informacion", "help", "empezar", "ver opciones", "necesito info",
+        "que haceis", "informacion por favor",
+    ],
+    OTHER: [
+        "cuanto cuesta", "precio del plan", "quiero contratar", "tengo una boda", "para cuantas personas",
+        "organizo un festival", "me llamo", "mi email es", "necesito un presupuesto", "como funciona el crm",
+        "que incluye el plan", "tenemos un congreso", "hablar con una persona", "fecha del evento",
+    ],
+}
+
+
+class IntentResult(NamedTuple):
+    intent: str
+    confidence: float
+    source: str  # "rule" or "model"
+
+
+class CannedReply(NamedTuple):
+    text: str
+    buttons: Tuple[Tuple[str, str], ...] = ()  # (id, title) pairs, at most 3, titles up to 20 chars
+
+
+MENU_BUTTONS: Tuple[Tuple[str, str], ...] = (
+    ("menu_plans", "Ver planes"),
+    ("menu_extras", "Servicios extra"),
+    ("menu_contact", "Contactar"),
+)
+
+
+class NaiveBayesIntentModel:
+    """
+    Multinomial Naive Bayes over accent-insensitive unigrams, trained at startup in a
+    few milliseconds. The posterior is scaled by the share of words seen in examples of
+    the predicted intent, so "gracias, y el precio?" or "hola, soy Ana" fall through.
+    """
+
+    def __init__(self, examples: Dict[str, List[str]], alpha: float = 0.5):
+        self.alpha = alpha
+        self.classes = list(examples)
+        self._counts: Dict[str, Counter] = {c: Counter() for c in self.classes}
+        n_examples = sum(len(texts) for texts in examples.values())
+        self._log_priors = {c: math.log(len(texts) / n_examples) for c, texts in examples.items()}
+        for intent, texts in examples.items():
+            for text in texts:
+                self._counts[intent].update(tokenize(text))
+        self.vocabulary = set().union(*self._counts.values())
+        self._totals = {c: sum(counts.values()) for c, counts in self._counts.items()}
+
+    def predict(self, text: str) -> Tuple[str, float]:
+        tokens = tokenize(text)
+        known = [t for t in tokens if t in self.vocabulary]
+        if not known:
+            return OTHER, 0.0
+        size = len(self.vocabulary)
+        log_probs = {
+            c: self._log_priors[c] + sum(
+                math.log((self._counts[c][t] + self.alpha) / (self._totals[c] + self.alpha * size)) for t in known
+            )
+            for c in self.classes
+        }
+        best = max(log_probs, key=log_probs.get)
+        norm = sum(math.exp(lp - log_probs[best]) for lp in log_probs.values())
+        coverage = sum(1 for t in tokens if self._counts[best][t]) / len(tokens)
+        return best, coverage / norm
+
+
+class IntentRouter:
+    """
+    Answers short, conversational messages (greetings, thanks, menu requests)
+    locally with canned replies, before any assistant run.
+
+    Whole-message regex rules are tried first (confidence 1.0); short messages that
+    no rule matches are classified by the Naive Bayes model and answered only above
+    `threshold`. Everything else returns None and goes to the assistant.
+    """
+
+    def __init__(self, threshold: float = 0.75, max_tokens: int = 6, knowledge_files: Optional[List[str]] = None):
+        self.threshold = threshold
+        self.max_tokens = max_tokens
+        self.knowledge_files = knowledge_files or DEFAULT_KNOWLEDGE_FILES
+        self.load()
+
+    def load(self):
+        """(Re)trains the model from the knowledge files; model and replies are swapped in together."""
+        examples = {intent: list(texts) for intent, texts in TRAINING_EXAMPLES.items()}
+        business_name = "Eventek"
+        seen_texts = set()
+        for file_path in self.knowledge_files:
+            if not os.path.exists(file_path):
+                continue
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            business_name = (data.get("business_info") or {}).get("name") or business_name
+            for chunk in chunk_json_document(data, os.path.basename(file_path)):
+                if chunk.text in seen_texts:  # Files that repeat each other's sections would skew the priors
+                    continue
+                seen_texts.add(chunk.text)
+                examples[OTHER].extend(line for line in chunk.text.splitlines() if line.strip())
+        model = NaiveBayesIntentModel(examples)
+        replies: Dict[str, CannedReply] = {
+            "greeting": CannedReply(
+                f"¡Hola! 👋 Soy el asistente virtual de {business_name}. "
+                "¿En qué te puedo ayudar? Elige una opción o escríbeme tu pregunta.",
+                MENU_BUTTONS,
+            ),
+            "thanks": CannedReply("¡A ti! 😊 Si necesitas algo más, aquí estoy."),
+            "menu": CannedReply("Esto es lo que puedo contarte. Elige una opción o escríbeme tu pregunta:", MENU_BUTTONS),
+        }
+        self._state = (model, replies)
+
+    @property
+    def model(self) -> NaiveBayesIntentModel:
+        return self._state[0]
+
+    @property
+    def replies(self) -> Dict[str, CannedReply]:
+        return self._state[1]
+
+    def classify(self, text: str) -> Optional[IntentResult]:
+        normalized = " ".join(re.findall(r"[a-z0-9]+", normalize_text(text)))
+        if not normalized:
+            return None
+        for intent, pattern in RULES:
+            if pattern.fullmatch(normalized):
+                return IntentResult(intent, 1.0, "rule")
+        if len(normalized.split()) > self.max_tokens:
+            return None
+        intent, confidence = self.model.predict(normalized)
+        return IntentResult(intent, round(confidence, 3), "model")
+
+    def route(self, text: str) -> Optional[Tuple[IntentResult, CannedReply]]:
+        """Returns the classification and canned reply for `text`, or None if the assistant must answer."""
+        result = self.classify(text)
+        if result is None:
+            metrics.inc("intent_fallthrough", reason="not_small_talk")
+            return None
+        if result.intent == OTHER or result.intent not in self.replies:
+            metrics.inc("intent_fallthrough", reason="other")
+            return None
+        if result.confidence < self.threshold:
+            metrics.inc("intent_fallthrough", reason="low_confidence")
+            logger.debug("Intent %s below threshold (%.2f)", result.intent, result.confidence)
+            return None
+        metrics.inc("intent_hits", intent=result.intent, source=result.source)
+        return result, self.replies[result.intent]
+
+
+settings = get_settings()
+intent_router = IntentRouter(threshold=settings.INTENT_CONFIDENCE_THRESHOLD)
@@ -0,0 +1,123 @@
+import os
+import re
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from .knowledge import DEFAULT_KNOWLEDGE_FILES, normalize_text
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.interactive")
+
+ListRow = Tuple[str, str, str]               # (id, title <= 24 chars, description <= 72 chars)
+ListSection = Tuple[str, List[ListRow]]      # (title, rows); at most 10 rows per message
+
+
+class InteractiveReply(NamedTuple):
+    """A precomputed answer to a button or list choice."""
+    text: str
+    buttons: Tuple[Tuple[str, str], ...] = ()
+    list_button: Optional[str] = None         # Label of the button that opens the list
+    sections: Tuple[ListSection, ...] = ()
+    crm_fields: Optional[Dict[str, Any]] = None  # Contact fields the choice fills in
+
+
+def slug(text: str) -> str:
+    return re.sub(r"[^a-z0-9]+", "-", normalize_text(text)).strip("-")
+
+
+def _clip(text: str, limit: int) -> str:
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+class AnswerTable:
+    """
+    Answers to the reply IDs of our interactive messages, built once from the knowledge
+    file so a button or list choice is answered with a dictionary lookup instead of an
+    assistant run.
+
+    IDs: `menu_plans`, `menu_extras`, `menu_contact` (the menu buttons),
+    `plan:<slug>` (plan list rows, fills `plan_interest`) and
+    `event:<slug>` (event type rows, fills `event_type`).
+    """
+
+    def __init__(self, file_path: Optional[str] = None):
+        self.file_path = file_path or DEFAULT_KNOWLEDGE_FILES[0]
+        self.answers: Dict[str, InteractiveReply] = {}
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.file_path):
+            logger.error("Knowledge file not found: %s", self.file_path)
+            return
+        with open(self.file_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        self.answers = self.build(data)
+        logger.info("Interactive answer table: %d reply IDs", len(self.answers))
+
+    @staticmethod
+    def build(data: Dict[str, Any]) -> Dict[str, InteractiveReply]:
+        answers: Dict[str, InteractiveReply] = {}
+        info = data.get("business_info") or {}
+        plans: Dict[str, Dict[str, Any]] = data.get("services") or {}
+        extras: Dict[str, Dict[str, Any]] = data.get("additional_services") or {}
+
+        plan_rows = [
+            (f"plan:{slug(name)}", _clip(name, 24), _clip(plan.get("description", ""), 72))
+            for name, plan in list(plans.items())[:10]
+        ]
+        answers["menu_plans"] = InteractiveReply(
+            "Estos son nuestros planes. Elige uno para ver qué incluye:",
+            list_button="Ver planes",
+            sections=(("Planes", plan_rows),),
+        )
+
+        extra_lines = [f"• *{name}*: {extra.get('description', '')}" for name, extra in extras.items()]
+        answers["menu_extras"] = InteractiveReply(
+            "Servicios adicionales que puedes añadir a cualquier plan:\n\n" + "\n".join(extra_lines),
+            buttons=(("menu_plans", "Ver planes"), ("menu_contact", "Contactar")),
+        )
+
+        contact_lines = [f"📞 {info['phone']}" if info.get("phone") else "",
+                         f"✉️ {info['email']}" if info.get("email") else "",
+                         f"🕒 {info['working_hours']}" if info.get("working_hours") else ""]
+        answers["menu_contact"] = InteractiveReply(
+            f"Puedes contactar con {info.get('name', 'nosotros')} en:\n" + "\n".join(l for l in contact_lines if l)
+            + "\n\nO cuéntame aquí tu evento (tipo, fecha y número de asistentes) y te preparamos una propuesta.",
+        )
+
+        for name, plan in plans.items():
+            lines = [f"*{name}*", plan.get("description", "")]
+            if plan.get("features"):
+                lines.append("\nIncluye:\n" + "\n".join(f"• {f}" for f in plan["features"]))
+            if plan.get("benefits"):
+                lines.append("\nBeneficios:\n" + "\n".join(f"• {b}" for b in plan["benefits"]))
+            event_rows = [(f"event:{slug(e)}", _clip(e, 24), "") for e in (plan.get("ideal_for") or [])[:9]]
+            event_rows.append(("event:otro", "Otro tipo de evento", ""))
+            lines.append("\n¿Qué tipo de evento organizas?")
+            answers[f"plan:{slug(name)}"] = InteractiveReply(
+                _clip("\n".join(lines), 1024),
+                list_button="Tipo de evento",
+                sections=(("Tipo de evento", event_rows),),
+                crm_fields={"plan_interest": name},
+            )
+
+        for name, plan in plans.items():
+            for event in plan.get("ideal_for") or []:
+                answers.setdefault(f"event:{slug(event)}", InteractiveReply(
+                    f"¡Genial! Para *{event}* te recomendamos el *{name}*. "
+                    "¿Para qué fecha es y cuántos asistentes esperas?",
+                    crm_fields={"event_type": event},
+                ))
+        answers["event:otro"] = InteractiveReply(
+            "¡Perfecto! Cuéntame qué evento organizas, para qué fecha y cuántos asistentes esperas.",
+        )
+        return answers
+
+    def resolve(self, reply_id: Optional[str]) -> Optional[InteractiveReply]:
+        answer = self.answers.get(reply_id or "")
+        metrics.inc("interactive_replies", resolved=answer is not None)
+        return answer
+
+
+answer_table = AnswerTable()
@@ -0,0 +1,344 @@
+import os
+import re
+import json
+import math
+import asyncio
+import hashlib
+import logging
+import tempfile
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+try:
+    import numpy as np
+except ImportError:  # Vector retrieval is optional: without numpy the BM25 index is used
+    np = None
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_KNOWLEDGE_FILES = [
+    os.path.join(BASE_DIR, "course_info.json"),  # First: the catalog read by the lead extractor and menus
+    os.path.join(os.path.dirname(BASE_DIR), "dental_business_info.json"),  # At the repository root
+]
+DEFAULT_INDEX_DIR = os.path.join(BASE_DIR, "knowledge_index")
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+# Very common Spanish/English words that carry no retrieval signal
+_STOPWORDS = frozenset(
+    "a al con de del el en es la las lo los mas me mi o para por que se si su sus te tu un una y "
+    "the and of to for in is on with".split()
+)
+
+
+def normalize_text(text: str) -> str:
+    """Lowercases and strips accents so 'Básico' and 'basico' match."""
+    decomposed = unicodedata.normalize("NFKD", text.lower())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall(normalize_text(text)) if t not in _STOPWORDS]
+
+
+class KnowledgeChunk(NamedTuple):
+    source: str  # File name the chunk came from
+    path: str    # Location inside the JSON document, e.g. "services > Plan Expert"
+    text: str
+
+
+def chunk_json_document(data: Any, source: str) -> List[KnowledgeChunk]:
+    """
+    Splits a knowledge JSON document into retrievable chunks.
+
+    Every object whose values are scalars or lists of scalars becomes one chunk
+    (e.g. a single plan with its description, features and benefits), so a
+    retrieved passage always carries its own heading.
+    """
+    chunks: List[KnowledgeChunk] = []
+
+    def is_leafy(value: Any) -> bool:
+        if isinstance(value, dict):
+            return False
+        if isinstance(value, list):
+            return all(not isinstance(v, (dict, list)) for v in value)
+        return True
+
+    def walk(node: Any, path: List[str]):
+        if isinstance(node, dict):
+            leaf_lines = []
+            for key, value in node.items():
+                if is_leafy(value):
+                    if isinstance(value, list):
+                        leaf_lines.append(f"{key}: " + "; ".join(str(v) for v in value))
+                    else:
+                        leaf_lines.append(f"{key}: {value}")
+                else:
+                    walk(value, path + [str(key)])
+            if leaf_lines:
+                heading = " > ".join(path) if path else source
+                chunks.append(KnowledgeChunk(source, heading, f"{heading}\n" + "\n".join(leaf_lines)))
+        elif isinstance(node, list):
+            if all(not isinstance(v, (dict, list)) for v in node):
+                heading = " > ".join(path)
+                chunks.append(KnowledgeChunk(source, heading, f"{heading}\n" + "\n".join(f"- {v}" for v in node)))
+            else:
+                for i, item in enumerate(node):
+                    walk(item, path + [str(i)])
+
+    walk(data, [])
+    return chunks
+
+
+def resolve_knowledge_files(spec: str) -> Optional[List[str]]:
+    """Comma-separated file names (relative to src/ unless absolute) -> paths; None (the defaults) when empty."""
+    paths = [os.path.join(BASE_DIR, name.strip()) for name in spec.split(",") if name.strip()]
+    return paths or None
+
+
+def knowledge_fingerprint(file_paths: List[str]) -> str:
+    """Content hash of the knowledge files: a precomputed index is only used for the files it was built from."""
+    digest = hashlib.sha256()
+    for file_path in file_paths:
+        if os.path.exists(file_path):
+            with open(file_path, "rb") as f:
+                digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()
+
+
+class HashingEmbedder:
+    """
+    Deterministic local embedder (feature hashing): accent-insensitive words plus
+    character 4-grams, so "boda" and "bodas" still overlap. No model download and
+    no network; the fallback when no other embedder is configured.
+    """
+
+    def __init__(self, dim: int = 1024):
+        self.dim = dim
+        self.name = "hashing-v1"
+
+    def _features(self, text: str) -> Counter:
+        features: Counter = Counter()
+        for token in tokenize(text):
+            features["w:" + token] += 2
+            padded = f"#{token}#"
+            for i in range(max(1, len(padded) - 3)):
+                features["g:" + padded[i:i + 4]] += 1
+        return features
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature, count in self._features(text).items():
+                h = int.from_bytes(hashlib.blake2b(feature.encode("utf-8"), digest_size=8).digest(), "little")
+                matrix[row, h % self.dim] += (1.0 if (h >> 63) & 1 else -1.0) * (1.0 + math.log(count))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return matrix / np.maximum(norms, 1e-12)
+
+
+class OpenAIEmbedder:
+    """OpenAI embeddings (e.g. text-embedding-3-small); the query is embedded with the same model at search time."""
+
+    def __init__(self, model: str = "text-embedding-3-small", dim: Optional[int] = None):
+        from openai import OpenAI
+        self.model = model
+        self.dim = dim
+        self.name = f"openai:{model}"
+        self._client = OpenAI()
+
+    def embed(self, texts: List[str]) -> "np.ndarray":
+        rows: List[List[float]] = []
+        for start in range(0, len(texts), 100):
+            response = self._client.embeddings.create(model=self.model, input=texts[start:start + 100])
+            rows.extend(item.embedding for item in response.data)
+        matrix = np.asarray(rows, dtype=np.float32)
+        self.dim = matrix.shape[1]
+        return matrix / np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+
+
+def get_embedder(name: str, dim: Optional[int] = None):
+    """Embedder by its recorded name ("hashing-v1", "openai:<model>")."""
+    if name == "hashing-v1":
+        return HashingEmbedder(dim or 1024)
+    if name.startswith("openai:"):
+        return OpenAIEmbedder(name.split(":", 1)[1], dim)
+    raise ValueError(f"Unknown embedder '{name}'")
+
+
+class VectorIndex:
+    """
+    Chunk embeddings as one contiguous float32 matrix (rows L2-normalized), so a query
+    is a single matrix-vector product followed by a partial sort.
+
+    Saved as `knowledge.npy` plus `knowledge.meta.json` (embedder, chunks, fingerprint
+    of the source files); loaded memory-mapped, so workers share the pages.
+    """
+    MATRIX_FILE = "knowledge.npy"
+    META_FILE = "knowledge.meta.json"
+
+    def __init__(self, matrix: "np.ndarray", chunks: List[KnowledgeChunk], embedder):
+        self.matrix = matrix
+        self.chunks = chunks
+        self.embedder = embedder
+
+    @classmethod
+    def build(cls, chunks: List[KnowledgeChunk], embedder) -> "VectorIndex":
+        matrix = np.ascontiguousarray(embedder.embed([c.text for c in chunks]), dtype=np.float32)
+        return cls(matrix, chunks, embedder)
+
+    def save(self, directory: str, fingerprint: str):
+        """Writes the matrix and metadata atomically (temp file + rename)."""
+        os.makedirs(directory, exist_ok=True)
+        meta = {
+            "embedder": self.embedder.name,
+            "dim": int(self.matrix.shape[1]),
+            "fingerprint": fingerprint,
+            "chunks": [c._asdict() for c in self.chunks],
+        }
+        for file_name, write in (
+            (self.MATRIX_FILE, lambda f: np.save(f, self.matrix)),
+            (self.META_FILE, lambda f: f.write(json.dumps(meta, ensure_ascii=False).encode("utf-8"))),
+        ):
+            fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{file_name}.")
+            with os.fdopen(fd, "wb") as f:
+                write(f)
+            os.replace(tmp_path, os.path.join(directory, file_name))
+
+    @classmethod
+    def load(cls, directory: str, fingerprint: Optional[str] = None) -> Optional["VectorIndex"]:
+        """The saved index, or None if missing or built from other file contents."""
+        meta_path = os.path.join(directory, cls.META_FILE)
+        matrix_path = os.path.join(directory, cls.MATRIX_FILE)
+        if not (os.path.exists(meta_path) and os.path.exists(matrix_path)):
+            return None
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        if fingerprint is not None and meta.get("fingerprint") != fingerprint:
+            logger.warning("Knowledge vector index in %s is stale (files changed); ignoring it.", directory)
+            return None
+        matrix = np.load(matrix_path, mmap_mode="r")
+        chunks = [KnowledgeChunk(**c) for c in meta["chunks"]]
+        if matrix.shape != (len(chunks), meta["dim"]):
+            logger.error("Knowledge vector index in %s is inconsistent; ignoring it.", directory)
+            return None
+        return cls(matrix, chunks, get_embedder(meta["embedder"], meta["dim"]))
+
+    def search(self, query: str, top_k: int = 3, min_score: float = 0.0) -> List[Tuple[float, KnowledgeChunk]]:
+        if not self.chunks:
+            return []
+        scores = self.matrix @ self.embedder.embed([query])[0]
+        k = min(top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self.chunks[i]) for i in top if scores[i] > min_score]
+
+
+class KnowledgeBase:
+    """
+    Small in-process retrieval engine over the knowledge JSON files.
+
+    With numpy installed, chunks are ranked by cosine similarity against a
+    `VectorIndex`: the precomputed one in `index_dir` when it matches the current
+    files (see scripts/build_knowledge_index.py), otherwise one built at load time
+    with the local `HashingEmbedder`. Without numpy, or when no chunk is similar
+    enough, chunks are scored with BM25 over accent-insensitive tokens. Either way
+    a query never leaves the process, unlike `file_search`.
+    """
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, file_paths: Optional[List[str]] = None, index_dir: Optional[str] = None,
+                 vector_search: bool = True, min_score: float = 0.05):
+        self.file_paths = file_paths or DEFAULT_KNOWLEDGE_FILES
+        self.index_dir = index_dir or DEFAULT_INDEX_DIR
+        self.vector_search = vector_search and np is not None
+        self.min_score = min_score
+        self.chunks: List[KnowledgeChunk] = []
+        self.vector_index: Optional[VectorIndex] = None
+        self._term_freqs: List[Counter] = []
+        self._doc_lens: List[int] = []
+        self._idf: Dict[str, float] = {}
+        self._avg_len = 0.0
+        self.load()
+
+    def load(self):
+        """(Re)builds the index from the configured files."""
+        chunks: List[KnowledgeChunk] = []
+        seen_texts = set()
+        for file_path in self.file_paths:
+            if not os.path.exists(file_path):
+                logger.error("Knowledge file not found: %s", file_path)
+                continue
+            with open(file_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            for chunk in chunk_json_document(data, os.path.basename(file_path)):
+                if chunk.text not in seen_texts:  # Files that repeat each other's sections
+                    seen_texts.add(chunk.text)
+                    chunks.append(chunk)
+
+        term_freqs = [Counter(tokenize(c.text)) for c in chunks]
+        doc_lens = [sum(tf.values()) for tf in term_freqs]
+        doc_freq: Counter = Counter()
+        for tf in term_freqs:
+            doc_freq.update(tf.keys())
+        n_docs = len(chunks)
+        self._idf = {
+            term: math.log(1 + (n_docs - df + 0.5) / (df + 0.5)) for term, df in doc_freq.items()
+        }
+        self.chunks = chunks
+        self._term_freqs = term_freqs
+        self._doc_lens = doc_lens
+        self._avg_len = (sum(doc_lens) / n_docs) if n_docs else 0.0
+        self.vector_index = self._load_vector_index(chunks) if self.vector_search else None
+        logger.info("Knowledge base loaded: %d chunks from %d file(s), %s search.", n_docs, len(self.file_paths),
+                    f"vector ({self.vector_index.embedder.name})" if self.vector_index else "BM25")
+
+    def _load_vector_index(self, chunks: List[KnowledgeChunk]) -> Optional[VectorIndex]:
+        try:
+            index = VectorIndex.load(self.index_dir, knowledge_fingerprint(self.file_paths))
+            if index is not None:
+                return index
+            return VectorIndex.build(chunks, HashingEmbedder()) if chunks else None
+        except Exception as e:
+            logger.error("Knowledge vector index unavailable, using BM25: %s", e, exc_info=True)
+            return None
+
+    def search(self, query: str, top_k: int = 3) -> List[KnowledgeChunk]:
+        """Returns the `top_k` best matching chunks for `query` (may be fewer)."""
+        if self.vector_index is not None:
+            try:
+                hits = self.vector_index.search(query, top_k=top_k, min_score=self.min_score)
+                if hits:
+                    return [chunk for _, chunk in hits]
+            except Exception as e:
+                logger.error("Vector search failed, using BM25: %s", e)
+        return self.bm25_search(query, top_k=top_k)
+
+    def bm25_search(self, query: str, top_k: int = 3) -> List[KnowledgeChunk]:
+        terms = set(tokenize(query))
+        if not terms or not self.chunks:
+            return []
+        scores = []
+        for i, tf in enumerate(self._term_freqs):
+            score = 0.0
+            norm = self.K1 * (1 - self.B + self.B * self._doc_lens[i] / (self._avg_len or 1))
+            for term in terms:
+                freq = tf.get(term)
+                if freq:
+                    score += self._idf[term] * freq * (self.K1 + 1) / (freq + norm)
+            if score > 0:
+                scores.append((score, i))
+        scores.sort(reverse=True)
+        return [self.chunks[i] for _, i in scores[:top_k]]
+
+    def build_context(self, query: str, top_k: int = 3) -> str:
+        """Formats the retrieved passages as a block ready to be injected into a prompt."""
+        passages = self.search(query, top_k=top_k)
+        return "\n\n".join(p.text for p in passages)
+
+    async def abuild_context(self, query: str, top_k: int = 3) -> str:
+        """`build_context` for the event loop: remote query embedders run in a worker thread."""
+        if self.vector_index is not None and not isinstance(self.vector_index.embedder, HashingEmbedder):
+            return await asyncio.to_thread(self.build_context, query, top_k)
+        return self.build_context(query, top_k)
@@ -0,0 +1,209 @@
+import os
+import re
+import json
+import logging
+from datetime import date, datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from email_validator import EmailNotValidError, validate_email
+
+from .knowledge import DEFAULT_KNOWLEDGE_FILES, normalize_text
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.leads")
+
+# Contact field -> how the assistant is told about it
+LEAD_FIELDS: Dict[str, str] = {
+    "name": "nombre",
+    "email": "email",
+    "company": "empresa",
+    "event_type": "tipo de evento",
+    "event_date": "fecha del evento",
+    "attendees": "número de asistentes",
+    "plan_interest": "plan de interés",
+}
+
+MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+# Event types not listed in the knowledge file
+EXTRA_EVENT_TYPES = ["Conferencia", "Gala", "Concierto", "Evento corporativo", "Feria", "Fiesta"]
+
+_EMAIL_RE = re.compile(r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+")
+_PHONE_RE = re.compile(r"(?<![\w/.-])(?:\+|00)?\d[\d .-]{7,16}\d(?![\w/-])")
+_NUMERIC_DATE_RE = re.compile(r"\b(\d{1,2})[/.-](\d{1,2})(?:[/.-](\d{2}|\d{4}))?\b")
+_ISO_DATE_RE = re.compile(r"\b(\d{4})-(\d{2})-(\d{2})\b")
+_TEXT_DATE_RE = re.compile(r"\b(\d{1,2}) de (" + "|".join(MONTHS) + r")(?: (?:de |del )?(\d{4}))?\b")
+_ATTENDEES_RE = re.compile(
+    r"\b(\d{1,3}(?:[.,]\d{3})+|\d{1,6})\s*(?:personas|asistentes|invitados|participantes|pax|visitantes|"
+    r"comensales|gente|inscritos)\b"
+)
+_NAME_WORD = r"[A-ZÁÉÍÓÚÑ][a-záéíóúñü]+"
+_NAME_RE = re.compile(
+    r"\b(?:[Mm]e llamo|[Mm]i nombre es|[Ss]oy)\s+(" + _NAME_WORD + r"(?:\s+" + _NAME_WORD + r"){0,2})"
+)
+_NAME_LOWER_RE = re.compile(r"\b(?:me llamo|mi nombre es)\s+([a-záéíóúñü]{2,})\b", re.IGNORECASE)
+_COMPANY_RE = re.compile(
+    r"\b(?:[Ee]mpresa|[Cc]ompañía|[Tt]rabajo en|[Tt]rabajamos en)\s+([A-Z][\w&.-]*(?:\s+[A-Z0-9][\w&.-]*){0,3})"
+)
+
+
+def _future_date(year: Optional[int], month: int, day: int, today: date) -> Optional[date]:
+    """The date, or its next occurrence when the year is omitted; None for invalid or past dates."""
+    try:
+        if year is None:
+            candidate = date(today.year, month, day)
+            if candidate < today:
+                candidate = date(today.year + 1, month, day)
+        else:
+            candidate = date(year + 2000 if year < 100 else year, month, day)
+    except ValueError:
+        return None
+    if not today <= candidate <= date(today.year + 3, 12, 31):
+        return None
+    return candidate
+
+
+class LeadExtractor:
+    """
+    Pulls contact fields out of free text with regular expressions and validators
+    (email, phone, event date, attendee count, plan, event type, name, company).
+
+    Plan names and event types come from the knowledge file, so "el plan expert" or
+    "es para una boda" map to the same values the interactive menus use. Only values
+    that validate are returned; the extractor never guesses.
+    """
+
+    def __init__(self, knowledge_file: Optional[str] = None):
+        self.knowledge_file = knowledge_file or DEFAULT_KNOWLEDGE_FILES[0]
+        self.load()
+
+    def load(self):
+        """(Re)builds the plan and event type patterns from the knowledge file."""
+        services: Dict[str, Any] = {}
+        if os.path.exists(self.knowledge_file):
+            with open(self.knowledge_file, "r", encoding="utf-8") as f:
+                services = json.load(f).get("services") or {}
+        plan_patterns: List[Tuple["re.Pattern[str]", str]] = []
+        for name in services:
+            # "Plan Profesional B2B" -> matches "profesional" or "b2b"
+            words = [w for w in normalize_text(name).split() if w != "plan" and len(w) > 2]
+            if words:
+                plan_patterns.append((re.compile(r"\b(" + "|".join(map(re.escape, words)) + r")\b"), name))
+        event_types = [e for plan in services.values() for e in plan.get("ideal_for") or []] + EXTRA_EVENT_TYPES
+        event_patterns: List[Tuple["re.Pattern[str]", str]] = []
+        for event_type in event_types:
+            stem = re.sub(r"(es|s)$", "", normalize_text(event_type))
+            event_patterns.append((re.compile(r"\b" + re.escape(stem) + r"(es|s)?\b"), event_type))
+        # One assignment: `extract` may run on the event loop while the hot reloader calls this in a thread
+        self._patterns = (plan_patterns, event_patterns)
+
+    @property
+    def plan_patterns(self) -> List[Tuple["re.Pattern[str]", str]]:
+        return self._patterns[0]
+
+    @property
+    def event_patterns(self) -> List[Tuple["re.Pattern[str]", str]]:
+        return self._patterns[1]
+
+    def extract(self, text: str, sender_id: Optional[str] = None, today: Optional[date] = None) -> Dict[str, Any]:
+        today = today or date.today()
+        plan_patterns, event_patterns = self._patterns  # Both from the same load
+        normalized = normalize_text(text)
+        fields: Dict[str, Any] = {}
+
+        for candidate in _EMAIL_RE.findall(text):
+            try:
+                fields["email"] = validate_email(candidate, check_deliverability=False).normalized
+                break
+            except EmailNotValidError:
+                continue
+        without_emails = _EMAIL_RE.sub(" ", text)
+
+        for candidate in _PHONE_RE.findall(without_emails):
+            digits = re.sub(r"\D", "", candidate)
+            if candidate.startswith("00"):
+                digits = digits[2:]
+            if 9 <= len(digits) <= 15 and (len(digits) > 9 or digits[0] in "6789"):
+                if not sender_id or not sender_id.endswith(digits):
+                    fields["contact_phone"] = digits  # The WhatsApp number itself is already the contact key
+                break
+
+        event_date = None
+        match = _ISO_DATE_RE.search(normalized)
+        if match:  # Explicit: when rejected, its digits must not be re-read as a dd-mm date below
+            event_date = _future_date(int(match.group(1)), int(match.group(2)), int(match.group(3)), today)
+        else:
+            match = _TEXT_DATE_RE.search(normalized)
+            if match:
+                year = int(match.group(3)) if match.group(3) else None
+                event_date = _future_date(year, MONTHS[match.group(2)], int(match.group(1)), today)
+            else:
+                for match in _NUMERIC_DATE_RE.finditer(without_emails):
+                    year = int(match.group(3)) if match.group(3) else None
+                    event_date = _future_date(year, int(match.group(2)), int(match.group(1)), today)  # dd/mm
+                    if event_date is not None:
+                        break
+        if event_date is not None:
+            fields["event_date"] = event_date.isoformat()
+
+        match = _ATTENDEES_RE.search(normalized)
+        if match:
+            attendees = int(re.sub(r"[.,]", "", match.group(1)))
+            if 1 <= attendees <= 200000:
+                fields["attendees"] = attendees
+
+        # Plan words are also common words ("profesional"): only where a plan is mentioned
+        for pattern, plan_name in plan_patterns if re.search(r"\bplan(es)?\b", normalized) else ():
+            if pattern.search(normalized):
+                fields["plan_interest"] = plan_name
+                break
+        for pattern, event_type in event_patterns:
+            if pattern.search(normalized):
+                fields["event_type"] = event_type
+                break
+
+        match = _NAME_RE.search(text) or _NAME_LOWER_RE.search(text)
+        if match:
+            fields["name"] = match.group(1).strip().title()
+        match = _COMPANY_RE.search(text)
+        if match:
+            fields["company"] = match.group(1).strip()
+
+        for field in fields:
+            metrics.inc("lead_fields_extracted", field=field)
+        return fields
+
+
+def to_contact_fields(fields: Dict[str, Any]) -> Dict[str, Any]:
+    """Draft values -> stored contact values (the draft keeps dates as ISO strings)."""
+    contact = dict(fields)
+    if contact.get("event_date"):
+        contact["event_date"] = datetime.combine(date.fromisoformat(contact["event_date"]), datetime.min.time())
+    return contact
+
+
+def lead_instructions(draft: Dict[str, Any]) -> Optional[str]:
+    """
+    Run instructions listing what is already known about the lead and what is missing,
+    so the assistant only asks for the missing fields. The values are only captured (their
+    background save may still be pending or fail), so saving stays with `add_crm_contact`,
+    which updates the same contact.
+    """
+    if not draft:
+        return None
+    known = [f"{label}: {draft[field]}" for field, label in LEAD_FIELDS.items() if draft.get(field)]
+    missing = [label for field, label in LEAD_FIELDS.items() if not draft.get(field)]
+    lines = [
+        "### DATOS DEL CLIENTE (capturados automáticamente)",
+        "Datos que el cliente ya nos ha dado: " + "; ".join(known) + "." if known else "",
+        "No vuelvas a preguntarlos. Para registrar al cliente en el CRM usa `add_crm_contact` como siempre: "
+        "actualiza su ficha, no crea otra.",
+        "Si encaja en la conversación, pide de forma natural alguno de los datos que faltan: " + ", ".join(missing) + "."
+        if missing else "Ya tenemos todos los datos del cliente.",
+    ]
+    return "\n".join(line for line in lines if line)
+
+
+lead_extractor = LeadExtractor()
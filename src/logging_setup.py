@@ -0,0 +1,154 @@
+import re
+import sys
+import json
+import copy
+import queue
+import atexit
+import logging
+import threading
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+
+from .metrics import metrics
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_STANDARD_RECORD_ATTRS = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+_REDACTIONS = [
+    # Bearer / API tokens (OpenAI "sk-...", Meta "EAA...")
+    (re.compile(r"(Bearer\s+)[A-Za-z0-9._\-]+"), r"\1[REDACTED]"),
+    (re.compile(r"\bsk-[A-Za-z0-9_\-]{8,}"), "sk-[REDACTED]"),
+    (re.compile(r"\bEAA[A-Za-z0-9]{20,}"), "EAA[REDACTED]"),
+    # Free text written by users inside raw webhook payloads
+    (re.compile(r'("(?:body|name|caption)"\s*:\s*")(?:[^"\\]|\\.)*(")'), r"\1[REDACTED]\2"),
+    (re.compile(r"[A-Za-z0-9._%+\-]+@[A-Za-z0-9.\-]+\.[A-Za-z]{2,}"), "[EMAIL]"),
+    # Phone numbers / WhatsApp IDs (11-15 digits with country code): keep the last 4 digits
+    # so lines can still be correlated; 10-digit epoch timestamps are left alone
+    (re.compile(r"(?<![\w.])\+?\d{7,11}(\d{4})(?![\w.])"), r"***\1"),
+]
+
+
+def redact(text: str) -> str:
+    for pattern, replacement in _REDACTIONS:
+        text = pattern.sub(replacement, text)
+    return text
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with redacted message, exception and `extra` fields."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": redact(record.getMessage()),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _STANDARD_RECORD_ATTRS and not key.startswith("_"):
+                entry[key] = value if isinstance(value, (int, float, bool)) or value is None else redact(str(value))
+        if record.exc_info:
+            entry["exc"] = redact(self.formatException(record.exc_info))
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return json.dumps(entry, ensure_ascii=False)
+
+
+class RedactingFormatter(logging.Formatter):
+    """Plain-text formatter (LOG_FORMAT=text) with the same redaction rules."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        return redact(super().format(record))
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps 1 in `every` records logged with `extra={"high_volume": True}` below
+    WARNING, counted per logger and message template so each distinct
+    high-volume line is still visible. Other records always pass.
+    """
+
+    def __init__(self, every: int):
+        super().__init__()
+        self.every = max(1, every)
+        self._seen: Dict[tuple, int] = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.every == 1 or record.levelno >= logging.WARNING or not getattr(record, "high_volume", False):
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            seen = self._seen.get(key, 0)
+            self._seen[key] = seen + 1
+        if seen % self.every == 0:
+            return True
+        metrics.inc("log_records_sampled_out")
+        return False
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread without blocking the event loop.
+
+    Unlike the stock QueueHandler, `prepare` only merges the %-args into the
+    message; exception tracebacks are formatted (and the record serialised) by
+    the listener thread. When the queue is full the record is dropped and
+    counted instead of waiting.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            metrics.inc("log_records_dropped")
+
+
+_listener: Optional[QueueListener] = None
+
+
+def configure_logging(level: int = logging.INFO, log_format: str = "json", sample_every: int = 20,
+                      queue_size: int = 10000) -> QueueListener:
+    """
+    Routes all logging through a bounded queue drained by a background thread
+    that formats (JSON or text), redacts and writes to stdout. Safe to call more
+    than once; the previous listener is stopped.
+    """
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if log_format == "json":
+        stream_handler.setFormatter(JsonFormatter())
+    else:
+        stream_handler.setFormatter(RedactingFormatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s'))
+
+    queue_handler = DeferredQueueHandler(queue.Queue(maxsize=queue_size))
+    queue_handler.addFilter(SamplingFilter(sample_every))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level)
+
+    _listener = QueueListener(queue_handler.queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
+    return _listener
+
+
+def shutdown_logging():
+    """Flushes queued records and stops the listener thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
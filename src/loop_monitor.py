@@ -0,0 +1,89 @@
+import sys
+import time
+import asyncio
+import logging
+import threading
+import traceback
+from typing import Optional
+
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.loop_monitor")
+
+
+class LoopLagMonitor:
+    """
+    Measures event loop scheduling delay and reports what blocked it.
+
+    A sampler coroutine sleeps `interval` seconds and records how late it woke
+    up (`event_loop_lag_ms` histogram). Because a blocked loop cannot run that
+    coroutine, a watchdog thread watches the sampler's heartbeat: when it goes
+    stale for longer than `slow_threshold`, the watchdog captures the loop
+    thread's current stack, which points at the synchronous code holding the
+    loop (large Pydantic validations, blocking file I/O, ...).
+    """
+
+    def __init__(self, interval: float = 0.5, slow_threshold: float = 0.2):
+        self.interval = interval
+        self.slow_threshold = slow_threshold
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._task: Optional[asyncio.Task] = None
+        self._watchdog: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._heartbeat = time.monotonic()
+        self._reported_heartbeat = 0.0
+
+    def start(self):
+        """Starts sampling on the running loop. Must be called from inside the loop."""
+        if self._task is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        # Used by asyncio itself when the loop runs in debug mode (PYTHONASYNCIODEBUG=1)
+        self._loop.slow_callback_duration = self.slow_threshold
+        self._heartbeat = time.monotonic()
+        self._stop.clear()
+        self._task = self._loop.create_task(self._sample())
+        self._watchdog = threading.Thread(target=self._watch, name="loop-lag-watchdog", daemon=True)
+        self._watchdog.start()
+        logger.info("Event loop monitor started (interval=%ss, slow threshold=%sms)",
+                    self.interval, int(self.slow_threshold * 1000))
+
+    async def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        logger.info("Event loop monitor stopped.")
+
+    async def _sample(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            scheduled = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = max(0.0, loop.time() - scheduled - self.interval)
+            self._heartbeat = time.monotonic()
+            metrics.observe("event_loop_lag_ms", lag * 1000)
+            if lag >= self.slow_threshold:
+                metrics.inc("event_loop_slow_intervals")
+                logger.warning("Event loop was blocked for %.0f ms", lag * 1000)
+
+    def _watch(self):
+        check_every = max(0.01, self.slow_threshold / 2)
+        while not self._stop.wait(check_every):
+            heartbeat = self._heartbeat
+            stalled_for = time.monotonic() - heartbeat - self.interval
+            if stalled_for < self.slow_threshold or heartbeat == self._reported_heartbeat:
+                continue
+            # Report each stall once, with the stack that is holding the loop right now
+            self._reported_heartbeat = heartbeat
+            frame = sys._current_frames().get(self._loop_thread_id)
+            stack = "".join(traceback.format_stack(frame)) if frame is not None else "<loop thread not found>"
+            metrics.inc("event_loop_stalls")
+            logger.warning("Event loop stalled for more than %.0f ms; loop thread stack:\n%s",
+                           stalled_for * 1000, stack)
@@ -0,0 +1,121 @@
+import time
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Callable, Deque, Dict, Tuple
+
+logger = logging.getLogger(__name__)
+
+MetricKey = Tuple[str, Tuple[Tuple[str, str], ...]]
+
+
+def _key(name: str, labels: Dict[str, Any]) -> MetricKey:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_key(key: MetricKey) -> str:
+    name, labels = key
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+class _Histogram:
+    """Count/sum plus a bounded reservoir of the most recent samples for percentiles."""
+    __slots__ = ("count", "total", "max", "samples")
+
+    def __init__(self, size: int):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.samples: Deque[float] = deque(maxlen=size)
+
+    def observe(self, value: float):
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+        self.samples.append(value)
+
+    def summary(self) -> Dict[str, float]:
+        ordered = sorted(self.samples)
+
+        def pct(p: float) -> float:
+            if not ordered:
+                return 0.0
+            return ordered[min(len(ordered) - 1, int(p * len(ordered)))]
+
+        return {
+            "count": self.count,
+            "sum": round(self.total, 3),
+            "mean": round(self.total / self.count, 3) if self.count else 0.0,
+            "p50": round(pct(0.50), 3),
+            "p95": round(pct(0.95), 3),
+            "p99": round(pct(0.99), 3),
+            "max": round(self.max, 3),
+        }
+
+
+class MetricsRegistry:
+    """
+    Minimal in-process metrics store (per worker): counters, gauges and
+    histograms with recent-sample percentiles. Other components can plug in
+    their own stats through `register_collector`. Exposed at `/ops/metrics`.
+    """
+    RESERVOIR_SIZE = 1024
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[MetricKey, float] = {}
+        self._gauges: Dict[MetricKey, float] = {}
+        self._histograms: Dict[MetricKey, _Histogram] = {}
+        self._collectors: Dict[str, Callable[[], Dict[str, Any]]] = {}
+
+    def inc(self, name: str, value: float = 1, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name: str, value: float, **labels):
+        with self._lock:
+            self._gauges[_key(name, labels)] = value
+
+    def observe(self, name: str, value: float, **labels):
+        key = _key(name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram(self.RESERVOIR_SIZE)
+            histogram.observe(value)
+
+    @contextmanager
+    def timer(self, name: str, **labels):
+        """Observes the elapsed wall time of the block in milliseconds."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, (time.perf_counter() - start) * 1000, **labels)
+
+    def register_collector(self, name: str, collector: Callable[[], Dict[str, Any]]):
+        """Adds a callable whose returned dict is included in snapshots under `name`."""
+        self._collectors[name] = collector
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            data: Dict[str, Any] = {
+                "counters": {_format_key(k): v for k, v in self._counters.items()},
+                "gauges": {_format_key(k): v for k, v in self._gauges.items()},
+                "histograms": {_format_key(k): h.summary() for k, h in self._histograms.items()},
+            }
+        for name, collector in list(self._collectors.items()):
+            try:
+                data[name] = collector()
+            except Exception as e:
+                logger.error("Metrics collector '%s' failed: %s", name, e)
+        return data
+
+
+# Global registry shared by the whole worker
+metrics = MetricsRegistry()
@@ -0,0 +1,187 @@
+import re
+import math
+import logging
+import threading
+from typing import Any, Dict, NamedTuple, Optional, Tuple
+
+from .config import get_settings
+from .intents import OTHER, intent_router
+from .knowledge import normalize_text
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.model_router")
+
+# USD per million tokens (prompt, completion); models not listed are tracked without cost
+MODEL_PRICES: Dict[str, Tuple[float, float]] = {
+    "gpt-4-turbo": (10.0, 30.0),
+    "gpt-4o": (2.5, 10.0),
+    "gpt-4o-mini": (0.15, 0.6),
+    "gpt-4.1": (2.0, 8.0),
+    "gpt-4.1-mini": (0.4, 1.6),
+    "gpt-4.1-nano": (0.1, 0.4),
+}
+
+# Lead fields that describe the event (see `conversation_stage`)
+_EVENT_FIELDS = ("event_type", "event_date", "attendees", "plan_interest")
+
+# Requests that need reasoning over several plans or a tailored answer
+_COMPLEX_RE = re.compile(
+    r"\b(compar\w*|diferencia\w*|recomienda\w*|recomendar\w*|mejor opcion|presupuesto\w*|por que|explica\w*"
+    r"|personaliza\w*|integra\w*|contrato|descuento\w*|negocia\w*|ventajas|desventajas|versus|vs)\b"
+)
+# Personal data in the message: the assistant may save the contact (tool call)
+_TOOL_HINT_RE = re.compile(r"@|\d{9,}|\b(me llamo|mi nombre|mi email|mi correo|mi telefono|apunta|guarda)\b")
+
+
+def model_cost(model: Optional[str], prompt_tokens: int, completion_tokens: int) -> Optional[float]:
+    """Cost in USD of a call, or None for models without a known price (dated variants use their base price)."""
+    for name in sorted(MODEL_PRICES, key=len, reverse=True):
+        if model and (model == name or model.startswith(name + "-20")):
+            prompt_price, completion_price = MODEL_PRICES[name]
+            return (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1_000_000
+    return None
+
+
+def conversation_stage(draft: Dict[str, Any], is_new: bool) -> str:
+    """'new' (first turn), 'discovery' (no lead data yet), 'qualifying' or 'closing' (name and event details known)."""
+    if is_new:
+        return "new"
+    event_fields = sum(1 for field in _EVENT_FIELDS if draft.get(field))
+    if draft.get("name") and event_fields >= 2:
+        return "closing"
+    return "qualifying" if draft else "discovery"
+
+
+class ModelChoice(NamedTuple):
+    model: Optional[str]  # None: the deployment's default model (cascade disabled)
+    tier: str             # "small" or "large"
+    score: float          # Estimated probability that the turn needs the large model
+    reason: str
+
+
+class ModelRouter:
+    """
+    Per-turn model cascade: a logistic score over cheap features of the turn
+    (length, number of questions, comparison/budget wording, personal data that may
+    trigger a tool call, small talk per the intent model, conversation stage)
+    estimates whether the large model is needed. Turns scored below `threshold` go
+    to `small_model`; turns within `margin` below it are escalated to `large_model`,
+    since a wrong cheap answer costs more than the price difference.
+
+    `record` tracks latency, tokens and cost per model (see `stats`), so the weights
+    and threshold can be tuned against real traffic.
+    """
+    BIAS = -1.5
+    WEIGHTS = {
+        "length": 0.04,       # Per word over 12, capped at 50 words
+        "questions": 0.8,     # Two or more questions
+        "complex": 1.2,       # Per complex-request word, at most two
+        "tool": 1.0,
+        "small_talk": -1.5,
+    }
+    STAGE_WEIGHTS = {"new": 0.0, "discovery": 0.0, "qualifying": 0.4, "closing": 0.8}
+
+    def __init__(self, small_model: str, large_model: str, threshold: float = 0.5, margin: float = 0.1,
+                 enabled: bool = True):
+        self.small_model = small_model
+        self.large_model = large_model
+        self.threshold = threshold
+        self.margin = margin
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._per_model: Dict[str, Dict[str, float]] = {}
+
+    def features(self, message: str, stage: str) -> Dict[str, float]:
+        normalized = " ".join(re.findall(r"[a-z0-9@]+", normalize_text(message)))
+        words = len(message.split())
+        intent = intent_router.classify(message)
+        return {
+            "length": max(0, min(words, 50) - 12),
+            "questions": 1.0 if message.count("?") >= 2 else 0.0,
+            "complex": float(min(len(_COMPLEX_RE.findall(normalized)), 2)),
+            "tool": 1.0 if _TOOL_HINT_RE.search(normalized) else 0.0,
+            "small_talk": 1.0 if intent is not None and intent.intent != OTHER
+                          and intent.confidence >= intent_router.threshold else 0.0,
+            "stage": self.STAGE_WEIGHTS.get(stage, 0.0),
+        }
+
+    def score(self, message: str, stage: str) -> float:
+        features = self.features(message, stage)
+        logit = self.BIAS + features.pop("stage") + sum(self.WEIGHTS[name] * value for name, value in features.items())
+        return 1 / (1 + math.exp(-logit))
+
+    def choose(self, message: str, stage: str, economy: bool = False) -> ModelChoice:
+        """`economy`: the user or deployment is over its budget, the turn runs on the small model."""
+        if economy:
+            metrics.inc("model_routed", tier="small", reason="budget", stage=stage)
+            return ModelChoice(self.small_model, "small", 0.0, "budget")
+        if not self.enabled:
+            return ModelChoice(None, "large", 1.0, "disabled")
+        score = round(self.score(message, stage), 3)
+        if score >= self.threshold:
+            choice = ModelChoice(self.large_model, "large", score, "complex")
+        elif score >= self.threshold - self.margin:
+            choice = ModelChoice(self.large_model, "large", score, "low_confidence")
+        else:
+            choice = ModelChoice(self.small_model, "small", score, "simple")
+        metrics.inc("model_routed", tier=choice.tier, reason=choice.reason, stage=stage)
+        logger.debug("Turn routed to %s (score %.2f, %s, stage %s)", choice.model, score, choice.reason, stage)
+        return choice
+
+    def escalate(self, choice: ModelChoice, reason: str) -> Optional[ModelChoice]:
+        """The large-model choice to retry a turn the small model failed, or None if it already ran on the large one."""
+        if choice.tier != "small":
+            return None
+        metrics.inc("model_escalations", reason=reason)
+        return ModelChoice(self.large_model, "large", choice.score, f"escalated_{reason}")
+
+    def record(self, model: Optional[str], latency_ms: float, prompt_tokens: int = 0, completion_tokens: int = 0):
+        """Records one finished turn of `model`: latency, tokens and cost."""
+        model = model or "default"
+        cost = model_cost(model, prompt_tokens, completion_tokens)
+        metrics.observe("model_turn_latency_ms", latency_ms, model=model)
+        metrics.inc("model_tokens", prompt_tokens, model=model, kind="prompt")
+        metrics.inc("model_tokens", completion_tokens, model=model, kind="completion")
+        if cost is not None:
+            metrics.inc("model_cost_usd", cost, model=model)
+        with self._lock:
+            totals = self._per_model.setdefault(
+                model, {"turns": 0, "latency_ms": 0.0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+            )
+            totals["turns"] += 1
+            totals["latency_ms"] += latency_ms
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["cost_usd"] += cost or 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            models = {
+                model: {
+                    "turns": int(t["turns"]),
+                    "mean_latency_ms": round(t["latency_ms"] / t["turns"], 1),
+                    "mean_prompt_tokens": round(t["prompt_tokens"] / t["turns"], 1),
+                    "mean_completion_tokens": round(t["completion_tokens"] / t["turns"], 1),
+                    "cost_usd": round(t["cost_usd"], 4),
+                    "cost_per_turn_usd": round(t["cost_usd"] / t["turns"], 5),
+                }
+                for model, t in self._per_model.items()
+            }
+        return {
+            "enabled": self.enabled,
+            "small_model": self.small_model,
+            "large_model": self.large_model,
+            "threshold": self.threshold,
+            "margin": self.margin,
+            "models": models,
+        }
+
+
+settings = get_settings()
+model_router = ModelRouter(
+    small_model=settings.MODEL_SMALL,
+    large_model=settings.MODEL_LARGE,
+    threshold=settings.MODEL_CASCADE_THRESHOLD,
+    enabled=settings.MODEL_CASCADE_ENABLED,
+)
+metrics.register_collector("model_router", model_router.stats)
@@ -0,0 +1,171 @@
+import os
+import sys
+import time
+import logging
+import functools
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("eventek_assistant.profiling")
+
+# Frames at the top of the loop thread's stack while it waits for I/O
+_IDLE_FUNCTIONS = frozenset({"select", "poll", "epoll", "_run_once"})
+
+
+class _SpanStats:
+    __slots__ = ("count", "total_ms", "max_ms")
+
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def add(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+
+class HotPathProfiler:
+    """
+    On-demand profiler for the webhook -> assistant -> WhatsApp hot path.
+
+    While active, a sampling thread snapshots the event loop thread's stack every
+    `interval_ms` and aggregates them as collapsed stacks (the input format of
+    flamegraph.pl and speedscope), and functions decorated with `@profiled`
+    record their wall time. A session ends after `requests` webhook requests or
+    `seconds`, whichever comes first. When inactive, the decorator costs a
+    single attribute check and no thread runs.
+
+    Each worker process has its own profiler; a session only sees the requests
+    served by the worker that received the start call.
+    """
+
+    def __init__(self):
+        self.active = False
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stacks: Counter = Counter()
+        self._spans: Dict[str, _SpanStats] = {}
+        self._idle_samples = 0
+        self._remaining_requests: Optional[int] = None
+        self._deadline: Optional[float] = None
+        self._started_at: Optional[float] = None
+        self._stopped_at: Optional[float] = None
+        self._interval = 0.005
+
+    def start(self, requests: Optional[int] = None, seconds: Optional[float] = None, interval_ms: float = 5.0):
+        """Starts a new session (discarding the previous results). Call from the event loop thread."""
+        with self._lock:
+            if self.active:
+                raise RuntimeError("A profiling session is already running.")
+            self._stacks = Counter()
+            self._spans = {}
+            self._idle_samples = 0
+            self._remaining_requests = requests
+            self._deadline = time.monotonic() + seconds if seconds else None
+            self._started_at = time.time()
+            self._stopped_at = None
+            self._interval = max(0.001, interval_ms / 1000)
+            self._stop_event.clear()
+            self.active = True
+        loop_thread_id = threading.get_ident()
+        self._thread = threading.Thread(target=self._sample_loop, args=(loop_thread_id,), name="hot-path-profiler", daemon=True)
+        self._thread.start()
+        logger.warning("Profiling started (requests=%s, seconds=%s, interval=%sms)", requests, seconds, interval_ms)
+
+    def stop(self):
+        with self._lock:
+            if not self.active:
+                return
+            self.active = False
+            self._stopped_at = time.time()
+        self._stop_event.set()
+        logger.warning("Profiling stopped: %d stack samples, %d idle samples.",
+                       sum(self._stacks.values()), self._idle_samples)
+
+    def request_finished(self):
+        """Counts one profiled webhook request and ends the session when the budget is used up."""
+        if self._remaining_requests is None:
+            return
+        self._remaining_requests -= 1
+        if self._remaining_requests <= 0:
+            self.stop()
+
+    def record_span(self, name: str, elapsed_ms: float):
+        with self._lock:
+            stats = self._spans.get(name)
+            if stats is None:
+                stats = self._spans[name] = _SpanStats()
+            stats.add(elapsed_ms)
+
+    def _sample_loop(self, loop_thread_id: int):
+        while not self._stop_event.wait(self._interval):
+            if self._deadline is not None and time.monotonic() >= self._deadline:
+                self.stop()
+                break
+            frame = sys._current_frames().get(loop_thread_id)
+            if frame is None:
+                continue
+            if frame.f_code.co_name in _IDLE_FUNCTIONS:
+                self._idle_samples += 1
+                continue
+            names: List[str] = []
+            while frame is not None:
+                code = frame.f_code
+                names.append(f"{os.path.basename(code.co_filename)}:{code.co_qualname}")
+                frame = frame.f_back
+            self._stacks[";".join(reversed(names))] += 1
+
+    def collapsed_stacks(self) -> str:
+        """Collapsed stack lines (`frame;frame;frame count`), ready for flamegraph.pl or speedscope."""
+        return "\n".join(f"{stack} {count}" for stack, count in self._stacks.most_common()) + "\n"
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = {
+                name: {
+                    "count": s.count,
+                    "total_ms": round(s.total_ms, 2),
+                    "mean_ms": round(s.total_ms / s.count, 2) if s.count else 0.0,
+                    "max_ms": round(s.max_ms, 2),
+                }
+                for name, s in self._spans.items()
+            }
+        return {
+            "active": self.active,
+            "started_at": self._started_at,
+            "stopped_at": self._stopped_at,
+            "remaining_requests": self._remaining_requests,
+            "samples": sum(self._stacks.values()),
+            "idle_samples": self._idle_samples,
+            "functions": spans,
+        }
+
+
+# Per-worker profiler instance
+profiler = HotPathProfiler()
+
+
+def profiled(name: str, request_boundary: bool = False):
+    """
+    Decorator for async hot-path functions. Records wall time under `name` while
+    a profiling session is active; `request_boundary=True` marks the function
+    that represents one webhook request for request-count based sessions.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            if not profiler.active:
+                return await func(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return await func(*args, **kwargs)
+            finally:
+                profiler.record_span(name, (time.perf_counter() - start) * 1000)
+                if request_boundary:
+                    profiler.request_finished()
+        return wrapper
+    return decorator
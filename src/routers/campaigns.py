@@ -0,0 +1,123 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from bson import ObjectId
+from datetime import datetime
+import logging
+from typing import Any, Dict, List, Literal, Optional
+from pydantic import BaseModel, Field, model_validator
+
+from ..security import require_admin
+from ..services.campaigns import campaign_engine
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/api/campaigns",
+    tags=["Campaigns"],
+    dependencies=[Depends(require_admin)],
+)
+
+
+class AudienceQuery(BaseModel):
+    """CRM contacts to reach; contacts without a phone are always excluded."""
+    plan_interest: Optional[List[str]] = None
+    event_type: Optional[List[str]] = None
+    source: Optional[List[str]] = None
+    added_after: Optional[datetime] = None
+    added_before: Optional[datetime] = None
+
+    def to_filter(self) -> Dict[str, Any]:
+        query: Dict[str, Any] = {"phone": {"$nin": [None, ""]}}
+        for field in ("plan_interest", "event_type", "source"):
+            values = getattr(self, field)
+            if values:
+                query[field] = {"$in": values}
+        if self.added_after or self.added_before:
+            query["added_on"] = {}
+            if self.added_after:
+                query["added_on"]["$gte"] = self.added_after
+            if self.added_before:
+                query["added_on"]["$lt"] = self.added_before
+        return query
+
+
+class CampaignMessage(BaseModel):
+    type: Literal["text", "template"] = "text"
+    text: Optional[str] = Field(None, max_length=4096, description="'{name}' is replaced by the first name")
+    template_name: Optional[str] = None
+    language_code: str = "es"
+    components: Optional[List[Dict[str, Any]]] = None
+
+    @model_validator(mode="after")
+    def check_content(self):
+        if self.type == "text" and not self.text:
+            raise ValueError("'text' is required for text messages")
+        if self.type == "template" and not self.template_name:
+            raise ValueError("'template_name' is required for template messages")
+        return self
+
+
+class CampaignCreate(BaseModel):
+    name: str = Field(..., min_length=1, max_length=200)
+    audience: AudienceQuery = Field(default_factory=AudienceQuery)
+    message: CampaignMessage
+    rate_per_second: Optional[float] = Field(None, gt=0, le=1000)
+    concurrency: Optional[int] = Field(None, ge=1, le=100)
+    start: bool = False
+
+
+def _object_id(campaign_id: str) -> ObjectId:
+    if not ObjectId.is_valid(campaign_id):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Campaign not found")
+    return ObjectId(campaign_id)
+
+
+@router.post("", status_code=status.HTTP_201_CREATED, summary="Create a broadcast campaign")
+async def create_campaign(body: CampaignCreate) -> Dict[str, Any]:
+    campaign = await campaign_engine.create(
+        body.name,
+        body.audience.to_filter(),
+        body.message.model_dump(exclude_none=True),
+        rate_per_second=body.rate_per_second,
+        concurrency=body.concurrency,
+    )
+    if body.start:
+        await campaign_engine.start(campaign["_id"])
+    return await campaign_engine.progress(campaign["_id"])
+
+
+@router.get("", summary="Campaigns and their progress")
+async def list_campaigns(limit: int = Query(50, ge=1, le=500)) -> List[Dict[str, Any]]:
+    return await campaign_engine.list_campaigns(limit)
+
+
+@router.get("/{campaign_id}", summary="Progress and throughput of a campaign")
+async def get_campaign(campaign_id: str) -> Dict[str, Any]:
+    progress = await campaign_engine.progress(_object_id(campaign_id))
+    if progress is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Campaign not found")
+    return progress
+
+
+@router.post("/{campaign_id}/start", summary="Start or resume a campaign on this worker")
+async def start_campaign(campaign_id: str) -> Dict[str, Any]:
+    oid = _object_id(campaign_id)
+    if await campaign_engine.start(oid) is None:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT,
+                            detail="Campaign not found, finished, or running on another worker")
+    return await campaign_engine.progress(oid)
+
+
+@router.post("/{campaign_id}/pause", summary="Pause a campaign (resumable from its checkpoint)")
+async def pause_campaign(campaign_id: str) -> Dict[str, Any]:
+    oid = _object_id(campaign_id)
+    if not await campaign_engine.stop_campaign(oid, "paused"):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Campaign not found or not active")
+    return {"id": campaign_id, "status": "pausing"}
+
+
+@router.post("/{campaign_id}/cancel", summary="Cancel a campaign")
+async def cancel_campaign(campaign_id: str) -> Dict[str, Any]:
+    oid = _object_id(campaign_id)
+    if not await campaign_engine.stop_campaign(oid, "cancelled"):
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Campaign not found or not active")
+    return {"id": campaign_id, "status": "cancelling"}
@@ -1,22 +1,37 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, status
-from fastapi.responses import RedirectResponse, HTMLResponse
+from fastapi.responses import RedirectResponse, HTMLResponse, Response, StreamingResponse
 from fastapi.templating import Jinja2Templates
+from jinja2 import FileSystemBytecodeCache
 from motor.motor_asyncio import AsyncIOMotorDatabase
 from bson import ObjectId
-from datetime import datetime, date
+from datetime import datetime, date, timezone
+import os
+import asyncio
 import logging
+import tempfile
 import traceback
 from pydantic import BaseModel, Field, EmailStr, ValidationError, field_validator
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
 # Assuming db, config, assistant_logic are in the parent directory 'src'
 from ..db import get_db
 from ..config import settings # If needed by CRM logic, otherwise remove
+from ..crm.hooks import contact_written
+from ..crm.live import contact_broker
+from ..crm.render_cache import cache_headers, dashboard_cache, is_not_modified
+from ..crm.rollups import read_rollups, rebuild_rollups
+from ..security import require_admin
 
 logger = logging.getLogger(__name__)
 
 # Setup templates
 templates = Jinja2Templates(directory="src/templates")
+# Compiled templates are cached in memory; the bytecode cache lets new workers skip compilation,
+# and template files are only re-checked for changes in DEBUG
+_bytecode_dir = os.path.join(tempfile.gettempdir(), "eventek-jinja-cache")
+os.makedirs(_bytecode_dir, exist_ok=True)
+templates.env.bytecode_cache = FileSystemBytecodeCache(_bytecode_dir)
+templates.env.auto_reload = settings.DEBUG
 
 router = APIRouter(
     tags=["CRM"], # Optional tag for API docs
@@ -49,6 +64,7 @@ class ContactSchema(BaseModel):
     attendees: Optional[int] = None
     plan_interest: Optional[str] = None
     notes: Optional[str] = None
+    source: Optional[str] = None # Where the lead came from: "whatsapp", "dashboard", ...
     added_on: datetime = Field(default_factory=datetime.now)
 
     class Config:
@@ -60,7 +76,23 @@ class ContactSchema(BaseModel):
 
 @router.get("/", response_class=HTMLResponse, summary="CRM Dashboard", name="crm_dashboard_page")
 async def crm_dashboard(request: Request, database: AsyncIOMotorDatabase = Depends(get_db)):
-    """Serves the main CRM dashboard page, fetching contacts from the database."""
+    """
+    Serves the main CRM dashboard page, fetching contacts from the database.
+    The rendered page is cached until the contacts change; conditional GETs get a 304.
+    """
+    base_url = str(request.base_url)
+    try:
+        token = await dashboard_cache.change_token(database)
+    except Exception as e:
+        logger.error("Error computing the contacts change token: %s", e)
+        token = None
+    if token is not None:
+        if is_not_modified(request.headers, token):
+            return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=cache_headers(token))
+        cached_body = dashboard_cache.get(base_url, token)
+        if cached_body is not None:
+            return HTMLResponse(cached_body, headers=cache_headers(token))
+
     try:
         contacts_cursor = database.contacts.find().sort("added_on", -1)
         contacts_list = await contacts_cursor.to_list(length=100) # Limit to 100 contacts for display
@@ -70,25 +102,28 @@ async def crm_dashboard(request: Request, database: AsyncIOMotorDatabase = Depen
             try:
                 contacts_models.append(ContactSchema.model_validate(c))
             except ValidationError as e:
-                logger.warning(f"Skipping contact due to validation error: {c.get('_id', 'N/A')} - {e}")
+                logger.warning("Skipping contact due to validation error: %s - %s", c.get('_id', 'N/A'), e)
                 continue # Skip contacts that don't match the schema
 
     except Exception as e:
-        logger.error(f"Error fetching contacts from DB for dashboard: {e}")
+        logger.error("Error fetching contacts from DB for dashboard: %s", e)
         logger.error(traceback.format_exc())
         contacts_models = [] # Ensure it's an empty list on error
 
-    return templates.TemplateResponse("crm_dashboard.html", {
-        "request": request,
+    response = templates.TemplateResponse(request, "crm_dashboard.html", {
         "contacts": contacts_models
     })
+    if token is not None:
+        dashboard_cache.put(base_url, token, response.body)
+        response.headers.update(cache_headers(token))
+    return response
 
 @router.post("/add_contact", summary="Add New Contact to MongoDB", name="add_contact")
 async def add_contact_entry(request: Request, database: AsyncIOMotorDatabase = Depends(get_db)):
     """Handles form submission to add a new contact."""
     try:
         form_data = await request.form()
-        logger.debug(f"Received form data: {form_data}")
+        logger.debug("Received form data: %s", form_data)
 
         attendees_str = form_data.get("attendees")
         attendees_int = int(attendees_str) if attendees_str and attendees_str.isdigit() else None
@@ -100,7 +135,7 @@ async def add_contact_entry(request: Request, database: AsyncIOMotorDatabase = D
                 parsed_date = date.fromisoformat(event_date_str)
                 event_date_obj = datetime.combine(parsed_date, datetime.min.time())
             except ValueError:
-                logger.warning(f"Invalid date format received: {event_date_str}")
+                logger.warning("Invalid date format received: %s", event_date_str)
 
         contact_data = {
             "name": form_data.get("name"),
@@ -112,6 +147,7 @@ async def add_contact_entry(request: Request, database: AsyncIOMotorDatabase = D
             "attendees": attendees_int,
             "plan_interest": form_data.get("plan_interest"),
             "notes": form_data.get("notes"),
+            "source": "dashboard",
             "added_on": datetime.now()
         }
 
@@ -119,21 +155,24 @@ async def add_contact_entry(request: Request, database: AsyncIOMotorDatabase = D
         try:
             validated_contact = ContactSchema(**contact_data)
         except ValidationError as e:
-            logger.error(f"Contact validation failed: {e}")
+            logger.error("Contact validation failed: %s", e)
             # Ideally, return an error message to the user instead of just redirecting
             # For now, redirect back to the form
             # Consider adding flash messages or similar feedback
             return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
 
         # Insert into MongoDB - Use model_dump to get dict suitable for DB
-        insert_result = await database.contacts.insert_one(validated_contact.model_dump(by_alias=True, exclude={'id'}))
-        logger.info(f"Inserted contact with ID: {insert_result.inserted_id}")
+        contact_document = validated_contact.model_dump(by_alias=True, exclude={'id'})
+        contact_document["updated_at"] = datetime.now(timezone.utc)
+        insert_result = await database.contacts.insert_one(contact_document)
+        logger.info("Inserted contact with ID: %s", insert_result.inserted_id)
+        await contact_written(contact_document, created=True)
 
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
 
     except Exception as e:
-        logger.error(f"Error adding contact to MongoDB: {e}")
-        logger.error(f"Traceback: {traceback.format_exc()}")
+        logger.error("Error adding contact to MongoDB: %s", e)
+        logger.error("Traceback: %s", traceback.format_exc())
         # Redirect even on error for now, but ideally show an error message
         return RedirectResponse(url="/", status_code=status.HTTP_303_SEE_OTHER)
 
@@ -147,8 +186,55 @@ async def get_all_contacts(database: AsyncIOMotorDatabase = Depends(get_db)):
         # Validate each contact - Pydantic handles validation via response_model
         return contacts_list
     except Exception as e:
-        logger.error(f"Error fetching contacts for API: {e}")
+        logger.error("Error fetching contacts for API: %s", e)
         logger.error(traceback.format_exc())
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch contacts")
 
+@router.get("/api/crm/stream", summary="Live contact updates (Server-Sent Events)")
+async def stream_contacts(request: Request):
+    """
+    Pushes new and updated contacts to the dashboard as they are written (`contact` events,
+    JSON data: {"created": bool, "contact": {...}}), with a keep-alive comment every 15 seconds.
+    """
+    queue = contact_broker.subscribe()
+
+    async def events():
+        try:
+            yield "retry: 5000\n\n"
+            while contact_broker.is_subscribed(queue):
+                try:
+                    yield await asyncio.wait_for(queue.get(), timeout=15)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        break
+                    yield ": keep-alive\n\n"
+        finally:
+            contact_broker.unsubscribe(queue)
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+
+@router.get("/api/crm/analytics", summary="Lead counts by day, plan, event type and source")
+async def get_crm_analytics(database: AsyncIOMotorDatabase = Depends(get_db)) -> Dict[str, Any]:
+    """Reads the incrementally maintained lead rollups (a single document, no collection scan)."""
+    try:
+        return await read_rollups(database)
+    except Exception as e:
+        logger.error("Error reading CRM rollups: %s", e)
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to fetch analytics")
+
+
+@router.post("/api/crm/analytics/rebuild", summary="Recompute lead rollups from all contacts",
+             dependencies=[Depends(require_admin)])
+async def rebuild_crm_analytics(database: AsyncIOMotorDatabase = Depends(get_db)) -> Dict[str, Any]:
+    """Full rebuild of the rollups, for backfills and after bulk imports or edits."""
+    try:
+        doc = await rebuild_rollups(database)
+    except Exception as e:
+        logger.error("Error rebuilding CRM rollups: %s", e)
+        logger.error(traceback.format_exc())
+        raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to rebuild analytics")
+    return {"status": "rebuilt", "total": doc["total"], "rebuilt_at": doc["rebuilt_at"]}
+
 # You could add more CRM-specific API endpoints here (e.g., get contact by ID, update, delete)
\ No newline at end of file
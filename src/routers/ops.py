@@ -0,0 +1,99 @@
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from fastapi.responses import PlainTextResponse
+import logging
+from typing import Any, Dict, Optional
+
+from ..hot_reload import hot_reloader
+from ..metrics import metrics
+from ..profiling import profiler
+from ..services.status_tracker import status_pipeline
+from ..services.usage_ledger import usage_ledger
+from ..security import require_admin
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter(
+    prefix="/ops",
+    tags=["Ops"],
+)
+
+
+@router.get("/metrics", summary="In-process metrics of this worker", dependencies=[Depends(require_admin)])
+async def get_metrics() -> Dict[str, Any]:
+    """Returns counters, gauges and latency percentiles collected by this worker."""
+    return metrics.snapshot()
+
+
+@router.get("/message-status", summary="Delivery status analytics of this worker",
+            dependencies=[Depends(require_admin)])
+async def get_message_status_stats() -> Dict[str, Any]:
+    """
+    Rolling delivery aggregates computed in memory from status callbacks: counts per
+    status, failure rate and failures by error code, and delivery/read latency.
+    The raw events are stored in the `message_statuses` collection.
+    """
+    return status_pipeline.stats()
+
+
+@router.post("/profile/start", summary="Profile the next N webhook requests or a time window",
+             dependencies=[Depends(require_admin)])
+async def start_profiling(
+    requests: Optional[int] = Query(None, ge=1, le=10000, description="Stop after this many webhook requests"),
+    seconds: Optional[float] = Query(None, gt=0, le=3600, description="Stop after this many seconds"),
+    interval_ms: float = Query(5.0, ge=1, le=100, description="Stack sampling interval"),
+) -> Dict[str, Any]:
+    """Starts a profiling session on this worker. At least one of `requests` or `seconds` is required."""
+    if requests is None and seconds is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Provide 'requests' and/or 'seconds'")
+    try:
+        profiler.start(requests=requests, seconds=seconds, interval_ms=interval_ms)
+    except RuntimeError as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e))
+    return profiler.status()
+
+
+@router.post("/profile/stop", summary="Stop the current profiling session", dependencies=[Depends(require_admin)])
+async def stop_profiling() -> Dict[str, Any]:
+    profiler.stop()
+    return profiler.status()
+
+
+@router.get("/profile", summary="Profiling status and per-function timings", dependencies=[Depends(require_admin)])
+async def get_profile() -> Dict[str, Any]:
+    return profiler.status()
+
+
+@router.get("/profile/collapsed", response_class=PlainTextResponse,
+            summary="Collapsed stacks of the last session (flamegraph.pl / speedscope)",
+            dependencies=[Depends(require_admin)])
+async def get_collapsed_stacks() -> PlainTextResponse:
+    return PlainTextResponse(profiler.collapsed_stacks(), headers={
+        "Content-Disposition": 'attachment; filename="eventek-profile.collapsed"'
+    })
+
+
+@router.post("/reload", summary="Reload changed knowledge and instruction files", dependencies=[Depends(require_admin)])
+async def reload_files(
+    force: bool = Query(False, description="Rebuild every target even if its files did not change"),
+) -> Dict[str, Any]:
+    """
+    Checks the watched files of this worker now instead of waiting for the next watcher tick.
+    Changes to the OpenAI assistant are pushed once across workers, even with `force`.
+    """
+    return {"results": await hot_reloader.check(force=force), **hot_reloader.status()}
+
+
+@router.get("/usage/top-spenders", summary="Users with the highest assistant cost", dependencies=[Depends(require_admin)])
+async def get_top_spenders(
+    days: int = Query(7, ge=1, le=90, description="Window in days, today included"),
+    limit: int = Query(20, ge=1, le=200),
+) -> Dict[str, Any]:
+    """Cost, turns and tokens per turn of the top spenders, from the `usage_daily` collection (all workers)."""
+    await usage_ledger.flush()
+    return {"days": days, "users": await usage_ledger.top_spenders(days=days, limit=limit)}
+
+
+@router.get("/usage/daily", summary="Tokens per turn and cost per day and model", dependencies=[Depends(require_admin)])
+async def get_daily_usage(days: int = Query(14, ge=1, le=365)) -> Dict[str, Any]:
+    await usage_ledger.flush()
+    return {"days": days, "daily": await usage_ledger.daily(days=days), "today": usage_ledger.stats()}
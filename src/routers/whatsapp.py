@@ -1,16 +1,30 @@
 from fastapi import APIRouter, Request, Depends, HTTPException, Response, Query, status
+import asyncio
 import logging
-import json
-import traceback
 import httpx
+from collections import OrderedDict
 from pydantic import BaseModel, Field
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
 
 # Assuming db, config, assistant_logic, services are in the parent directory 'src'
 from ..db import get_db # May not be needed if webhook doesn't directly use DB
 from ..config import settings
 from ..assistant_logic import CourseAssistant # Assuming CourseAssistant is needed here
 from ..services.whatsapp_service import WhatsAppService # Import the service
+from ..services.reply_segmenter import segment_stream, split_text
+from ..services.webhook_parser import InboundMessage, WebhookParseError, parse_webhook
+from ..services.status_tracker import status_pipeline
+from ..services.fanout import fan_out_by_sender
+from ..services.usage_ledger import LIMITED, usage_ledger
+from ..admission import AdmissionRejected, admission
+from ..intents import CannedReply, intent_router
+from ..interactive import InteractiveReply, answer_table
+from ..crm.contacts import upsert_contact_by_phone
+from ..lead_extraction import lead_extractor, to_contact_fields
+from ..metrics import metrics
+from ..profiling import profiled
+from ..security import verify_webhook_signature
+from ..snapshot import snapshots
 
 logger = logging.getLogger(__name__)
 
@@ -21,6 +35,8 @@ router = APIRouter(
 
 # --- Pydantic Models for WhatsApp ---
 # (Keep only the models specifically used by the webhook endpoints)
+# NOTE: incoming webhooks are parsed by services/webhook_parser.py, which extracts only the
+# fields we use; these models document the full payload shape.
 
 class WebhookVerification(BaseModel):
     hub_mode: str = Field(..., alias="hub.mode")
@@ -44,19 +60,73 @@ class WhatsAppWebhookPayload(BaseModel):
 
 # --- WhatsApp Helper Functions ---
 # (Moved from app.py - consider moving to whatsapp_service.py later if preferred)
+# Keep references to fire-and-forget tasks so they are not garbage collected mid-flight
+_background_tasks: set = set()
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+# IDs of recently handled messages: a valid signature does not stop a captured request from
+# being replayed, and Meta itself re-delivers calls it considers unanswered
+_SEEN_MESSAGE_LIMIT = 10000
+_seen_message_ids: "OrderedDict[str, None]" = OrderedDict()
+
+def _is_duplicate(message_id: Optional[str]) -> bool:
+    if not message_id:
+        return False
+    if message_id in _seen_message_ids:
+        return True
+    _seen_message_ids[message_id] = None
+    if len(_seen_message_ids) > _SEEN_MESSAGE_LIMIT:
+        _seen_message_ids.popitem(last=False)
+    return False
+
+def _restore_seen_message_ids(message_ids: List[str]):
+    for message_id in message_ids:
+        _is_duplicate(message_id)
+
+snapshots.register("seen_message_ids", lambda: list(_seen_message_ids), _restore_seen_message_ids)
+
 async def send_whatsapp_message(recipient_id: str, message: str):
-    """Sends a text message via the WhatsApp Business API."""
+    """Sends a text message via the WhatsApp Business API, split into several if it exceeds the length limit."""
     whatsapp_service = WhatsAppService()
     try:
-        result = await whatsapp_service.send_message(recipient_id, message)
-        logger.info(f"Message sent successfully to {recipient_id}: {result}")
+        result = None
+        for part in split_text(message):
+            result = await whatsapp_service.send_message(recipient_id, part)
+            logger.info("Message sent successfully to %s", recipient_id, extra={"high_volume": True})
+            logger.debug("WhatsApp send result: %s", result)
         return result
     except Exception as e:
         # Error logging is handled within WhatsAppService, re-raise or handle as needed
-        logger.error(f"Failed to send message via router function wrapper: {e}")
+        logger.error("Failed to send message via router function wrapper: %s", e)
         # Depending on desired behavior, you might raise HTTPException here
         raise
 
+@profiled("stream_reply_to_whatsapp")
+async def stream_reply_to_whatsapp(assistant: CourseAssistant, sender_id: str, text: str, message_id: Optional[str]) -> int:
+    """
+    Streams the assistant reply and sends it as several WhatsApp messages, one per
+    paragraph-sized segment, as soon as each segment is complete. Segments are sent
+    sequentially, so they arrive in order. Returns the number of messages sent.
+    """
+    if message_id:
+        _spawn(WhatsAppService().send_typing_indicator(message_id))
+
+    sent = 0
+    segments = segment_stream(
+        assistant.stream_message(sender_id, text),
+        first_min_chars=settings.STREAM_FIRST_SEGMENT_MIN_CHARS,
+        min_chars=settings.STREAM_SEGMENT_MIN_CHARS,
+    )
+    async for segment in segments:
+        await send_whatsapp_message(sender_id, segment)
+        sent += 1
+    return sent
+
 # --- WhatsApp Webhook Endpoints ---
 
 @router.get("", summary="Verify WhatsApp Webhook")
@@ -67,14 +137,14 @@ async def verify_webhook(
     hub_verify_token: str = Query(..., alias="hub.verify_token")
 ):
     """Handles WhatsApp webhook verification challenge."""
-    logger.debug(f"Webhook verification request received: mode={hub_mode}, token={hub_verify_token}, challenge={hub_challenge}")
+    logger.debug("Webhook verification request received: mode=%s, token=%s, challenge=%s", hub_mode, hub_verify_token, hub_challenge)
     # Use Pydantic for validation (optional but good practice)
     try:
         verification_data = WebhookVerification(
             **{"hub.mode": hub_mode, "hub.challenge": hub_challenge, "hub.verify_token": hub_verify_token}
         )
     except Exception as e:
-         logger.error(f"Webhook verification validation failed: {e}")
+         logger.error("Webhook verification validation failed: %s", e)
          raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid verification parameters")
 
     if verification_data.hub_mode == "subscribe" and verification_data.hub_verify_token == settings.WEBHOOK_VERIFY_TOKEN:
@@ -85,64 +155,156 @@ async def verify_webhook(
         raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Webhook verification failed")
 
 
+BUSY_REPLY = (
+    "¡Gracias por tu mensaje! 🙏 En este momento estamos atendiendo muchas consultas. "
+    "Por favor, escríbenos de nuevo en unos minutos y te responderemos enseguida."
+)
+LIMIT_REPLY = (
+    "¡Gracias por tu interés! 🙏 Hoy ya hemos respondido muchas de tus consultas por aquí. "
+    "Un miembro de nuestro equipo revisará la conversación y te contactará; también puedes escribir \"menu\" "
+    "para ver nuestros planes y datos de contacto."
+)
+
+
+async def send_canned_reply(recipient_id: str, reply: Union[CannedReply, InteractiveReply]):
+    if getattr(reply, "sections", None):
+        await WhatsAppService().send_interactive_list(recipient_id, reply.text, reply.list_button, reply.sections)
+    elif reply.buttons:
+        await WhatsAppService().send_interactive_buttons(recipient_id, reply.text, reply.buttons)
+    else:
+        await send_whatsapp_message(recipient_id, reply.text)
+
+
+async def fill_crm_fields(message: InboundMessage, fields: Dict[str, Any]):
+    try:
+        await upsert_contact_by_phone(message.sender_id, fields, name=message.profile_name)
+    except Exception as e:
+        logger.error("Error saving %s for %s: %s", sorted(fields), message.sender_id, e, exc_info=True)
+
+
+def capture_lead_fields(assistant: CourseAssistant, message: InboundMessage):
+    """Extracts lead fields from the text into the sender's draft and saves new values in the background."""
+    fields = lead_extractor.extract(message.text, sender_id=message.sender_id)
+    if not fields:
+        return
+    changed = assistant.conversation_manager.merge_lead_draft(message.sender_id, fields)
+    if changed:
+        logger.info("Captured lead fields %s from %s", sorted(changed), message.sender_id)
+        name = assistant.conversation_manager.get_lead_draft(message.sender_id).get("name") or message.profile_name
+        _spawn(fill_crm_fields(message._replace(profile_name=name), to_contact_fields(changed)))
+
+
+async def handle_text_message(assistant: CourseAssistant, message: InboundMessage):
+    """Runs the assistant for one inbound text message and delivers the reply."""
+    sender_id = message.sender_id
+    logger.info("Received message from %s (%d chars)", sender_id, len(message.text))
+    try:
+        if settings.LEAD_EXTRACTION_ENABLED:
+            capture_lead_fields(assistant, message)
+        # Greetings, thanks and menu requests are answered locally, without an assistant run
+        routed = intent_router.route(message.text) if settings.INTENT_ROUTER_ENABLED else None
+        if routed is not None:
+            intent, reply = routed
+            logger.info("Answered %s from %s locally (%s, %.2f)", intent.intent, sender_id, intent.source,
+                        intent.confidence, extra={"high_volume": True})
+            await send_canned_reply(sender_id, reply)
+            return
+        if usage_ledger.mode(sender_id) == LIMITED:
+            # Over the daily cost limit: local answers (menus, greetings) still work, assistant runs don't
+            metrics.inc("usage_limited_messages")
+            if usage_ledger.should_send_limit_notice(sender_id):
+                await send_whatsapp_message(sender_id, LIMIT_REPLY)
+            return
+        async with admission.admit(sender_id):
+            if settings.STREAM_REPLIES:
+                if not await stream_reply_to_whatsapp(assistant, sender_id, message.text, message.message_id):
+                    logger.info("No response generated for message from %s", sender_id)
+            else:
+                response_text = await assistant.process_message(sender_id, message.text)
+                if response_text:
+                    await send_whatsapp_message(sender_id, response_text)
+                else:
+                    logger.info("No response generated for message from %s", sender_id)
+    except AdmissionRejected:
+        if admission.should_send_busy_notice(sender_id):
+            await send_whatsapp_message(sender_id, BUSY_REPLY)
+    except Exception as e:
+        logger.error("Error processing message or sending reply to %s: %s", sender_id, e, exc_info=True)
+        # Optionally send an error message back to the user
+        # await send_whatsapp_message(sender_id, "Sorry, I encountered an error. Please try again later.")
+
+
+async def handle_inbound_message(assistant: CourseAssistant, message: InboundMessage):
+    """Dispatches one inbound message by type."""
+    if message.type == "text":
+        if message.text:
+            await handle_text_message(assistant, message)
+    # Handle other message types (image, audio, location, etc.) if needed
+    elif message.type in ("interactive", "button"):
+        logger.info("Received interactive message %s (reply id: %s)", message.message_id, message.reply_id)
+        answer = answer_table.resolve(message.reply_id)
+        if answer is not None:
+            # Choices from our own menus and lists: precomputed answer, no assistant run
+            if answer.crm_fields:
+                assistant.conversation_manager.merge_lead_draft(message.sender_id, answer.crm_fields)
+                _spawn(fill_crm_fields(message, answer.crm_fields))
+            try:
+                await send_canned_reply(message.sender_id, answer)
+            except Exception as e:
+                logger.error("Error sending interactive answer to %s: %s", message.sender_id, e, exc_info=True)
+        elif message.reply_title:
+            # Other buttons (e.g. template quick replies): the chosen title is answered like a typed message
+            await handle_text_message(assistant, message._replace(text=message.reply_title))
+    # Add more elif blocks for other types
+
+
 @router.post("", summary="Handle WhatsApp Messages")
+@profiled("handle_webhook", request_boundary=True)
 async def handle_webhook(request: Request, assistant: CourseAssistant = Depends()): # Inject assistant
     """Receives and processes incoming messages from WhatsApp."""
     payload_bytes = await request.body()
-    payload_str = payload_bytes.decode('utf-8')
-    logger.debug(f"Raw WhatsApp payload received: {payload_str}")
+    # Reject spoofed calls before any parsing or OpenAI work
+    if not verify_webhook_signature(payload_bytes, request.headers.get("X-Hub-Signature-256")):
+        logger.warning("Rejected webhook call with missing or invalid signature")
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid signature")
+
+    debug_enabled = logger.isEnabledFor(logging.DEBUG)
+    if debug_enabled:
+        logger.debug("Raw WhatsApp payload received: %s", payload_bytes.decode('utf-8', errors='replace'))
 
     try:
-        data = json.loads(payload_str)
-        # Validate payload structure (optional but recommended)
-        # payload = WhatsAppWebhookPayload.model_validate(data)
-
-        # Process messages
-        if data.get("object") == "whatsapp_business_account":
-            for entry in data.get("entry", []):
-                for change in entry.get("changes", []):
-                    value = change.get("value", {})
-                    if "messages" in value:
-                        for message_data in value.get("messages", []):
-                            if message_data.get("type") == "text":
-                                sender_id = message_data.get("from")
-                                text = message_data.get("text", {}).get("body")
-                                timestamp = message_data.get("timestamp")
-                                message_id = message_data.get("id")
-
-                                if sender_id and text:
-                                    logger.info(f"Received message from {sender_id}: '{text}'")
-                                    # Process message with assistant
-                                    try:
-                                        response_text = await assistant.process_message(sender_id, text)
-                                        if response_text:
-                                            await send_whatsapp_message(sender_id, response_text)
-                                        else:
-                                            logger.info(f"No response generated for message from {sender_id}")
-                                    except Exception as e:
-                                        logger.error(f"Error processing message or sending reply to {sender_id}: {e}")
-                                        logger.error(traceback.format_exc())
-                                        # Optionally send an error message back to the user
-                                        # await send_whatsapp_message(sender_id, "Sorry, I encountered an error. Please try again later.")
-                            # Handle other message types (image, audio, location, etc.) if needed
-                            elif message_data.get("type") == "interactive":
-                                # Handle button clicks, list replies etc.
-                                logger.info(f"Received interactive message: {message_data}")
-                                # Add specific logic here if needed
-                            # Add more elif blocks for other types
-                    elif "statuses" in value:
-                         # Handle message status updates (sent, delivered, read)
-                         for status_data in value.get("statuses", []):
-                             logger.debug(f"Received status update: {status_data}")
-                             # Add logic here if you need to track message delivery/read status
+        # Straight from bytes to compact records
+        parsed = parse_webhook(payload_bytes)
+    except WebhookParseError:
+        logger.error("Failed to decode JSON payload")
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON payload")
+
+    try:
+        # Handle message status updates (sent, delivered, read, failed): buffered, written in batches
+        if parsed.statuses:
+            if debug_enabled:
+                for status_event in parsed.statuses:
+                    logger.debug("Received status update: %s", status_event, extra={"high_volume": True})
+            status_pipeline.record(parsed.statuses)
+
+        new_messages = []
+        for message in parsed.messages:
+            if _is_duplicate(message.message_id):
+                metrics.inc("webhook_duplicate_messages")
+                logger.info("Ignoring already handled message %s", message.message_id)
+                continue
+            new_messages.append(message)
+
+        # Different senders concurrently, each sender's messages in order
+        await fan_out_by_sender(
+            new_messages,
+            lambda message: handle_inbound_message(assistant, message),
+            concurrency=settings.WEBHOOK_FANOUT_CONCURRENCY,
+        )
 
         return Response(status_code=status.HTTP_200_OK)
 
-    except json.JSONDecodeError:
-        logger.error("Failed to decode JSON payload")
-        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON payload")
     except Exception as e:
-        logger.error(f"Error processing webhook payload: {e}")
-        logger.error(traceback.format_exc())
+        logger.error("Error processing webhook payload: %s", e, exc_info=True)
         # Return 200 OK even on errors to prevent WhatsApp from resending excessively
         return Response(status_code=status.HTTP_200_OK)
@@ -0,0 +1,86 @@
+import time
+import asyncio
+import logging
+from typing import TYPE_CHECKING, Iterable, Optional
+
+from .metrics import metrics
+
+if TYPE_CHECKING:
+    from .assistant_logic import CourseAssistant
+
+logger = logging.getLogger("eventek_assistant.run_reaper")
+
+# Statuses of a run that nobody will complete any more (cancelling resolves on its own)
+_STUCK_STATUSES = ("queued", "in_progress", "requires_action")
+
+
+class RunReaper:
+    """
+    Background task that cancels orphaned Assistants API runs.
+
+    A run stays active on OpenAI when the worker driving it died, restarted or
+    gave up without cancelling it, and it keeps its thread locked until it
+    expires (up to 10 minutes). At startup the reaper checks every thread the
+    conversation manager knows; afterwards, every `interval` seconds, it checks
+    the threads that had a run started here more than `max_run_age` seconds ago.
+    Active runs older than `max_run_age` that this worker is not driving are
+    cancelled.
+    """
+
+    def __init__(self, assistant: "CourseAssistant", interval: float = 300, max_run_age: float = 180,
+                 concurrency: int = 5):
+        self.assistant = assistant
+        self.interval = interval
+        self.max_run_age = max_run_age
+        self.concurrency = concurrency
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info("Run reaper started (interval=%ss, max run age=%ss)", self.interval, self.max_run_age)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        await self.sweep(self.assistant.conversation_manager.thread_ids())
+        while True:
+            await asyncio.sleep(self.interval)
+            await self.sweep(self.assistant.pop_threads_to_check(self.max_run_age))
+
+    async def sweep(self, thread_ids: Iterable[str]) -> int:
+        """Checks the given threads and cancels their stuck runs. Returns the number of runs cancelled."""
+        thread_ids = list(thread_ids)
+        if not thread_ids:
+            return 0
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def check(thread_id: str) -> int:
+            async with semaphore:
+                page = await self.assistant.client.beta.threads.runs.list(thread_id=thread_id, limit=3)
+                reaped = 0
+                for run in page.data:
+                    if (run.status in _STUCK_STATUSES
+                            and run.id not in self.assistant.active_runs
+                            and time.time() - run.created_at > self.max_run_age):
+                        if await self.assistant.cancel_run(thread_id, run.id, reason="reaped"):
+                            reaped += 1
+                return reaped
+
+        results = await asyncio.gather(*(check(t) for t in thread_ids), return_exceptions=True)
+        reaped = sum(r for r in results if isinstance(r, int))
+        errors = sum(1 for r in results if isinstance(r, Exception))
+        metrics.inc("run_reaper_sweeps")
+        if reaped or errors:
+            logger.warning("Run reaper checked %d threads: %d stuck runs cancelled, %d errors",
+                           len(thread_ids), reaped, errors)
+        else:
+            logger.debug("Run reaper checked %d threads, nothing to cancel", len(thread_ids))
+        return reaped
@@ -0,0 +1,54 @@
+import hmac
+import hashlib
+import logging
+from typing import Optional
+
+from fastapi import Header, HTTPException, status
+
+from .config import settings
+from .metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+
+async def require_admin(x_admin_token: Optional[str] = Header(None)):
+    """
+    FastAPI dependency protecting operational endpoints. Requests must send the
+    `X-Admin-Token` header matching ADMIN_TOKEN; when ADMIN_TOKEN is not set the
+    endpoints are disabled.
+    """
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Admin endpoints are disabled")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token.encode(), settings.ADMIN_TOKEN.encode()):
+        logger.warning("Rejected admin request with missing or invalid token.")
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid admin token")
+
+
+_SIGNATURE_PREFIX = "sha256="
+_APP_SECRET = settings.WHATSAPP_APP_SECRET.encode() if settings.WHATSAPP_APP_SECRET else None
+
+if _APP_SECRET is None:
+    logger.warning("WHATSAPP_APP_SECRET is not set: webhook signatures will NOT be verified.")
+
+
+def verify_webhook_signature(body: bytes, signature_header: Optional[str]) -> bool:
+    """
+    Checks the `X-Hub-Signature-256` header Meta sends with every webhook call:
+    `sha256=` followed by the hex HMAC-SHA256 of the raw request body keyed with
+    the app secret. Must be called on the exact bytes received, before any
+    parsing. Always true when WHATSAPP_APP_SECRET is not configured.
+    """
+    if _APP_SECRET is None:
+        return True
+    if not signature_header:
+        metrics.inc("webhook_signature_rejected", reason="missing")
+        return False
+    if not signature_header.startswith(_SIGNATURE_PREFIX):
+        metrics.inc("webhook_signature_rejected", reason="malformed")
+        return False
+    expected = hmac.new(_APP_SECRET, body, hashlib.sha256).hexdigest()
+    received = signature_header[len(_SIGNATURE_PREFIX):].strip().lower().encode()
+    if not hmac.compare_digest(expected.encode(), received):
+        metrics.inc("webhook_signature_rejected", reason="mismatch")
+        return False
+    return True
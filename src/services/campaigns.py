@@ -0,0 +1,426 @@
+import os
+import time
+import socket
+import asyncio
+import logging
+from collections import deque
+from datetime import datetime, timedelta, timezone
+from typing import Any, Deque, Dict, Optional, Set
+
+import httpx
+from bson import ObjectId
+from pymongo import ReturnDocument
+
+from ..admission import TokenBucket
+from ..config import get_settings
+from ..db import get_db
+from ..metrics import metrics
+from .whatsapp_service import WhatsAppService
+
+logger = logging.getLogger(__name__)
+
+COLLECTION = "campaigns"
+FINAL_STATUSES = ("completed", "cancelled", "failed")
+# Graph API throttling errors: retried with backoff instead of counted as failures
+THROTTLING_CODES = {4, 80007, 130429, 131048, 131056}
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: Optional[datetime]) -> Optional[datetime]:
+    if value is not None and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)  # Mongo returns naive UTC datetimes
+    return value
+
+
+def normalize_phone(phone: Any) -> Optional[str]:
+    """WhatsApp recipient ID from a stored phone ('+34 600-11-22-33' -> '34600112233')."""
+    digits = "".join(ch for ch in str(phone or "") if ch.isdigit())
+    return digits if len(digits) >= 8 else None
+
+
+class Watermark:
+    """
+    Highest contact `_id` below which every recipient has been handled.
+
+    Recipients are dispatched in `_id` order but finish out of order, so the watermark
+    only advances over a contiguous prefix of finished IDs. Memory is bounded by the
+    number of recipients in flight (queue + workers), not by the audience size.
+    """
+
+    def __init__(self, start: Optional[ObjectId] = None):
+        self.value = start
+        self._order: Deque[ObjectId] = deque()
+        self._done: Set[ObjectId] = set()
+
+    def dispatched(self, contact_id: ObjectId):
+        self._order.append(contact_id)
+
+    def done(self, contact_id: ObjectId):
+        self._done.add(contact_id)
+        while self._order and self._order[0] in self._done:
+            self.value = self._order.popleft()
+            self._done.discard(self.value)
+
+
+class CampaignRun:
+    """
+    Sends one campaign from this worker.
+
+    A producer streams recipients from a MongoDB cursor (sorted by `_id`, starting
+    after the checkpoint) into a small bounded queue; `concurrency` workers take
+    recipients from it and send through a shared token bucket of `rate_per_second`.
+    Every `checkpoint_every` seconds the watermark and the counters are written to
+    the campaign document, together with the lease that marks this worker as owner.
+    After a crash another worker resumes from the watermark: recipients that were in
+    flight at the crash may receive the message twice, nobody is skipped.
+    """
+
+    def __init__(self, engine: "CampaignEngine", campaign: Dict[str, Any]):
+        self.engine = engine
+        self.campaign_id: ObjectId = campaign["_id"]
+        self.message: Dict[str, Any] = campaign["message"]
+        self.audience: Dict[str, Any] = campaign.get("audience") or {}
+        self.concurrency = max(1, int(campaign.get("concurrency") or engine.concurrency))
+        rate = float(campaign.get("rate_per_second") or engine.rate_per_second)
+        self.bucket = TokenBucket(rate=rate, capacity=max(1.0, rate))
+        self.watermark = Watermark(campaign.get("checkpoint"))
+        counts = campaign.get("counts") or {}
+        self.sent = counts.get("sent", 0)
+        self.failed = counts.get("failed", 0)
+        self.skipped = counts.get("skipped", 0)
+        self.last_errors: Deque[str] = deque(campaign.get("last_errors") or [], maxlen=10)
+        self._recent: Deque[float] = deque()  # Monotonic send times of the last minute
+        self._stop_status: Optional[str] = None
+        self.task: Optional[asyncio.Task] = None
+
+    # --- Progress ---
+
+    def throughput(self) -> float:
+        """Messages per second over the last minute."""
+        cutoff = time.monotonic() - 60
+        while self._recent and self._recent[0] < cutoff:
+            self._recent.popleft()
+        if not self._recent:
+            return 0.0
+        return round(len(self._recent) / max(1.0, min(60.0, time.monotonic() - self._recent[0])), 2)
+
+    def counts(self) -> Dict[str, int]:
+        return {"sent": self.sent, "failed": self.failed, "skipped": self.skipped}
+
+    def request_stop(self, status: str):
+        """Stops dispatching; in-flight sends finish and a final checkpoint is written."""
+        self._stop_status = status
+
+    # --- Pipeline ---
+
+    async def run(self):
+        db = await get_db()
+        query = dict(self.audience)
+        if self.watermark.value is not None:
+            query["_id"] = {"$gt": self.watermark.value}
+        cursor = db.contacts.find(query, {"phone": 1, "name": 1}).sort("_id", 1).batch_size(500)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.concurrency * 4)
+
+        async def produce():
+            try:
+                async for contact in cursor:
+                    if self._stop_status:
+                        break
+                    self.watermark.dispatched(contact["_id"])
+                    await queue.put(contact)
+            finally:
+                await cursor.close()
+                for _ in range(self.concurrency):
+                    await queue.put(None)
+
+        async def work():
+            while True:
+                contact = await queue.get()
+                if contact is None:
+                    return
+                if self._stop_status:
+                    continue  # Not marked done: the watermark stays before it
+                await self._deliver(contact)
+                self.watermark.done(contact["_id"])
+
+        checkpointer = asyncio.create_task(self._checkpoint_loop())
+        status = "completed"
+        try:
+            await asyncio.gather(produce(), *(work() for _ in range(self.concurrency)))
+            status = self._stop_status or "completed"
+        except asyncio.CancelledError:
+            status = self._stop_status or "running"  # Worker shutdown: released for another worker
+            raise
+        except Exception as e:
+            logger.error("Campaign %s failed: %s", self.campaign_id, e, exc_info=True)
+            self.last_errors.append(f"pipeline: {e}")
+            status = "failed"
+        finally:
+            checkpointer.cancel()
+            await asyncio.shield(self._checkpoint(final_status=status))
+            self.engine._runs.pop(self.campaign_id, None)
+            logger.info("Campaign %s stopped: %s (sent=%d failed=%d skipped=%d)",
+                        self.campaign_id, status, self.sent, self.failed, self.skipped)
+
+    async def _acquire(self):
+        while not self.bucket.try_acquire():
+            await asyncio.sleep(max(0.01, (1 - self.bucket.tokens) / self.bucket.rate))
+
+    async def _deliver(self, contact: Dict[str, Any]):
+        recipient = normalize_phone(contact.get("phone"))
+        if recipient is None:
+            self.skipped += 1
+            metrics.inc("campaign_messages", outcome="skipped")
+            return
+        for attempt in range(4):
+            await self._acquire()
+            try:
+                await self._send(recipient, contact)
+                self.sent += 1
+                self._recent.append(time.monotonic())
+                metrics.inc("campaign_messages", outcome="sent")
+                return
+            except httpx.HTTPStatusError as e:
+                code = _graph_error_code(e.response)
+                if (e.response.status_code == 429 or code in THROTTLING_CODES) and attempt < 3:
+                    metrics.inc("campaign_throttled")
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                error = f"{recipient}: HTTP {e.response.status_code} code={code}"
+            except httpx.TransportError as e:
+                if attempt < 3:
+                    await asyncio.sleep(2 ** attempt)
+                    continue
+                error = f"{recipient}: {type(e).__name__}"
+            except Exception as e:
+                logger.error("Campaign %s: error sending to %s: %s", self.campaign_id, recipient, e, exc_info=True)
+                error = f"{recipient}: {e}"
+            self.failed += 1
+            self.last_errors.append(error)
+            metrics.inc("campaign_messages", outcome="failed")
+            return
+
+    async def _send(self, recipient: str, contact: Dict[str, Any]):
+        service = self.engine.whatsapp
+        if self.message.get("type") == "template":
+            await service.send_template(recipient, self.message["template_name"],
+                                        self.message.get("language_code") or "es",
+                                        self.message.get("components"))
+        else:
+            first_name = (str(contact.get("name") or "").split() or [""])[0]
+            await service.send_message(recipient, self.message["text"].replace("{name}", first_name))
+
+    # --- Checkpoints ---
+
+    async def _checkpoint_loop(self):
+        while True:
+            await asyncio.sleep(self.engine.checkpoint_every)
+            try:
+                await self._checkpoint()
+            except Exception as e:
+                logger.error("Campaign %s checkpoint failed: %s", self.campaign_id, e)
+
+    async def _checkpoint(self, final_status: Optional[str] = None):
+        """Persists watermark and counters; renews the lease, or releases it with `final_status`."""
+        update: Dict[str, Any] = {
+            "checkpoint": self.watermark.value,
+            "counts": self.counts(),
+            "last_errors": list(self.last_errors),
+            "checkpointed_at": _utcnow(),
+        }
+        if final_status is None:
+            update["lease_until"] = _utcnow() + timedelta(seconds=self.engine.lease_seconds)
+        else:
+            update.update(status=final_status, owner=None, lease_until=None)
+            if final_status in FINAL_STATUSES:
+                update["finished_at"] = _utcnow()
+        db = await get_db()
+        doc = await db[COLLECTION].find_one_and_update(
+            {"_id": self.campaign_id, "owner": self.engine.worker_id},
+            {"$set": update},
+            projection={"status": 1},
+        )
+        if doc is None:
+            # Lease lost (another worker took over after a stall): stop without sending duplicates
+            self.request_stop("running")
+        elif final_status is None and doc.get("status") != "running":
+            self.request_stop(doc["status"])  # Paused or cancelled through another worker
+
+
+def _graph_error_code(response: httpx.Response) -> Optional[int]:
+    try:
+        return response.json().get("error", {}).get("code")
+    except (ValueError, AttributeError):
+        return None
+
+
+class CampaignEngine:
+    """
+    Broadcast campaigns over CRM contacts, stored in the `campaigns` collection.
+
+    A campaign is claimed by one worker at a time through a lease (`owner`,
+    `lease_until`) renewed at every checkpoint. Campaigns left `running` by a crashed
+    or stopped worker are picked up again by `resume_orphaned` once the lease expires.
+    """
+
+    def __init__(self, rate_per_second: float = 20.0, concurrency: int = 8,
+                 checkpoint_every: float = 5.0, lease_seconds: float = 60.0):
+        self.rate_per_second = rate_per_second
+        self.concurrency = concurrency
+        self.checkpoint_every = checkpoint_every
+        self.lease_seconds = lease_seconds
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}"
+        self.whatsapp = WhatsAppService()
+        self._runs: Dict[ObjectId, CampaignRun] = {}
+        self._resume_task: Optional[asyncio.Task] = None
+
+    async def create(self, name: str, audience: Dict[str, Any], message: Dict[str, Any],
+                     rate_per_second: Optional[float] = None, concurrency: Optional[int] = None) -> Dict[str, Any]:
+        db = await get_db()
+        doc = {
+            "name": name,
+            "audience": audience,
+            "message": message,
+            "rate_per_second": rate_per_second or self.rate_per_second,
+            "concurrency": concurrency or self.concurrency,
+            "status": "draft",
+            "total": await db.contacts.count_documents(audience),
+            "counts": {"sent": 0, "failed": 0, "skipped": 0},
+            "checkpoint": None,
+            "owner": None,
+            "lease_until": None,
+            "created_at": _utcnow(),
+        }
+        result = await db[COLLECTION].insert_one(doc)
+        doc["_id"] = result.inserted_id
+        logger.info("Created campaign %s '%s' for %d contacts", doc["_id"], name, doc["total"])
+        return doc
+
+    async def start(self, campaign_id: ObjectId) -> Optional[Dict[str, Any]]:
+        """Claims the campaign (draft, paused or orphaned) and runs it on this worker."""
+        db = await get_db()
+        now = _utcnow()
+        campaign = await db[COLLECTION].find_one_and_update(
+            {"_id": campaign_id, "$or": [
+                {"status": {"$in": ["draft", "paused"]}},
+                {"status": "running", "$or": [{"lease_until": None}, {"lease_until": {"$lt": now}}]},
+            ]},
+            {"$set": {"status": "running", "owner": self.worker_id,
+                      "lease_until": now + timedelta(seconds=self.lease_seconds)},
+             "$min": {"started_at": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if campaign is None:
+            return None
+        run = CampaignRun(self, campaign)
+        self._runs[campaign_id] = run
+        run.task = asyncio.create_task(run.run())
+        logger.info("Campaign %s running on %s from checkpoint %s", campaign_id, self.worker_id, run.watermark.value)
+        return campaign
+
+    async def stop_campaign(self, campaign_id: ObjectId, status: str) -> bool:
+        """Pauses or cancels a campaign, whichever worker runs it."""
+        run = self._runs.get(campaign_id)
+        if run is not None:
+            run.request_stop(status)
+            return True
+        db = await get_db()
+        # The owning worker sees the new status at its next checkpoint
+        result = await db[COLLECTION].update_one(
+            {"_id": campaign_id, "status": {"$in": ["draft", "running", "paused"]}},
+            {"$set": {"status": status}},
+        )
+        return result.modified_count == 1
+
+    async def progress(self, campaign_id: ObjectId) -> Optional[Dict[str, Any]]:
+        db = await get_db()
+        campaign = await db[COLLECTION].find_one({"_id": campaign_id})
+        if campaign is None:
+            return None
+        return self._progress(campaign)
+
+    async def list_campaigns(self, limit: int = 50) -> list:
+        db = await get_db()
+        campaigns = await db[COLLECTION].find().sort("created_at", -1).to_list(length=limit)
+        return [self._progress(c) for c in campaigns]
+
+    def _progress(self, campaign: Dict[str, Any]) -> Dict[str, Any]:
+        run = self._runs.get(campaign["_id"])
+        counts = run.counts() if run is not None else campaign.get("counts") or {}
+        done = sum(counts.values())
+        total = campaign.get("total") or 0
+        started_at = _as_utc(campaign.get("started_at"))
+        finished_at = _as_utc(campaign.get("finished_at"))
+        elapsed = ((finished_at or _utcnow()) - started_at).total_seconds() if started_at else 0.0
+        throughput = run.throughput() if run is not None else None
+        remaining = max(0, total - done)
+        return {
+            "id": str(campaign["_id"]),
+            "name": campaign.get("name"),
+            "status": campaign.get("status"),
+            "owner": campaign.get("owner"),
+            "total": total,
+            **counts,
+            "percent": round(100.0 * done / total, 1) if total else 100.0,
+            "avg_per_second": round(done / elapsed, 2) if elapsed > 0 else 0.0,
+            "current_per_second": throughput,
+            "eta_seconds": round(remaining / throughput) if throughput else None,
+            "checkpoint": str(campaign["checkpoint"]) if campaign.get("checkpoint") else None,
+            "last_errors": list(run.last_errors) if run is not None else campaign.get("last_errors", []),
+            "created_at": campaign.get("created_at"),
+            "started_at": started_at,
+            "finished_at": finished_at,
+        }
+
+    async def resume_orphaned(self) -> int:
+        """Starts the running campaigns whose owner released or lost the lease."""
+        db = await get_db()
+        ids = await db[COLLECTION].distinct("_id", {
+            "status": "running", "$or": [{"lease_until": None}, {"lease_until": {"$lt": _utcnow()}}],
+        })
+        resumed = 0
+        for campaign_id in ids:
+            if await self.start(campaign_id) is not None:
+                resumed += 1
+        return resumed
+
+    async def _resume_loop(self):
+        while True:
+            try:
+                resumed = await self.resume_orphaned()
+                if resumed:
+                    logger.info("Resumed %d interrupted campaign(s)", resumed)
+            except Exception as e:
+                logger.error("Campaign resume check failed: %s", e)
+            await asyncio.sleep(self.lease_seconds)
+
+    def start_background(self):
+        if self._resume_task is None:
+            self._resume_task = asyncio.create_task(self._resume_loop())
+
+    async def stop(self):
+        """Worker shutdown: checkpoints and releases the campaigns of this worker for the others."""
+        if self._resume_task is not None:
+            self._resume_task.cancel()
+            self._resume_task = None
+        tasks = [run.task for run in self._runs.values() if run.task is not None]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "running": len(self._runs),
+            "per_second": sum(run.throughput() for run in self._runs.values()),
+        }
+
+
+settings = get_settings()
+campaign_engine = CampaignEngine(
+    rate_per_second=settings.CAMPAIGN_RATE_PER_SECOND,
+    concurrency=settings.CAMPAIGN_CONCURRENCY,
+)
+metrics.register_collector("campaigns", campaign_engine.stats)
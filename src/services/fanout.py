@@ -0,0 +1,44 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Iterable, List
+
+from .webhook_parser import InboundMessage
+
+logger = logging.getLogger(__name__)
+
+MessageHandler = Callable[[InboundMessage], Awaitable[None]]
+
+
+def group_by_sender(messages: Iterable[InboundMessage]) -> Dict[str, List[InboundMessage]]:
+    """Groups messages per sender, keeping the payload order within each sender."""
+    groups: Dict[str, List[InboundMessage]] = {}
+    for message in messages:
+        groups.setdefault(message.sender_id, []).append(message)
+    return groups
+
+
+async def fan_out_by_sender(messages: Iterable[InboundMessage], handler: MessageHandler, concurrency: int = 5):
+    """
+    Runs `handler` for every message: senders are processed concurrently (at most
+    `concurrency` messages in progress at a time), the messages of one sender strictly
+    one after another, in payload order. A failing message is logged and does not stop
+    the remaining messages of that sender or of other senders.
+    """
+    groups = group_by_sender(messages)
+    if not groups:
+        return
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def run_sender(sender_messages: List[InboundMessage]):
+        for message in sender_messages:
+            async with semaphore:
+                try:
+                    await handler(message)
+                except Exception as e:
+                    logger.error("Error handling message %s from %s: %s",
+                                 message.message_id, message.sender_id, e, exc_info=True)
+
+    if len(groups) == 1:
+        await run_sender(next(iter(groups.values())))
+    else:
+        await asyncio.gather(*(run_sender(group) for group in groups.values()))
@@ -0,0 +1,83 @@
+import re
+from typing import AsyncIterator, List
+
+# WhatsApp Cloud API rejects text bodies longer than this
+WHATSAPP_MAX_TEXT_LENGTH = 4096
+
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+# End of a sentence: punctuation (optionally closed by quotes/brackets) followed by whitespace
+_SENTENCE_END = re.compile(r"[.!?…:](?:[\"'»)\]]*)\s+")
+
+
+def _last_boundary(pattern: re.Pattern, text: str, min_pos: int) -> int:
+    """Returns the end index of the last `pattern` match ending at or after `min_pos`, or -1."""
+    end = -1
+    for match in pattern.finditer(text):
+        if match.end() >= min_pos:
+            end = match.end()
+    return end
+
+
+def _hard_cut(text: str, limit: int) -> int:
+    """Best cut position not exceeding `limit`: paragraph, sentence, line, word, or raw length."""
+    window = text[:limit]
+    for pattern in (_PARAGRAPH_BREAK, _SENTENCE_END):
+        cut = _last_boundary(pattern, window, limit // 2)
+        if cut > 0:
+            return cut
+    for separator in ("\n", " "):
+        cut = window.rfind(separator)
+        if cut > limit // 2:
+            return cut + 1
+    return limit
+
+
+def split_text(text: str, limit: int = WHATSAPP_MAX_TEXT_LENGTH) -> List[str]:
+    """Splits a complete reply into WhatsApp-sized messages at natural boundaries."""
+    parts = []
+    remaining = text.strip()
+    while len(remaining) > limit:
+        cut = _hard_cut(remaining, limit)
+        parts.append(remaining[:cut].strip())
+        remaining = remaining[cut:].strip()
+    if remaining:
+        parts.append(remaining)
+    return [p for p in parts if p]
+
+
+async def segment_stream(
+    deltas: AsyncIterator[str],
+    first_min_chars: int = 80,
+    min_chars: int = 400,
+    limit: int = WHATSAPP_MAX_TEXT_LENGTH,
+) -> AsyncIterator[str]:
+    """
+    Groups streamed text deltas into message-sized segments.
+
+    A segment is released at the last paragraph break once at least `min_chars`
+    are buffered (`first_min_chars` for the first segment, so the user sees
+    something quickly). Without a paragraph break, a sentence boundary is used
+    once the buffer passes twice that size, and anything reaching `limit` is cut
+    at the best boundary available. Segments are yielded in order.
+    """
+    buffer = ""
+    threshold = first_min_chars
+    async for delta in deltas:
+        buffer += delta
+        while True:
+            cut = _last_boundary(_PARAGRAPH_BREAK, buffer, threshold)
+            if cut < 0 and len(buffer) >= 2 * threshold:
+                cut = _last_boundary(_SENTENCE_END, buffer, threshold)
+            if cut < 0 and len(buffer) >= limit:
+                cut = _hard_cut(buffer, limit)
+            if cut < 0:
+                break
+            if cut > limit:
+                cut = _hard_cut(buffer, limit)
+            segment = buffer[:cut].strip()
+            buffer = buffer[cut:]
+            if segment:
+                yield segment
+                threshold = min_chars
+    for segment in split_text(buffer, limit):
+        yield segment
@@ -0,0 +1,211 @@
+import time
+import asyncio
+import logging
+from collections import Counter, OrderedDict, deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+from pymongo.errors import CollectionInvalid, OperationFailure
+
+from ..config import get_settings
+from ..db import get_db
+from ..metrics import metrics
+from ..snapshot import snapshots
+from .webhook_parser import StatusEvent
+
+logger = logging.getLogger(__name__)
+
+_TERMINAL_STATUSES = ("read", "failed")
+
+
+def _to_timestamp(value: Optional[str]) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return time.time()
+
+
+class StatusPipeline:
+    """
+    Ingests WhatsApp delivery status callbacks (sent / delivered / read / failed).
+
+    `record` is synchronous and O(1) per event: it updates in-memory rolling
+    aggregates and appends the event to a buffer. A background task bulk-writes
+    the buffer to the `message_statuses` time-series collection every
+    `flush_interval` seconds or as soon as `batch_size` events are waiting, so
+    no callback ever waits for a database write.
+    """
+    COLLECTION = "message_statuses"
+    WINDOW_MINUTES = 60
+
+    def __init__(self, batch_size: int = 500, flush_interval: float = 5.0, max_buffer: int = 50000,
+                 tracked_messages: int = 50000):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self.tracked_messages = tracked_messages
+        self._buffer: List[Dict[str, Any]] = []
+        self._flush_requested = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+        # message_id -> {"sent": ts, "delivered": ts}, oldest first, bounded
+        self._timeline: "OrderedDict[str, Dict[str, float]]" = OrderedDict()
+        # Rolling per-minute buckets: (minute, status counts, failure counts by error code)
+        self._buckets: Deque[Tuple[int, Counter, Counter]] = deque()
+        self._totals: Counter = Counter()
+        self._dropped = 0
+
+    # --- Ingestion (event loop, no I/O) ---
+
+    def record(self, events: Iterable[StatusEvent]):
+        for event in events:
+            ts = _to_timestamp(event.timestamp)
+            self._update_aggregates(event, ts)
+            self._buffer.append({
+                "ts": datetime.fromtimestamp(ts, tz=timezone.utc),
+                "meta": {"status": event.status, "recipient_id": event.recipient_id},
+                "message_id": event.message_id,
+                "error_code": event.error_code,
+                "error_title": event.error_title,
+            })
+        overflow = len(self._buffer) - self.max_buffer
+        if overflow > 0:
+            del self._buffer[:overflow]
+            self._dropped += overflow
+            metrics.inc("status_events_dropped", overflow)
+        if len(self._buffer) >= self.batch_size:
+            self._flush_requested.set()
+
+    def _bucket(self, now: float) -> Tuple[int, Counter, Counter]:
+        """Current per-minute bucket; events are bucketed by arrival time."""
+        minute = int(now // 60)
+        if not self._buckets or self._buckets[-1][0] < minute:
+            self._buckets.append((minute, Counter(), Counter()))
+            while self._buckets and self._buckets[0][0] <= minute - self.WINDOW_MINUTES:
+                self._buckets.popleft()
+        return self._buckets[-1]
+
+    def _update_aggregates(self, event: StatusEvent, ts: float):
+        _, status_counts, failure_counts = self._bucket(time.time())
+        status_counts[event.status] += 1
+        self._totals[event.status] += 1
+        metrics.inc("whatsapp_status_events", status=event.status)
+        if event.status == "failed":
+            failure_counts[str(event.error_code)] += 1
+
+        if not event.message_id:
+            return
+        timeline = self._timeline.get(event.message_id)
+        if timeline is None:
+            timeline = self._timeline[event.message_id] = {}
+            if len(self._timeline) > self.tracked_messages:
+                self._timeline.popitem(last=False)
+        timeline[event.status] = ts
+        if event.status == "delivered" and "sent" in timeline:
+            metrics.observe("whatsapp_delivery_latency_s", max(0.0, ts - timeline["sent"]))
+        elif event.status == "read" and "delivered" in timeline:
+            metrics.observe("whatsapp_read_latency_s", max(0.0, ts - timeline["delivered"]))
+        if event.status in _TERMINAL_STATUSES:
+            self._timeline.pop(event.message_id, None)
+
+    def export_timeline(self) -> Dict[str, Dict[str, float]]:
+        return dict(self._timeline)
+
+    def import_timeline(self, timeline: Dict[str, Dict[str, float]]):
+        """Restores pending sent/delivered timestamps, so latency of in-flight messages is still measured."""
+        for message_id, events in timeline.items():
+            self._timeline.setdefault(message_id, events)
+        while len(self._timeline) > self.tracked_messages:
+            self._timeline.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Rolling aggregates over the last WINDOW_MINUTES plus totals since start."""
+        window_status: Counter = Counter()
+        window_failures: Counter = Counter()
+        for _, status_counts, failure_counts in self._buckets:
+            window_status.update(status_counts)
+            window_failures.update(failure_counts)
+        attempted = window_status["sent"] + window_status["failed"]
+        snapshot = metrics.snapshot()["histograms"]
+        return {
+            "window_minutes": self.WINDOW_MINUTES,
+            "window": dict(window_status),
+            "failure_rate": round(window_status["failed"] / attempted, 4) if attempted else 0.0,
+            "failures_by_error_code": dict(window_failures.most_common()),
+            "delivery_latency_s": snapshot.get("whatsapp_delivery_latency_s"),
+            "read_latency_s": snapshot.get("whatsapp_read_latency_s"),
+            "totals": dict(self._totals),
+            "buffered": len(self._buffer),
+            "dropped": self._dropped,
+        }
+
+    # --- Persistence (background task) ---
+
+    async def start(self):
+        if self._task is not None:
+            return
+        try:
+            db = await get_db()
+            await self._ensure_collection(db)
+        except Exception as e:
+            logger.error("Status pipeline could not prepare '%s': %s", self.COLLECTION, e)
+        self._task = asyncio.create_task(self._flush_loop())
+        logger.info("Status pipeline started (batch=%d, interval=%ss)", self.batch_size, self.flush_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _ensure_collection(self, db):
+        """Creates the time-series collection on first use (plain collection on MongoDB < 5.0)."""
+        if self.COLLECTION in await db.list_collection_names():
+            return
+        try:
+            await db.create_collection(
+                self.COLLECTION,
+                timeseries={"timeField": "ts", "metaField": "meta", "granularity": "seconds"},
+            )
+            logger.info("Created time-series collection '%s'.", self.COLLECTION)
+        except CollectionInvalid:
+            pass  # Created concurrently by another worker
+        except OperationFailure as e:
+            logger.warning("Time-series collections unavailable (%s); using a regular collection.", e)
+            await db[self.COLLECTION].create_index("ts")
+
+    async def _flush_loop(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_requested.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_requested.clear()
+            await self.flush()
+
+    async def flush(self):
+        if not self._buffer:
+            return
+        batch, self._buffer = self._buffer, []
+        try:
+            db = await get_db()
+            for i in range(0, len(batch), self.batch_size):
+                await db[self.COLLECTION].insert_many(batch[i:i + self.batch_size], ordered=False)
+            metrics.inc("status_events_flushed", len(batch))
+            logger.debug("Flushed %d status events", len(batch), extra={"high_volume": True})
+        except Exception as e:
+            logger.error("Failed to flush %d status events: %s", len(batch), e)
+            # Put them back in front of anything that arrived meanwhile; record() trims the oldest
+            self._buffer = batch + self._buffer
+            self.record(())
+
+
+settings = get_settings()
+status_pipeline = StatusPipeline(
+    batch_size=settings.STATUS_BATCH_SIZE,
+    flush_interval=settings.STATUS_FLUSH_INTERVAL,
+)
+snapshots.register("status_timeline", status_pipeline.export_timeline, status_pipeline.import_timeline)
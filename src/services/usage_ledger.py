@@ -0,0 +1,254 @@
+import asyncio
+import logging
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, List, Optional, Tuple
+
+from pymongo import UpdateOne
+
+from ..config import get_settings
+from ..db import get_db
+from ..metrics import metrics
+from ..model_router import model_cost
+
+logger = logging.getLogger(__name__)
+
+# Budget modes of a user
+NORMAL = "normal"
+ECONOMY = "economy"   # Over a daily budget: turns run on the small model
+LIMITED = "limited"   # Over the user's daily limit: no assistant runs until the next day
+
+
+def _today() -> str:
+    return datetime.now(timezone.utc).strftime("%Y-%m-%d")
+
+
+class UsageLedger:
+    """
+    Token and cost accounting of assistant turns, per user, UTC day and model.
+
+    `record` is synchronous and O(1): it adds the turn to in-memory counters. A
+    background task flushes them every `flush_interval` seconds as one bulk write
+    of `$inc` upserts to `usage_daily` (one document per day, user and model) and
+    reads back today's totals of the users it wrote and of the whole deployment,
+    so budgets account for the spend of all workers.
+
+    Budgets (USD, 0 disables them): above `user_daily_budget`, or when the whole
+    deployment is above `daily_budget`, a user's turns run on the small model; above
+    `user_daily_limit` the assistant is not run for that user until the next day.
+    """
+    COLLECTION = "usage_daily"
+
+    def __init__(self, flush_interval: float = 30, user_daily_budget: float = 0.0, user_daily_limit: float = 0.0,
+                 daily_budget: float = 0.0):
+        self.flush_interval = flush_interval
+        self.user_daily_budget = user_daily_budget
+        self.user_daily_limit = user_daily_limit
+        self.daily_budget = daily_budget
+        # (day, user_id, model) -> increments not yet written
+        self._pending: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+        self._day = _today()
+        self._user_spend: Dict[str, float] = defaultdict(float)  # Today, all workers as of the last flush + local since
+        self._total_spend = 0.0
+        self._limit_notified: set = set()
+        self._task: Optional[asyncio.Task] = None
+
+    # --- Recording and budgets (event loop, no I/O) ---
+
+    def _roll_day(self):
+        today = _today()
+        if today != self._day:
+            self._day = today
+            self._user_spend.clear()
+            self._total_spend = 0.0
+            self._limit_notified.clear()
+
+    def record(self, user_id: str, model: Optional[str], prompt_tokens: int, completion_tokens: int):
+        """Adds one assistant turn of `user_id`."""
+        self._roll_day()
+        model = model or "default"
+        cost = model_cost(model, prompt_tokens, completion_tokens) or 0.0
+        entry = self._pending.setdefault(
+            (self._day, user_id, model), {"turns": 0, "prompt_tokens": 0, "completion_tokens": 0, "cost_usd": 0.0}
+        )
+        entry["turns"] += 1
+        entry["prompt_tokens"] += prompt_tokens
+        entry["completion_tokens"] += completion_tokens
+        entry["cost_usd"] += cost
+        self._user_spend[user_id] += cost
+        self._total_spend += cost
+        metrics.observe("tokens_per_turn", prompt_tokens + completion_tokens, model=model)
+
+    def mode(self, user_id: str) -> str:
+        """NORMAL, ECONOMY or LIMITED, from today's spend of the user and of the deployment."""
+        self._roll_day()
+        spend = self._user_spend.get(user_id, 0.0)
+        if self.user_daily_limit and spend >= self.user_daily_limit:
+            return LIMITED
+        if (self.user_daily_budget and spend >= self.user_daily_budget) or (
+                self.daily_budget and self._total_spend >= self.daily_budget):
+            return ECONOMY
+        return NORMAL
+
+    def should_send_limit_notice(self, user_id: str) -> bool:
+        """True once per day for a LIMITED user; later messages are not answered by the assistant."""
+        if user_id in self._limit_notified:
+            return False
+        self._limit_notified.add(user_id)
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        self._roll_day()
+        return {
+            "day": self._day,
+            "spend_usd": round(self._total_spend, 4),
+            "users_today": len(self._user_spend),
+            "users_economy": sum(1 for u in self._user_spend if self.mode(u) == ECONOMY),
+            "users_limited": sum(1 for u in self._user_spend if self.mode(u) == LIMITED),
+            "pending_rows": len(self._pending),
+        }
+
+    # --- Persistence (background task) ---
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+            logger.info("Usage ledger started (flush every %ss)", self.flush_interval)
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if not self._pending:
+            return
+        batch, self._pending = self._pending, {}
+        now = datetime.now(timezone.utc)
+        operations = [
+            UpdateOne(
+                {"_id": f"{day}|{user_id}|{model}"},
+                {"$inc": entry, "$set": {"updated_at": now},
+                 "$setOnInsert": {"day": day, "user_id": user_id, "model": model}},
+                upsert=True,
+            )
+            for (day, user_id, model), entry in batch.items()
+        ]
+        try:
+            db = await get_db()
+            await db[self.COLLECTION].bulk_write(operations, ordered=False)
+            metrics.inc("usage_rows_flushed", len(operations))
+        except Exception as e:
+            logger.error("Failed to flush %d usage rows: %s", len(operations), e)
+            for key, entry in batch.items():  # Merge back; turns recorded meanwhile are kept
+                pending = self._pending.setdefault(key, {k: 0 for k in entry})
+                for field, value in entry.items():
+                    pending[field] += value
+            return
+        try:
+            await self._refresh_spend(db, {user_id for day, user_id, _ in batch if day == self._day})
+        except Exception as e:
+            logger.warning("Could not refresh today's spend: %s", e)
+
+    async def _refresh_spend(self, db, user_ids):
+        """Today's spend of `user_ids` and of the deployment, including other workers' turns."""
+        day = self._day
+        pipeline = [
+            {"$match": {"day": day}},
+            {"$group": {"_id": None, "cost_usd": {"$sum": "$cost_usd"}}},
+        ]
+        totals = await db[self.COLLECTION].aggregate(pipeline).to_list(1)
+        user_totals: Dict[str, float] = defaultdict(float)
+        async for doc in db[self.COLLECTION].find({"day": day, "user_id": {"$in": list(user_ids)}},
+                                                  {"user_id": 1, "cost_usd": 1}):
+            user_totals[doc["user_id"]] += doc.get("cost_usd", 0.0)
+        if day != self._day:
+            return
+        unflushed: Dict[str, float] = defaultdict(float)
+        for (pending_day, user_id, _), entry in self._pending.items():
+            if pending_day == day:
+                unflushed[user_id] += entry["cost_usd"]
+        for user_id, spend in user_totals.items():
+            self._user_spend[user_id] = spend + unflushed[user_id]
+        if totals:
+            self._total_spend = totals[0]["cost_usd"] + sum(unflushed.values())
+
+    # --- Reports ---
+
+    async def top_spenders(self, days: int = 7, limit: int = 20) -> List[Dict[str, Any]]:
+        """Users with the highest cost over the last `days` days (today included)."""
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        db = await get_db()
+        pipeline = [
+            {"$match": {"day": {"$gte": since}}},
+            {"$group": {
+                "_id": "$user_id",
+                "cost_usd": {"$sum": "$cost_usd"},
+                "turns": {"$sum": "$turns"},
+                "prompt_tokens": {"$sum": "$prompt_tokens"},
+                "completion_tokens": {"$sum": "$completion_tokens"},
+            }},
+            {"$sort": {"cost_usd": -1}},
+            {"$limit": limit},
+        ]
+        return [
+            {
+                "user_id": doc["_id"],
+                "cost_usd": round(doc["cost_usd"], 4),
+                "turns": doc["turns"],
+                "tokens_per_turn": round((doc["prompt_tokens"] + doc["completion_tokens"]) / doc["turns"], 1)
+                if doc["turns"] else 0.0,
+                "mode": self.mode(doc["_id"]),
+            }
+            async for doc in db[self.COLLECTION].aggregate(pipeline)
+        ]
+
+    async def daily(self, days: int = 14) -> List[Dict[str, Any]]:
+        """Per day and model: turns, users, tokens per turn and cost over the last `days` days."""
+        since = (datetime.now(timezone.utc) - timedelta(days=days - 1)).strftime("%Y-%m-%d")
+        db = await get_db()
+        pipeline = [
+            {"$match": {"day": {"$gte": since}}},
+            {"$group": {
+                "_id": {"day": "$day", "model": "$model"},
+                "users": {"$addToSet": "$user_id"},
+                "turns": {"$sum": "$turns"},
+                "prompt_tokens": {"$sum": "$prompt_tokens"},
+                "completion_tokens": {"$sum": "$completion_tokens"},
+                "cost_usd": {"$sum": "$cost_usd"},
+            }},
+            {"$sort": {"_id.day": 1, "_id.model": 1}},
+        ]
+        report = []
+        async for doc in db[self.COLLECTION].aggregate(pipeline):
+            turns = doc["turns"] or 1
+            report.append({
+                "day": doc["_id"]["day"],
+                "model": doc["_id"]["model"],
+                "users": len(doc["users"]),
+                "turns": doc["turns"],
+                "prompt_tokens_per_turn": round(doc["prompt_tokens"] / turns, 1),
+                "completion_tokens_per_turn": round(doc["completion_tokens"] / turns, 1),
+                "cost_usd": round(doc["cost_usd"], 4),
+            })
+        return report
+
+
+settings = get_settings()
+usage_ledger = UsageLedger(
+    flush_interval=settings.USAGE_FLUSH_INTERVAL,
+    user_daily_budget=settings.USAGE_USER_DAILY_BUDGET_USD,
+    user_daily_limit=settings.USAGE_USER_DAILY_LIMIT_USD,
+    daily_budget=settings.USAGE_DAILY_BUDGET_USD,
+)
+metrics.register_collector("usage", usage_ledger.stats)
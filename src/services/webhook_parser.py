@@ -0,0 +1,149 @@
+import re
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Optional
+
+logger = logging.getLogger(__name__)
+
+# The "messages" key itself, with any JSON whitespace before the colon: '"field": "messages"'
+# is present in status callbacks too
+_MESSAGES_KEY_RE = re.compile(rb'"messages"\s*:')
+
+# Optional fast JSON backends, standard library as fallback
+try:
+    import orjson
+    _loads = orjson.loads
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import msgspec
+        _loads = msgspec.json.Decoder().decode
+        JSON_BACKEND = "msgspec"
+    except ImportError:
+        _loads = json.loads  # json.loads accepts bytes directly
+        JSON_BACKEND = "json"
+
+_DECODE_ERRORS: tuple = (ValueError,)  # orjson.JSONDecodeError and json.JSONDecodeError subclass ValueError
+if JSON_BACKEND == "msgspec":
+    _DECODE_ERRORS = (ValueError, msgspec.DecodeError)
+
+
+class WebhookParseError(ValueError):
+    """The webhook body is not valid JSON."""
+
+
+class InboundMessage(NamedTuple):
+    message_id: Optional[str]
+    sender_id: str
+    timestamp: Optional[str]
+    type: str
+    text: Optional[str] = None             # Body of "text" messages
+    reply_id: Optional[str] = None         # ID of the chosen button/list row ("interactive" messages)
+    reply_title: Optional[str] = None      # Title of the chosen button/list row
+    profile_name: Optional[str] = None     # WhatsApp profile name of the sender, when provided
+
+
+class StatusEvent(NamedTuple):
+    message_id: Optional[str]
+    recipient_id: Optional[str]
+    status: str                            # sent / delivered / read / failed
+    timestamp: Optional[str]
+    error_code: Optional[int] = None
+    error_title: Optional[str] = None
+
+
+class ParsedWebhook(NamedTuple):
+    messages: List[InboundMessage]
+    statuses: List[StatusEvent]
+
+
+def _dict(value: Any) -> Dict[str, Any]:
+    """`value` when it is a JSON object, else an empty one: unexpected shapes are skipped, never raised."""
+    return value if isinstance(value, dict) else {}
+
+
+def _dicts(value: Any) -> List[Dict[str, Any]]:
+    """The JSON objects of `value` when it is an array, else none."""
+    return [item for item in value if isinstance(item, dict)] if isinstance(value, list) else []
+
+
+def _str(value: Any) -> Optional[str]:
+    """`value` when it is a JSON string, else None."""
+    return value if isinstance(value, str) else None
+
+
+def _message_record(message: Dict[str, Any], profile_names: Dict[str, str]) -> Optional[InboundMessage]:
+    sender_id = _str(message.get("from"))
+    if not sender_id:
+        return None
+    message_type = _str(message.get("type")) or "unknown"
+    text = reply_id = reply_title = None
+    if message_type == "text":
+        text = _str(_dict(message.get("text")).get("body"))
+    elif message_type == "interactive":
+        interactive = _dict(message.get("interactive"))
+        reply = _dict(interactive.get(_str(interactive.get("type")) or ""))
+        reply_id = _str(reply.get("id"))
+        reply_title = _str(reply.get("title"))
+    elif message_type == "button":  # Quick-reply button of a template message
+        button = _dict(message.get("button"))
+        reply_id = _str(button.get("payload"))
+        reply_title = _str(button.get("text"))
+    return InboundMessage(
+        _str(message.get("id")), sender_id, _str(message.get("timestamp")), message_type,
+        text, reply_id, reply_title, profile_names.get(sender_id),
+    )
+
+
+def _status_record(status: Dict[str, Any]) -> StatusEvent:
+    error = (_dicts(status.get("errors")) or [{}])[0]
+    code = error.get("code")
+    return StatusEvent(
+        _str(status.get("id")), _str(status.get("recipient_id")), _str(status.get("status")) or "unknown",
+        _str(status.get("timestamp")), code if isinstance(code, int) else None, _str(error.get("title")),
+    )
+
+
+def parse_webhook(body: bytes, include_statuses: bool = True) -> ParsedWebhook:
+    """
+    Extracts inbound messages (and optionally delivery statuses) from a webhook body.
+
+    With `include_statuses=False`, bodies that do not contain the `"messages"` key
+    (status-only callbacks, the bulk of webhook traffic) return immediately
+    without JSON decoding.
+
+    Entries, changes, messages and statuses that do not have the documented shape
+    are skipped, so a malformed delivery is acknowledged instead of retried.
+
+    Raises:
+        WebhookParseError: when the body has to be decoded and is not valid JSON.
+    """
+    if not include_statuses and not _MESSAGES_KEY_RE.search(body):
+        return ParsedWebhook([], [])
+    try:
+        data = _loads(body)
+    except _DECODE_ERRORS as e:
+        raise WebhookParseError(str(e)) from e
+
+    if not isinstance(data, dict) or data.get("object") != "whatsapp_business_account":
+        return ParsedWebhook([], [])
+
+    messages: List[InboundMessage] = []
+    statuses: List[StatusEvent] = []
+    for entry in _dicts(data.get("entry")):
+        for change in _dicts(entry.get("changes")):
+            value = _dict(change.get("value"))
+            raw_messages = _dicts(value.get("messages"))
+            if raw_messages:
+                profile_names = {
+                    c.get("wa_id"): _str(_dict(c.get("profile")).get("name"))
+                    for c in _dicts(value.get("contacts")) if isinstance(c.get("wa_id"), str)
+                }
+                for message in raw_messages:
+                    record = _message_record(message, profile_names)
+                    if record is not None:
+                        messages.append(record)
+            if include_statuses:
+                for status in _dicts(value.get("statuses")):
+                    statuses.append(_status_record(status))
+    return ParsedWebhook(messages, statuses)
@@ -2,9 +2,29 @@ import httpx
 import logging
 import json
 import traceback
+from typing import Any, Dict, List, Optional, Sequence, Tuple
 from ..config import get_settings
+from ..profiling import profiled
 
 class WhatsAppService:
+    # One connection pool per worker for message sends (keep-alive instead of a TLS handshake per message)
+    _shared_client: Optional[httpx.AsyncClient] = None
+
+    @classmethod
+    def http_client(cls) -> httpx.AsyncClient:
+        if cls._shared_client is None or cls._shared_client.is_closed:
+            cls._shared_client = httpx.AsyncClient(
+                timeout=30.0,
+                limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+            )
+        return cls._shared_client
+
+    @classmethod
+    async def close_http_client(cls):
+        if cls._shared_client is not None:
+            await cls._shared_client.aclose()
+            cls._shared_client = None
+
     def __init__(self):
         self.settings = get_settings()
         self.api_url = "https://graph.facebook.com/v22.0"
@@ -13,6 +33,7 @@ class WhatsAppService:
         self.waba_id = self.settings.WABA_ID  # Add this line
         self.logger = logging.getLogger("whatsapp_service")
     
+    @profiled("WhatsAppService.send_message")
     async def send_message(self, recipient_id: str, message: str):
         """Send text message to WhatsApp user"""
         url = f"{self.api_url}/{self.phone_number_id}/messages"
@@ -36,24 +57,121 @@ class WhatsAppService:
             "text": {"body": cleaned_message}
         }
         
-        self.logger.info(f"Sending message to {recipient_id}, length: {len(cleaned_message)}")
+        self.logger.info("Sending message to %s, length: %d", recipient_id, len(cleaned_message), extra={"high_volume": True})
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(url, headers=headers, json=data)
-                response.raise_for_status()
-                result = response.json()
-                self.logger.info(f"Message sent successfully to {recipient_id}")
-                return result
+            response = await self.http_client().post(url, headers=headers, json=data)
+            response.raise_for_status()
+            result = response.json()
+            self.logger.info("Message sent successfully to %s", recipient_id, extra={"high_volume": True})
+            return result
         except httpx.HTTPStatusError as e:
-            self.logger.error(f"HTTP error sending message: {e.response.status_code} - {e.response.text}")
-            self.logger.error(traceback.format_exc())
+            self.logger.error("HTTP error sending message: %s - %s", e.response.status_code, e.response.text)
             raise
         except Exception as e:
-            self.logger.error(f"Error sending message: {str(e)}")
-            self.logger.error(traceback.format_exc())
+            self.logger.error("Error sending message: %s", e, exc_info=True)
+            raise
+
+    @profiled("WhatsAppService.send_template")
+    async def send_template(self, recipient_id: str, template_name: str, language_code: str = "es",
+                            components: Optional[List[Dict[str, Any]]] = None):
+        """Send an approved message template (required to start conversations outside the 24h window)"""
+        url = f"{self.api_url}/{self.phone_number_id}/messages"
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        template: Dict[str, Any] = {"name": template_name, "language": {"code": language_code}}
+        if components:
+            template["components"] = components
+        data = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": recipient_id,
+            "type": "template",
+            "template": template
+        }
+
+        try:
+            response = await self.http_client().post(url, headers=headers, json=data)
+            response.raise_for_status()
+            self.logger.debug("Template %s sent to %s", template_name, recipient_id, extra={"high_volume": True})
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            self.logger.error("HTTP error sending template %s: %s - %s", template_name, e.response.status_code, e.response.text)
             raise
     
+    @profiled("WhatsAppService.send_interactive_buttons")
+    async def send_interactive_buttons(self, recipient_id: str, body: str, buttons: Sequence[Tuple[str, str]]):
+        """Send a message with up to 3 reply buttons, given as (id, title) pairs"""
+        url = f"{self.api_url}/{self.phone_number_id}/messages"
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": recipient_id,
+            "type": "interactive",
+            "interactive": {
+                "type": "button",
+                "body": {"text": body[:1024]},
+                "action": {"buttons": [
+                    {"type": "reply", "reply": {"id": button_id, "title": title[:20]}}
+                    for button_id, title in buttons[:3]
+                ]},
+            }
+        }
+
+        try:
+            response = await self.http_client().post(url, headers=headers, json=data)
+            response.raise_for_status()
+            self.logger.debug("Interactive buttons sent to %s", recipient_id, extra={"high_volume": True})
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            self.logger.error("HTTP error sending interactive buttons: %s - %s", e.response.status_code, e.response.text)
+            raise
+
+    @profiled("WhatsAppService.send_interactive_list")
+    async def send_interactive_list(self, recipient_id: str, body: str, button: str,
+                                    sections: Sequence[Tuple[str, Sequence[Tuple[str, str, str]]]]):
+        """Send a list message: `sections` are (title, rows) pairs, rows are (id, title, description)"""
+        url = f"{self.api_url}/{self.phone_number_id}/messages"
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "messaging_product": "whatsapp",
+            "recipient_type": "individual",
+            "to": recipient_id,
+            "type": "interactive",
+            "interactive": {
+                "type": "list",
+                "body": {"text": body[:4096]},
+                "action": {
+                    "button": button[:20],
+                    "sections": [
+                        {"title": title[:24], "rows": [
+                            {"id": row_id, "title": row_title[:24], **({"description": description[:72]} if description else {})}
+                            for row_id, row_title, description in rows
+                        ]}
+                        for title, rows in sections
+                    ],
+                },
+            }
+        }
+
+        try:
+            response = await self.http_client().post(url, headers=headers, json=data)
+            response.raise_for_status()
+            self.logger.debug("Interactive list sent to %s", recipient_id, extra={"high_volume": True})
+            return response.json()
+        except httpx.HTTPStatusError as e:
+            self.logger.error("HTTP error sending interactive list: %s - %s", e.response.status_code, e.response.text)
+            raise
+
     async def check_phone_status(self, phone_number: str):
         """Check if a phone number is valid for WhatsApp messaging"""
         test_url = f"{self.api_url}/{self.phone_number_id}/messages"
@@ -87,7 +205,7 @@ class WhatsAppService:
                 
                 return result
         except Exception as e:
-            self.logger.error(f"Error checking phone status: {str(e)}")
+            self.logger.error("Error checking phone status: %s", e)
             return {
                 "status_code": 500,
                 "response": str(e),
@@ -102,11 +220,11 @@ class WhatsAppService:
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.get(url, headers=headers)
-                self.logger.info(f"Webhook subscription status: {response.status_code}")
+                self.logger.info("Webhook subscription status: %s", response.status_code)
                 self.logger.info(response.json())
                 return response.json()
         except Exception as e:
-            self.logger.error(f"Error checking webhook subscription: {str(e)}")
+            self.logger.error("Error checking webhook subscription: %s", e)
             self.logger.error(traceback.format_exc())
             raise
 
@@ -118,14 +236,39 @@ class WhatsAppService:
         try:
             async with httpx.AsyncClient() as client:
                 response = await client.get(url, headers=headers)
-                self.logger.info(f"Message metrics response: {response.status_code}")
+                self.logger.info("Message metrics response: %s", response.status_code)
                 self.logger.info(response.json())
                 return response.json()
         except Exception as e:
-            self.logger.error(f"Error checking message metrics: {str(e)}")
+            self.logger.error("Error checking message metrics: %s", e)
             self.logger.error(traceback.format_exc())
             raise
 
+    async def send_typing_indicator(self, message_id: str):
+        """Mark an incoming message as read and show the typing indicator while the reply is prepared"""
+        url = f"{self.api_url}/{self.phone_number_id}/messages"
+        headers = {
+            "Authorization": f"Bearer {self.token}",
+            "Content-Type": "application/json"
+        }
+        data = {
+            "messaging_product": "whatsapp",
+            "status": "read",
+            "message_id": message_id,
+            "typing_indicator": {"type": "text"}
+        }
+
+        try:
+            # Shared keep-alive client: this runs for every inbound message
+            response = await self.http_client().post(url, headers=headers, json=data, timeout=10.0)
+            response.raise_for_status()
+            self.logger.debug("Typing indicator sent for message: %s", message_id, extra={"high_volume": True})
+            return response.json()
+        except Exception as e:
+            # Best effort only: a missing indicator must never block the reply
+            self.logger.warning("Error sending typing indicator for %s: %s", message_id, e)
+            return None
+
     async def mark_message_as_read(self, message_id: str):
         """Mark a WhatsApp message as read"""
         url = f"{self.api_url}/{self.phone_number_id}/messages"
@@ -143,8 +286,8 @@ class WhatsAppService:
             async with httpx.AsyncClient() as client:
                 response = await client.post(url, headers=headers, json=data)
                 response.raise_for_status()
-                self.logger.info(f"Message marked as read: {message_id}")
+                self.logger.info("Message marked as read: %s", message_id)
                 return response.json()
         except Exception as e:
-            self.logger.error(f"Error marking message as read: {str(e)}")
+            self.logger.error("Error marking message as read: %s", e)
             raise
\ No newline at end of file
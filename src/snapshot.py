@@ -0,0 +1,217 @@
+import os
+import json
+import mmap
+import time
+import socket
+import struct
+import logging
+import tempfile
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from bson import Binary
+
+from .config import get_settings
+from .db import get_db
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.snapshot")
+
+# File layout (all integers little endian):
+#   header   MAGIC (8 bytes) | version u16 | section count u16 | created_at f64
+#   table    per section: name length u16 | name (utf-8) | offset u64 | length u64
+#   payload  the sections' JSON documents, back to back; offsets are from the start of the file
+MAGIC = b"EVKSNAP\x00"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sHHd")
+_NAME_LEN = struct.Struct("<H")
+_SECTION = struct.Struct("<QQ")
+
+
+class SnapshotProvider(NamedTuple):
+    dump: Callable[[], Any]          # Returns JSON-serializable state
+    load: Callable[[Any], None]      # Merges previously dumped state into the live objects
+
+
+def encode_snapshot(sections: Dict[str, bytes], created_at: Optional[float] = None) -> bytes:
+    """Packs already-serialized sections into one versioned snapshot blob."""
+    names = [name.encode("utf-8") for name in sections]
+    table_size = sum(_NAME_LEN.size + len(n) + _SECTION.size for n in names)
+    offset = _HEADER.size + table_size
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(sections), created_at or time.time())]
+    for name, payload in zip(names, sections.values()):
+        parts.append(_NAME_LEN.pack(len(name)) + name + _SECTION.pack(offset, len(payload)))
+        offset += len(payload)
+    parts.extend(sections.values())
+    return b"".join(parts)
+
+
+def read_section_table(buffer) -> Tuple[float, Dict[str, Tuple[int, int]]]:
+    """
+    Parses the header and section table of a snapshot held in `buffer` (bytes, memoryview
+    or mmap) without touching the payloads. Returns (created_at, {name: (offset, length)}).
+
+    Raises:
+        ValueError: when the buffer is not a snapshot of a supported version.
+    """
+    if len(buffer) < _HEADER.size:
+        raise ValueError("Snapshot is truncated")
+    magic, version, count, created_at = _HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError("Not a snapshot file")
+    if version != FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot version {version} (expected {FORMAT_VERSION})")
+    pos = _HEADER.size
+    table: Dict[str, Tuple[int, int]] = {}
+    for _ in range(count):
+        (name_len,) = _NAME_LEN.unpack_from(buffer, pos)
+        pos += _NAME_LEN.size
+        name = bytes(buffer[pos:pos + name_len]).decode("utf-8")
+        pos += name_len
+        offset, length = _SECTION.unpack_from(buffer, pos)
+        pos += _SECTION.size
+        if offset + length > len(buffer):
+            raise ValueError(f"Section '{name}' points past the end of the snapshot")
+        table[name] = (offset, length)
+    return created_at, table
+
+
+class SnapshotStore:
+    """
+    Warm-start snapshots of hot in-memory state (conversation map, dedup set, caches).
+
+    Components register a provider per section; on graceful shutdown each worker
+    writes all sections into one compact versioned file, and at startup a new
+    worker loads the snapshots of all workers that are younger than `max_age`.
+    Loading maps the file into memory and decodes only the registered sections;
+    sections of unknown names or from other format versions are skipped.
+
+    With the "file" backend snapshots live in `directory` (one file per worker,
+    replaced atomically). On platforms with an ephemeral disk (Cloud Run) use the
+    "mongo" backend, which stores the same blob in the `snapshots` collection.
+    """
+    COLLECTION = "snapshots"
+
+    def __init__(self, backend: str = "file", directory: str = ".snapshots", max_age: float = 86400):
+        if backend not in ("file", "mongo"):
+            raise ValueError(f"Unknown snapshot backend '{backend}'. Use 'file' or 'mongo'.")
+        self.backend = backend
+        self.directory = directory
+        self.max_age = max_age
+        self._providers: Dict[str, SnapshotProvider] = {}
+
+    def register(self, name: str, dump: Callable[[], Any], load: Callable[[Any], None]):
+        self._providers[name] = SnapshotProvider(dump, load)
+
+    @property
+    def _worker_key(self) -> str:
+        return f"{socket.gethostname()}-{os.getpid()}"
+
+    # --- Save ---
+
+    def _encode(self) -> bytes:
+        sections: Dict[str, bytes] = {}
+        for name, provider in self._providers.items():
+            try:
+                sections[name] = json.dumps(provider.dump(), separators=(",", ":"), default=str).encode("utf-8")
+            except Exception as e:
+                logger.error("Snapshot section '%s' could not be serialized: %s", name, e, exc_info=True)
+        return encode_snapshot(sections)
+
+    async def save(self):
+        """Writes this worker's snapshot. Call on graceful shutdown."""
+        if not self._providers:
+            return
+        start = time.perf_counter()
+        blob = self._encode()
+        try:
+            if self.backend == "file":
+                self._write_file(blob)
+            else:
+                db = await get_db()
+                await db[self.COLLECTION].replace_one(
+                    {"_id": self._worker_key},
+                    {"_id": self._worker_key, "data": Binary(blob), "saved_at": time.time()},
+                    upsert=True,
+                )
+                await db[self.COLLECTION].delete_many({"saved_at": {"$lt": time.time() - self.max_age}})
+        except Exception as e:
+            logger.error("Failed to save snapshot: %s", e, exc_info=True)
+            return
+        metrics.set_gauge("snapshot_bytes", len(blob))
+        logger.info("Saved %d-byte snapshot (%s backend) in %.1f ms",
+                    len(blob), self.backend, (time.perf_counter() - start) * 1000)
+
+    def _write_file(self, blob: bytes):
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{self._worker_key}.snap")
+        # Write to a temporary file and rename: readers never see a half-written snapshot
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(blob)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        cutoff = time.time() - self.max_age
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith(".snap") and entry.stat().st_mtime < cutoff:
+                os.unlink(entry.path)
+
+    # --- Load ---
+
+    async def load(self) -> int:
+        """
+        Restores the registered sections from all recent snapshots, newest first (loaders
+        keep existing entries, so the newest snapshot wins). Returns the number loaded.
+        """
+        start = time.perf_counter()
+        loaded = 0
+        try:
+            if self.backend == "file":
+                for path in self._recent_files():
+                    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+                        loaded += self._restore(buffer, path)
+            else:
+                db = await get_db()
+                cursor = db[self.COLLECTION].find({"saved_at": {"$gte": time.time() - self.max_age}}).sort("saved_at", -1)
+                async for doc in cursor:
+                    loaded += self._restore(doc["data"], doc["_id"])
+        except Exception as e:
+            logger.error("Failed to load snapshots: %s", e, exc_info=True)
+        if loaded:
+            logger.info("Warm start: restored %d snapshot(s) in %.1f ms", loaded, (time.perf_counter() - start) * 1000)
+        return loaded
+
+    def _recent_files(self) -> List[str]:
+        if not os.path.isdir(self.directory):
+            return []
+        cutoff = time.time() - self.max_age
+        entries = [e for e in os.scandir(self.directory) if e.name.endswith(".snap") and e.stat().st_size > 0]
+        return [e.path for e in sorted(entries, key=lambda e: e.stat().st_mtime, reverse=True) if e.stat().st_mtime >= cutoff]
+
+    def _restore(self, buffer, source: str) -> int:
+        try:
+            _, table = read_section_table(buffer)
+        except (ValueError, struct.error) as e:
+            logger.warning("Ignoring snapshot %s: %s", source, e)
+            return 0
+        for name, provider in self._providers.items():
+            if name not in table:
+                continue
+            offset, length = table[name]
+            try:
+                provider.load(json.loads(buffer[offset:offset + length]))
+            except Exception as e:
+                logger.warning("Could not restore section '%s' from %s: %s", name, source, e)
+        return 1
+
+
+settings = get_settings()
+snapshots = SnapshotStore(
+    backend=settings.SNAPSHOT_BACKEND,
+    directory=settings.SNAPSHOT_DIR,
+    max_age=settings.SNAPSHOT_MAX_AGE_SECONDS,
+)
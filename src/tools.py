@@ -0,0 +1,90 @@
+import json
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+from .metrics import metrics
+
+logger = logging.getLogger("eventek_assistant.tools")
+
+# A tool implementation receives the parsed JSON arguments and the WhatsApp ID of the user
+# whose turn requested the call, and returns a JSON string
+ToolHandler = Callable[[Dict[str, Any], Optional[str]], Awaitable[str]]
+
+
+class RegisteredTool(NamedTuple):
+    name: str
+    handler: ToolHandler
+    definition: Optional[Dict[str, Any]]  # OpenAI function tool definition
+    timeout: float
+
+
+class ToolRegistry:
+    """
+    Maps tool (function) names requested by the model to their implementations.
+
+    `dispatch_many` runs all tool calls of one `requires_action` concurrently,
+    each bounded by its own timeout, so a run that asks for several tools
+    waits for the slowest one instead of the sum of all of them. Every call
+    records its latency and outcome per tool in the metrics registry.
+    """
+
+    def __init__(self, default_timeout: float = 20.0):
+        self.default_timeout = default_timeout
+        self._tools: Dict[str, RegisteredTool] = {}
+
+    def register(self, name: str, handler: ToolHandler, definition: Optional[Dict[str, Any]] = None,
+                 timeout: Optional[float] = None):
+        if name in self._tools:
+            logger.warning("Tool '%s' is already registered; replacing it.", name)
+        self._tools[name] = RegisteredTool(name, handler, definition, timeout or self.default_timeout)
+
+    def definitions(self) -> List[Dict[str, Any]]:
+        """Function tool definitions to send to the model."""
+        return [t.definition for t in self._tools.values() if t.definition]
+
+    async def dispatch(self, name: str, arguments_str: str, user_id: Optional[str] = None) -> str:
+        """Runs one tool call. Never raises: failures are returned to the model as a JSON error."""
+        tool = self._tools.get(name)
+        if tool is None:
+            logger.warning("Unknown tool function requested: %s", name)
+            metrics.inc("tool_calls_total", tool=name, outcome="unknown")
+            return json.dumps({"status": "error", "message": f"Unknown function '{name}'."})
+
+        try:
+            arguments = json.loads(arguments_str or "{}")
+        except json.JSONDecodeError:
+            logger.error("Failed to parse JSON args for tool %s", name)
+            metrics.inc("tool_calls_total", tool=name, outcome="bad_arguments")
+            return json.dumps({"status": "error", "message": "Invalid JSON arguments."})
+
+        start = time.perf_counter()
+        outcome = "ok"
+        try:
+            return await asyncio.wait_for(tool.handler(arguments, user_id), timeout=tool.timeout)
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+            logger.error("Tool '%s' timed out after %s seconds.", name, tool.timeout)
+            return json.dumps({"status": "error", "message": f"Tool '{name}' timed out."})
+        except Exception as e:
+            outcome = "error"
+            logger.error("Error executing tool '%s': %s", name, e, exc_info=True)
+            return json.dumps({"status": "error", "message": f"Internal error: {str(e)}"})
+        finally:
+            metrics.observe("tool_latency_ms", (time.perf_counter() - start) * 1000, tool=name)
+            metrics.inc("tool_calls_total", tool=name, outcome=outcome)
+
+    async def dispatch_many(self, calls: List[Tuple[str, str, str]], user_id: Optional[str] = None) -> List[Dict[str, str]]:
+        """
+        Runs several tool calls concurrently.
+
+        Args:
+            calls: (tool_call_id, function_name, arguments_json) tuples.
+            user_id: WhatsApp ID of the user whose turn requested the calls.
+
+        Returns:
+            `{"tool_call_id", "output"}` dicts in the same order as `calls`.
+        """
+        outputs = await asyncio.gather(*(self.dispatch(name, args, user_id) for _, name, args in calls))
+        return [{"tool_call_id": call_id, "output": output} for (call_id, _, _), output in zip(calls, outputs)]
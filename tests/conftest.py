@@ -0,0 +1,14 @@
+import os
+
+# Settings (src/config.py) are read from the environment at import time; the tests
+# exercise pure logic only and never reach MongoDB, OpenAI or WhatsApp.
+for name, value in {
+    "OPENAI_API_KEY": "sk-test",
+    "WHATSAPP_TOKEN": "test-token",
+    "PHONE_NUMBER_ID": "1",
+    "WEBHOOK_VERIFY_TOKEN": "test",
+    "WABA_ID": "2",
+    "MONGODB_CONNECTION_STRING": "mongodb://localhost/eventek-test",
+    "EVENTEK_ASSISTANT_ID": "asst_test",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,67 @@
+import httpx
+from bson import ObjectId
+
+from src.services.campaigns import Watermark, _graph_error_code, normalize_phone
+
+
+def _ids(n):
+    return [ObjectId() for _ in range(n)]  # Increasing, like the `_id` order of the recipient cursor
+
+
+def test_watermark_advances_in_order():
+    ids = _ids(3)
+    watermark = Watermark()
+    for contact_id in ids:
+        watermark.dispatched(contact_id)
+    watermark.done(ids[0])
+    assert watermark.value == ids[0]
+    watermark.done(ids[1])
+    watermark.done(ids[2])
+    assert watermark.value == ids[2]
+
+
+def test_watermark_waits_for_the_oldest_in_flight():
+    ids = _ids(4)
+    watermark = Watermark()
+    for contact_id in ids:
+        watermark.dispatched(contact_id)
+    watermark.done(ids[2])
+    watermark.done(ids[1])
+    assert watermark.value is None  # ids[0] is still in flight: resuming must not skip it
+    watermark.done(ids[0])
+    assert watermark.value == ids[2]
+    watermark.done(ids[3])
+    assert watermark.value == ids[3]
+
+
+def test_watermark_keeps_checkpoint_until_progress():
+    start, *ids = _ids(3)
+    watermark = Watermark(start)
+    watermark.dispatched(ids[0])
+    watermark.dispatched(ids[1])
+    watermark.done(ids[1])
+    assert watermark.value == start
+    watermark.done(ids[0])
+    assert watermark.value == ids[1]
+
+
+def test_watermark_memory_is_bounded_by_in_flight_recipients():
+    watermark = Watermark()
+    for contact_id in _ids(1000):
+        watermark.dispatched(contact_id)
+        watermark.done(contact_id)
+    assert not watermark._order and not watermark._done
+
+
+def test_normalize_phone():
+    assert normalize_phone("+34 600-11-22-33") == "34600112233"
+    assert normalize_phone(34600112233) == "34600112233"
+    assert normalize_phone("1234") is None
+    assert normalize_phone(None) is None
+
+
+def test_graph_error_code():
+    request = httpx.Request("POST", "https://graph.facebook.com")
+    throttled = httpx.Response(400, json={"error": {"code": 130429, "message": "Rate limit hit"}}, request=request)
+    assert _graph_error_code(throttled) == 130429
+    assert _graph_error_code(httpx.Response(502, text="Bad gateway", request=request)) is None
@@ -0,0 +1,102 @@
+import json
+from datetime import date, datetime
+
+import pytest
+
+from src.lead_extraction import LeadExtractor, lead_instructions, to_contact_fields
+
+TODAY = date(2026, 3, 10)
+SERVICES = {
+    "services": {
+        "Plan Expert": {"ideal_for": ["Bodas", "Festivales"]},
+        "Plan Profesional B2B": {"ideal_for": ["Congresos"]},
+    }
+}
+
+
+@pytest.fixture
+def extractor(tmp_path):
+    knowledge_file = tmp_path / "course_info.json"
+    knowledge_file.write_text(json.dumps(SERVICES), encoding="utf-8")
+    return LeadExtractor(str(knowledge_file))
+
+
+def test_full_lead_message(extractor):
+    fields = extractor.extract(
+        "Hola, me llamo Ana García, es para una boda el 14 de junio con 150 invitados. "
+        "Me interesa el plan expert, mi correo es Ana.Garcia@Example.com",
+        sender_id="34600112233", today=TODAY,
+    )
+    assert fields == {
+        "name": "Ana García",
+        "event_type": "Bodas",
+        "event_date": "2026-06-14",
+        "attendees": 150,
+        "plan_interest": "Plan Expert",
+        "email": "Ana.Garcia@example.com",
+    }
+
+
+@pytest.mark.parametrize("text, expected", [
+    ("El evento es el 2026-05-01", "2026-05-01"),
+    ("Sería el 20/12", "2026-12-20"),
+    ("Sería el 5 de enero", "2027-01-05"),  # Already past this year: next occurrence
+])
+def test_event_dates(extractor, text, expected):
+    assert extractor.extract(text, today=TODAY)["event_date"] == expected
+
+
+def test_past_and_invalid_dates_are_ignored(extractor):
+    assert "event_date" not in extractor.extract("Fue el 2025-01-01", today=TODAY)
+    assert "event_date" not in extractor.extract("El 31/02", today=TODAY)
+
+
+def test_phone_other_than_the_whatsapp_number(extractor):
+    fields = extractor.extract("Llamadme al +34 611 22 33 44", sender_id="34600112233", today=TODAY)
+    assert fields["contact_phone"] == "34611223344"
+    assert "contact_phone" not in extractor.extract("Mi número es 600 11 22 33", sender_id="34600112233")
+
+
+def test_attendees_with_thousands_separator(extractor):
+    assert extractor.extract("Esperamos 5.000 asistentes al festival", today=TODAY)["attendees"] == 5000
+
+
+def test_plan_words_need_a_plan_mention(extractor):
+    assert "plan_interest" not in extractor.extract("Soy un organizador profesional", today=TODAY)
+    assert extractor.extract("¿Qué incluye el plan b2b?", today=TODAY)["plan_interest"] == "Plan Profesional B2B"
+
+
+def test_nothing_is_guessed(extractor):
+    assert extractor.extract("¿Qué precios tenéis?", today=TODAY) == {}
+    assert "email" not in extractor.extract("escribe a ana@ejemplo", today=TODAY)
+
+
+def test_reload_swaps_patterns(extractor, tmp_path):
+    (tmp_path / "course_info.json").write_text(
+        json.dumps({"services": {"Plan Gala": {"ideal_for": ["Galas"]}}}), encoding="utf-8"
+    )
+    extractor.load()
+    assert extractor.extract("Es una gala con el plan gala", today=TODAY)["plan_interest"] == "Plan Gala"
+    assert "plan_interest" not in extractor.extract("el plan expert", today=TODAY)
+
+
+def test_to_contact_fields_converts_event_date():
+    contact = to_contact_fields({"event_date": "2026-06-14", "attendees": 150})
+    assert contact == {"event_date": datetime(2026, 6, 14), "attendees": 150}
+
+
+def test_lead_instructions():
+    assert lead_instructions({}) is None
+    note = lead_instructions({"name": "Ana", "event_type": "Bodas"})
+    assert "nombre: Ana" in note and "tipo de evento: Bodas" in note
+    assert "email" in note.splitlines()[-1]  # Asked for among the missing fields
+    assert "guardados" not in note  # Captured, not confirmed as saved: the tool is still the way to save
+    assert "add_crm_contact" in note and "No vuelvas a preguntarlos" in note
+
+
+def test_lead_instructions_when_complete():
+    draft = {
+        "name": "Ana", "email": "ana@example.com", "company": "Eventos SL", "event_type": "Bodas",
+        "event_date": "2026-06-14", "attendees": 150, "plan_interest": "Plan Expert",
+    }
+    assert lead_instructions(draft).endswith("Ya tenemos todos los datos del cliente.")
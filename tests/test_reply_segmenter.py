@@ -0,0 +1,57 @@
+import asyncio
+
+from src.services.reply_segmenter import WHATSAPP_MAX_TEXT_LENGTH, segment_stream, split_text
+
+
+async def _deltas(text, size=7):
+    for i in range(0, len(text), size):
+        yield text[i:i + size]
+
+
+def _segments(text, **kwargs):
+    async def collect():
+        return [segment async for segment in segment_stream(_deltas(text), **kwargs)]
+    return asyncio.run(collect())
+
+
+def test_split_text_keeps_short_reply_whole():
+    assert split_text("  Hola, ¿en qué te ayudo?  ") == ["Hola, ¿en qué te ayudo?"]
+
+
+def test_split_text_respects_whatsapp_limit():
+    text = " ".join(["Frase de relleno para el límite."] * 400)
+    parts = split_text(text)
+    assert len(parts) > 1
+    assert all(len(part) <= WHATSAPP_MAX_TEXT_LENGTH for part in parts)
+    assert " ".join(parts) == text
+
+
+def test_split_text_prefers_paragraph_breaks():
+    first, second = "a" * 60, "b" * 60
+    assert split_text(f"{first}\n\n{second}", limit=100) == [first, second]
+
+
+def test_split_text_cuts_unbroken_text_at_limit():
+    parts = split_text("x" * 250, limit=100)
+    assert parts == ["x" * 100, "x" * 100, "x" * 50]
+
+
+def test_segment_stream_releases_first_segment_early():
+    intro = "Claro, te cuento los planes disponibles para tu evento."
+    rest = "El plan básico incluye registro. " * 20
+    segments = _segments(f"{intro}\n\n{rest}", first_min_chars=20, min_chars=400)
+    assert segments[0] == intro
+    assert "".join(segments).replace(" ", "") == f"{intro}{rest}".replace(" ", "")
+
+
+def test_segment_stream_falls_back_to_sentences():
+    text = "Primera frase completa aquí. Segunda frase algo más larga que la primera. Tercera."
+    segments = _segments(text, first_min_chars=20, min_chars=20)
+    assert len(segments) > 1
+    assert all(segment.endswith(".") for segment in segments)
+
+
+def test_segment_stream_never_exceeds_limit():
+    segments = _segments("palabra " * 300, first_min_chars=50, min_chars=100, limit=200)
+    assert segments
+    assert all(len(segment) <= 200 for segment in segments)
@@ -0,0 +1,68 @@
+import asyncio
+import struct
+
+import pytest
+
+from src.snapshot import FORMAT_VERSION, MAGIC, SnapshotStore, encode_snapshot, read_section_table
+
+
+def _section(blob, table, name):
+    offset, length = table[name]
+    return blob[offset:offset + length]
+
+
+def test_encode_and_read_round_trip():
+    sections = {"conversations": b'{"u1":"thread_1"}', "empty": b"", "dedup": b'["wamid.1"]'}
+    blob = encode_snapshot(sections, created_at=1700000000.5)
+    created_at, table = read_section_table(blob)
+    assert created_at == 1700000000.5
+    assert list(table) == list(sections)
+    assert {name: _section(blob, table, name) for name in table} == sections
+
+
+def test_read_from_memoryview():
+    blob = encode_snapshot({"a": b"[1,2,3]"})
+    _, table = read_section_table(memoryview(blob))
+    assert _section(blob, table, "a") == b"[1,2,3]"
+
+
+def test_rejects_other_format_version():
+    blob = bytearray(encode_snapshot({"a": b"{}"}))
+    struct.pack_into("<H", blob, len(MAGIC), FORMAT_VERSION + 1)
+    with pytest.raises(ValueError, match="Unsupported snapshot version"):
+        read_section_table(bytes(blob))
+
+
+def test_rejects_foreign_and_truncated_data():
+    with pytest.raises(ValueError, match="Not a snapshot"):
+        read_section_table(b"X" * 64)
+    with pytest.raises(ValueError, match="truncated"):
+        read_section_table(MAGIC)
+
+
+def test_rejects_section_past_the_end():
+    blob = encode_snapshot({"a": b'{"key":"value"}'})
+    with pytest.raises(ValueError, match="past the end"):
+        read_section_table(blob[:-3])
+
+
+def test_file_backend_restores_registered_sections(tmp_path):
+    state = {"threads": {"u1": "thread_1"}}
+    writer = SnapshotStore(backend="file", directory=str(tmp_path))
+    writer.register("conversations", lambda: state, lambda data: None)
+    writer.register("unused", lambda: [1], lambda data: None)
+    asyncio.run(writer.save())
+
+    restored = []
+    reader = SnapshotStore(backend="file", directory=str(tmp_path))
+    reader.register("conversations", lambda: None, restored.append)
+    reader.register("missing", lambda: None, lambda data: pytest.fail("section not in the snapshot"))
+    assert asyncio.run(reader.load()) == 1
+    assert restored == [state]
+
+
+def test_file_backend_skips_broken_snapshots(tmp_path):
+    (tmp_path / "old-worker.snap").write_bytes(b"not a snapshot")
+    store = SnapshotStore(backend="file", directory=str(tmp_path))
+    store.register("conversations", lambda: None, lambda data: pytest.fail("nothing to restore"))
+    assert asyncio.run(store.load()) == 0
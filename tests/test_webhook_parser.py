@@ -0,0 +1,107 @@
+import json
+
+import pytest
+
+from src.services.webhook_parser import WebhookParseError, parse_webhook
+
+
+def _body(value, pretty=False):
+    payload = {
+        "object": "whatsapp_business_account",
+        "entry": [{"id": "1", "changes": [{"field": "messages", "value": value}]}],
+    }
+    return json.dumps(payload, indent=2 if pretty else None).encode()
+
+
+TEXT_VALUE = {
+    "contacts": [{"wa_id": "34600112233", "profile": {"name": "Ana"}}],
+    "messages": [{
+        "from": "34600112233", "id": "wamid.1", "timestamp": "1700000000",
+        "type": "text", "text": {"body": "Hola"},
+    }],
+}
+STATUS_VALUE = {
+    "statuses": [{
+        "id": "wamid.2", "recipient_id": "34600112233", "status": "failed", "timestamp": "1700000001",
+        "errors": [{"code": 131026, "title": "Message undeliverable"}],
+    }],
+}
+
+
+def test_text_message_with_profile_name():
+    parsed = parse_webhook(_body(TEXT_VALUE))
+    assert len(parsed.messages) == 1
+    message = parsed.messages[0]
+    assert (message.message_id, message.sender_id, message.type, message.text, message.profile_name) == (
+        "wamid.1", "34600112233", "text", "Hola", "Ana"
+    )
+
+
+def test_interactive_and_button_replies():
+    value = {"messages": [
+        {"from": "1", "id": "a", "type": "interactive",
+         "interactive": {"type": "list_reply", "list_reply": {"id": "plan_expert", "title": "Plan Expert"}}},
+        {"from": "1", "id": "b", "type": "button", "button": {"payload": "menu", "text": "Menú"}},
+    ]}
+    replies = [(m.reply_id, m.reply_title) for m in parse_webhook(_body(value)).messages]
+    assert replies == [("plan_expert", "Plan Expert"), ("menu", "Menú")]
+
+
+def test_messages_without_sender_are_skipped():
+    assert parse_webhook(_body({"messages": [{"id": "x", "type": "text"}]})).messages == []
+
+
+def test_status_with_error():
+    status = parse_webhook(_body(STATUS_VALUE)).statuses[0]
+    assert (status.message_id, status.status, status.error_code, status.error_title) == (
+        "wamid.2", "failed", 131026, "Message undeliverable"
+    )
+
+
+def test_fast_path_skips_status_only_bodies():
+    assert parse_webhook(_body(STATUS_VALUE), include_statuses=False) == ([], [])
+    # Not decoded at all: invalid JSON without the key does not raise
+    assert parse_webhook(b'{"statuses": [', include_statuses=False) == ([], [])
+
+
+@pytest.mark.parametrize("separator", [":", " :", "\n:", "\t:", "\r\n  :"])
+def test_fast_path_accepts_any_whitespace_before_colon(separator):
+    body = _body(TEXT_VALUE).replace(b'"messages":', b'"messages"' + separator.encode())
+    assert [m.text for m in parse_webhook(body, include_statuses=False).messages] == ["Hola"]
+
+
+def test_fast_path_with_pretty_printed_body():
+    parsed = parse_webhook(_body(TEXT_VALUE, pretty=True), include_statuses=False)
+    assert [m.message_id for m in parsed.messages] == ["wamid.1"]
+    assert parsed.statuses == []
+
+
+@pytest.mark.parametrize("entry", [
+    [1],
+    [{"changes": "messages"}],
+    [{"changes": [{"value": ["messages"]}]}],
+    [{"changes": [{"value": {"messages": ["wamid.1", None], "contacts": [7], "statuses": "sent"}}]}],
+    [{"changes": [{"value": {"messages": [{"from": "1", "type": "text", "text": "Hola"}]}}]}],
+    [{"changes": [{"value": {"messages": [{"from": "1", "id": ["wamid.1"], "type": "text", "text": {"body": 1}}]}}]}],
+])
+def test_wrongly_shaped_bodies_are_skipped(entry):
+    body = json.dumps({"object": "whatsapp_business_account", "entry": entry}).encode()
+    parsed = parse_webhook(body)
+    assert parsed.statuses == []
+    assert all(m.text is None and m.message_id is None for m in parsed.messages)
+
+
+def test_well_formed_parts_of_a_mixed_body_are_kept():
+    value = dict(TEXT_VALUE, messages=["garbage", *TEXT_VALUE["messages"]], statuses=[3, *STATUS_VALUE["statuses"]])
+    parsed = parse_webhook(_body(value))
+    assert [m.message_id for m in parsed.messages] == ["wamid.1"]
+    assert [s.message_id for s in parsed.statuses] == ["wamid.2"]
+
+
+def test_other_objects_are_ignored():
+    assert parse_webhook(b'{"object": "page", "entry": []}') == ([], [])
+
+
+def test_invalid_json_raises():
+    with pytest.raises(WebhookParseError):
+        parse_webhook(b'{"messages": [')